@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A benchmark of the iterparse_* extractors, each run in a process of its own over synthetic (or
+# real) collections, reporting records/s, MB/s and peak RSS, and with --fields the cost of each field:
+#     python benchmark.py --collections 2 --records 20000 --baseline baseline.json
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import sys
+import tempfile
+import time
+from lxml import etree
+from pathlib import Path
+
+from record_iter import bagTagName, iterRecords, peakRSS
+from event_extract import eventPlans, iterEvents
+from field_plan import FieldPlan, isPlanned, planDictionaries
+from xml_sources import openSource
+from synth_st96 import writeCollections
+from iterparse_all import extractors, eventExtractors
+
+class RowCounter:
+    '''a stand-in for csv.writer that counts the rows written and keeps none of them'''
+    def __init__(self):
+        self.rows = 0
+
+    def writerow(self, row):
+        self.rows += 1
+
+class FieldTimer:
+    '''the entry for one field in a compiled dictionary, timed: looks up the field's results in
+    the shared plan as usual, and separately times the evaluation of its expression on its own
+    '''
+    def __init__(self, entry):
+        self.entry = entry
+        self.single = FieldPlan([entry.path], entry.plan.namespaces)
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, elem):
+        startTime = time.perf_counter()
+        self.single.evaluate(elem)
+        self.seconds += time.perf_counter() - startTime
+        self.calls += 1
+        return self.entry(elem)
+
+class PlanTimer:
+    '''a stand-in for the evaluate method of a shared plan that times its evaluations'''
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+        self.seconds = 0.0
+
+    def __call__(self, context):
+        startTime = time.perf_counter()
+        results = self.evaluate(context)
+        self.seconds += time.perf_counter() - startTime
+        return results
+
+def timeFields(module):
+    '''swap the entries of each compiled dictionary of an extractor module for timed ones, in place
+    (so that every reference to the dictionary sees the swap); returns the timers by dictionary
+    '''
+    timers = {}
+    for name, fields in planDictionaries(module).items():
+        plan = None
+        fieldTimers = {}
+        for field, entry in fields.items():
+            if isPlanned(entry):
+                plan = entry.plan
+                fields[field] = fieldTimers[field] = FieldTimer(entry)
+        plan.evaluate = PlanTimer(plan.evaluate)
+        timers[name] = (plan, fieldTimers)
+    return timers
+
+def runTable(table, sourceList, backend = 'tree', fields = False):
+    '''parse the collections and run one extractor over them with one backend ('tree' or 'events');
+    returns the records and rows, the seconds spent parsing and extracting, the peak RSS in MB and,
+    if fields, the per-field costs ({dictionary: {'plan': seconds, 'fields': {field: [calls, seconds]}}}).
+    Run in a fresh process for a clean RSS reading.
+    '''
+    module = extractors[table]
+    timers = timeFields(module) if fields and backend == 'tree' else {}
+    writeobject = RowCounter()
+    records = 0
+    startTime = time.perf_counter()
+    for filename in sourceList:
+        with openSource(filename) as infile:
+            if backend == 'tree':
+                for elem in iterRecords(etree.iterparse(infile, events=('end',), tag = bagTagName)):
+                    module.extract(elem, writeobject)
+                    records += 1
+            else:
+                extractor = eventExtractors[table]
+                for record in iterEvents(infile, eventPlans(extractor.eventNeeds)):
+                    extractor.extract(record, writeobject)
+                    records += 1
+    seconds = time.perf_counter() - startTime
+    costs = {
+        name: {'plan': plan.evaluate.seconds, 'fields': {field: [timer.calls, timer.seconds] for field, timer in fieldTimers.items()}}
+        for name, (plan, fieldTimers) in timers.items()
+    }
+    return records, writeobject.rows, seconds, peakRSS(), costs
+
+def benchmark(table, sourceList, backend = 'tree', repeat = 1, fields = False):
+    '''the fastest of repeat runs of runTable, each in a fresh process'''
+    runs = []
+    for run in range(repeat):
+        with ProcessPoolExecutor(max_workers = 1) as pool:
+            runs.append(pool.submit(runTable, table, sourceList, backend, fields).result())
+    return min(runs, key = lambda result: result[2])
+
+def printCosts(costs, records):
+    '''print the per-field costs of one extractor, costliest first within each dictionary'''
+    for name, cost in costs.items():
+        print(f'        {name}: shared plan {cost["plan"]:,.2f} s for {len(cost["fields"])} fields')
+        for field, (calls, seconds) in sorted(cost['fields'].items(), key = lambda item: -item[1][1]):
+            perRecord = seconds / max(records, 1) * 1e6
+            print(f'            {field:<24} {calls:>10,} lookups  {seconds:>8,.3f} s alone  ({perRecord:,.1f} µs/record)')
+
+def regressions(results, baseline, tolerance):
+    '''the tables whose throughput or peak RSS is worse than in the baseline by more than tolerance'''
+    found = []
+    for name, result in results.items():
+        before = baseline.get('tables', {}).get(name)
+        if before is None: continue
+        if result['recordsPerSecond'] < before['recordsPerSecond'] * (1 - tolerance):
+            found.append(f'{name}: {result["recordsPerSecond"]:,.0f} records/s, down from {before["recordsPerSecond"]:,.0f}')
+        if result['peakRSS'] and before.get('peakRSS') and result['peakRSS'] > before['peakRSS'] * (1 + tolerance):
+            found.append(f'{name}: peak RSS {result["peakRSS"]:,.0f} MB, up from {before["peakRSS"]:,.0f} MB')
+    return found
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the iterparse_* extractors on synthetic (or existing) ST96 collections.')
+    parser.add_argument('rootDir', nargs='?', help='folder holding (or to be given) an XML_raw folder of collections (default: a temporary folder of synthetic collections)')
+    parser.add_argument('--collections', type=int, default=1, help='synthetic collections to write (default: 1)')
+    parser.add_argument('--records', type=int, default=10000, help='records per synthetic collection (default: 10000)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the synthetic collections (default: 1)')
+    parser.add_argument('--zips', action='store_true', help='benchmark parsing the ZIP archives of record files instead of the concatenated collections')
+    parser.add_argument('--tables', nargs='+', choices=list(extractors), default=list(extractors), help='extractors to benchmark (default: all)')
+    parser.add_argument('--events', nargs='+', choices=[name for name in eventExtractors if name in extractors], default=[], help='tables to benchmark with the streaming event backend as well')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per extractor; the fastest is reported (default: 1)')
+    parser.add_argument('--fields', action='store_true', help='also report the extraction cost of each field (slower: each field is evaluated twice)')
+    parser.add_argument('--save', help='save the results to this JSON file, as a baseline for later runs')
+    parser.add_argument('--baseline', help='compare the results with those saved in this JSON file, exiting with status 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='fraction by which throughput may fall, or peak RSS grow, before it counts as a regression (default: 0.10)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        rootDir = Path(args.rootDir or tempDir)
+        sourceDir = rootDir / 'XML_raw'
+        pattern = '*.zip' if args.zips else '*.xml'
+        sourceList = sorted((rootDir if args.zips else sourceDir).glob(pattern))
+        if sourceList:
+            print(f'Using the {len(sourceList)} existing collections in {sourceList[0].parent}')
+        else:
+            startTime = time.perf_counter()
+            writeCollections(rootDir, args.collections, args.records, args.seed, args.zips)
+            sourceList = sorted((rootDir if args.zips else sourceDir).glob(pattern))
+            print(f'Wrote {args.collections} synthetic collections of {args.records:,} records in {time.perf_counter() - startTime:,.1f} s')
+        sourceBytes = sum(filename.stat().st_size for filename in sourceList)
+        print(f'Benchmarking on {sourceBytes / 1e6:,.1f} MB of XML')
+
+        runs = [(table, 'tree') for table in args.tables] + [(table, 'events') for table in args.events]
+        results = {}
+        for table, backend in runs:
+            name = table if backend == 'tree' else f'{table} (events)'
+            records, rows, seconds, peak, costs = benchmark(table, sourceList, backend, args.repeat, args.fields)
+            seconds = max(seconds, 1e-9)
+            results[name] = {
+                'records': records,
+                'rows': rows,
+                'seconds': seconds,
+                'recordsPerSecond': records / seconds,
+                'mbPerSecond': sourceBytes / 1e6 / seconds,
+                'peakRSS': peak,
+                'fields': costs
+            }
+            peakText = 'n/a' if peak is None else f'{peak:,.0f} MB'
+            print(f'{name:>17}: {records:,} records, {rows:,} rows in {seconds:,.2f} s: {records / seconds:,.0f} records/s, {sourceBytes / 1e6 / seconds:,.1f} MB/s, peak RSS {peakText}')
+            if costs: printCosts(costs, records)
+
+    data = {'collections': [filename.name for filename in sourceList], 'bytes': sourceBytes, 'seed': args.seed}
+    if args.save:
+        with open(args.save, 'w', encoding='UTF-8') as outfile:
+            json.dump({'data': data, 'tables': results}, outfile, indent = 1)
+    if args.baseline:
+        with open(args.baseline, encoding='UTF-8') as infile:
+            baseline = json.load(infile)
+        if baseline.get('data') != data:
+            print('Note: the baseline was measured on different collections')
+        found = regressions(results, baseline, args.tolerance)
+        for regression in found:
+            print(f'REGRESSION {regression}')
+        if found: sys.exit(1)
+        print(f'No regressions against {args.baseline} (tolerance {args.tolerance:.0%})')
+
+if __name__ == "__main__": main()
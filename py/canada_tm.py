@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A single command-line entry point for building the Canada Trademarks Dataset, which never prompts:
+#     python canada_tm.py parse /data/XML_raw --update --workers 8
+# Each subcommand (download, concat, parse, pipeline, export) takes the options of the script it
+# runs, also read from a config file section named for it (--config) or CA_TM_ variables.
+
+import argparse
+import importlib
+import os
+import sys
+
+envPrefix = 'CA_TM_'
+
+# the subcommands, mapped to their descriptions and the module, parser and main functions that run them
+
+commands = {
+    'download': ('download and extract the bulk data archives from CIPO\'s SFTP server', 'sftp_secure', 'argumentParser', 'main'),
+    'concat':   ('concatenate the extracted record files into one XML collection per archive', 'sftp_secure', 'concatParser', 'concatMain'),
+    'pipeline': ('download, extract and parse the archives in one pipelined run', 'pipeline', 'argumentParser', 'main'),
+    'parse':    ('parse the XML collections (or ZIP archives) into the data files', 'iterparse_all', 'argumentParser', 'main'),
+    'export':   ('export the data files from the record store, as .csv or .dta files', 'record_store', 'argumentParser', 'main'),
+    'dta':      ('write Stata .dta versions of the data files in a csv folder', 'dta_out', 'argumentParser', 'main'),
+    'columnar': ('write Parquet or Arrow versions of the data files in a csv folder', 'columnar_out', 'argumentParser', 'main')
+}
+
+trueWords = {'1', 'yes', 'true', 'on'}
+falseWords = {'0', 'no', 'false', 'off'}
+
+def ask(value, prompt, name = None, secret = False):
+    '''value, if it is given; otherwise the environment variable CA_TM_<NAME>, if it is set; otherwise
+    the answer to prompt, if there is a terminal to ask at (the run is ended if there is none)
+    '''
+    if value: return value
+    if name and os.environ.get(envPrefix + name.upper()): return os.environ[envPrefix + name.upper()]
+    if not sys.stdin.isatty():
+        raise SystemExit(f'{prompt.strip().rstrip(":")}: not given (as an argument, in a config file or in {envPrefix}{(name or "").upper()}), and there is no terminal to ask at.')
+    if secret:
+        import getpass
+        return getpass.getpass(prompt)
+    return input(prompt)
+
+def optionValue(action, value, source):
+    '''the value of an option given as text in a config file or environment variable, as parsed by its action'''
+    text = value.strip()
+    if action.nargs == 0 or (action.nargs == '?' and action.const is not None and text.lower() in trueWords | falseWords):
+        if text.lower() not in trueWords | falseWords:
+            raise SystemExit(f'{source}: {action.dest} must be yes or no, not {value!r}')
+        return action.const if text.lower() in trueWords else action.default
+    convert = action.type or str
+    try:
+        if action.nargs in ('+', '*'):
+            values = [convert(item) for item in text.split()]
+        else:
+            values = [convert(text)]
+    except ValueError:
+        raise SystemExit(f'{source}: {action.dest} cannot be {value!r}') from None
+    if action.choices is not None:
+        for item in values:
+            if item not in action.choices:
+                raise SystemExit(f'{source}: {action.dest} must be one of {", ".join(map(str, action.choices))}, not {item!r}')
+    return values if action.nargs in ('+', '*') else values[0]
+
+def configDefaults(parser, command, configPath):
+    '''the defaults for a subcommand's options from the config file (if any) and the environment'''
+    actions = {action.dest.lower(): action for action in parser._actions if action.dest != 'help'}
+    defaults = {}
+    if configPath:
+        import configparser
+        config = configparser.ConfigParser(interpolation = None)
+        if not config.read(configPath, encoding='UTF-8'):
+            raise SystemExit(f'Config file {configPath} not found')
+        section = config[command] if config.has_section(command) else config.defaults()
+        for key, value in section.items():
+            action = actions.get(key.replace('-', '_').lower())
+            if action is None:
+                if config.has_section(command) and key not in config.defaults():
+                    raise SystemExit(f'{configPath}: [{command}] has no option {key}')
+                continue # a [DEFAULT] option of another subcommand
+            defaults[action.dest] = optionValue(action, value, configPath)
+    for key, action in actions.items():
+        variable = envPrefix + key.upper()
+        if variable in os.environ:
+            defaults[action.dest] = optionValue(action, os.environ[variable], variable)
+    return defaults
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Build the Canada Trademarks Dataset from CIPO\'s bulk data, unattended.',
+        epilog='subcommands:\n' + '\n'.join(f'  {command:<10} {description}' for command, (description, *run) in commands.items())
+            + f'\n\nOptions may also be set in a config file or in {envPrefix}<OPTION> environment variables (see canada_tm.py).',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--config', default=os.environ.get(envPrefix + 'CONFIG'), help=f'config file of options, in sections named for the subcommands (default: the file named by {envPrefix}CONFIG, if set)')
+    parser.add_argument('command', choices=list(commands), help='the subcommand to run (python canada_tm.py <subcommand> --help for its options)')
+    parser.add_argument('options', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    description, moduleName, parserName, mainName = commands[args.command]
+    module = importlib.import_module(moduleName)
+    commandParser = getattr(module, parserName)()
+    commandParser.prog = f'{parser.prog} {args.command}'
+    commandParser.set_defaults(**configDefaults(commandParser, args.command, args.config))
+    getattr(module, mainName)(commandParser.parse_args(args.options))
+
+if __name__ == "__main__": main()
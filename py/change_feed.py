@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# The change feed of iterparse_all.py --update --changes runs: for each table, the rows an update
+# deleted and inserted (or, in tables of one row per application, updated), keyed by AppNo and
+# ExtNo, in a change file in the changes folder, e.g. changes/CA_TM_main_changes.csv.
+
+import csv
+import io
+import json
+
+from csv_out import BatchWriter, CodedWriter, openOutput
+
+changesDir = 'changes'
+changesSummary = 'CA_TM_changes.json'
+changeColumns = ['Change', 'ChangedColumns']
+updatedTables = {'CA_TM_main'} # one row per application, so an old row and a new one are an update
+
+def changePath(parsePath, name):
+    '''the change file of a table, by the name of its data file (e.g. CA_TM_main)'''
+    return parsePath / changesDir / f'{name}_changes.csv'
+
+def csvValues(row):
+    '''a row's values as they are written to (and read back from) a data file'''
+    return ['' if value is None else str(value) for value in row]
+
+def recordChanges(headerRow, before, after, update = False):
+    '''the change rows of one application in a table, from its rows before and after an update:
+    the rows it lost are deleted, then those it gained inserted; with update, a lost row and a
+    gained one are an update instead
+    '''
+    after = list(after)
+    removed = []
+    for row in before:
+        if row in after: after.remove(row)
+        else: removed.append(row)
+    if update and len(removed) == 1 and len(after) == 1:
+        old, new = removed[0], after[0]
+        yield ['update', ' '.join(column for column, was, now in zip(headerRow, old, new) if was != now)] + new
+        return
+    for old in removed:
+        yield ['delete', ''] + old
+    for new in after:
+        yield ['insert', ''] + new
+
+class ChangeFeed:
+    '''the rows of the applications replaced by an update, before and after, by table;
+    tables maps each table (the name of its data file, e.g. CA_TM_main) to its label row
+    '''
+    def __init__(self, tables):
+        self.tables = tables
+        self.before = {name: {} for name in tables}
+        self.after = {name: {} for name in tables}
+        self.replaced = set()
+
+    def removed(self, name, row):
+        '''a row of the table before the update, since removed from it'''
+        row = csvValues(row)
+        self.before[name].setdefault(tuple(row[:2]), []).append(row)
+
+    def added(self, name, row):
+        '''a row added to the table by the update'''
+        row = csvValues(row)
+        self.after[name].setdefault(tuple(row[:2]), []).append(row)
+
+    def replace(self, key, stored):
+        '''an application parsed again, in the record store: its rows before the update are given by
+        stored(), a mapping of each table to its rows, the first time it is replaced; the rows added
+        by an earlier version of it in the same update are superseded
+        '''
+        if key not in self.replaced:
+            self.replaced.add(key)
+            for name, rows in stored().items():
+                for row in rows: self.removed(name, row)
+        for after in self.after.values():
+            after.pop(key, None)
+
+    def write(self, parsePath, collections, tableCodes = None, vocabulary = None):
+        '''write the change file of each table, and the summary of the changes, replacing those of the
+        last update; collections are the names of the collections parsed. In dictionary-encoded runs
+        whose rows were compared as values, the columns of each table in tableCodes are written as
+        codes from vocabulary. Returns the number of inserts, updates and deletes, by table
+        '''
+        parsePath.joinpath(changesDir).mkdir(exist_ok=True)
+        counts = {}
+        for name, headerRow in self.tables.items():
+            tally = counts[name] = {'insert': 0, 'update': 0, 'delete': 0}
+            before, after = self.before[name], self.after[name]
+            with openOutput(changePath(parsePath, name), 'w') as outfile:
+                fileWriter = BatchWriter(outfile, headerRow = changeColumns + headerRow)
+                columns = (tableCodes or {}).get(f'{name}.csv')
+                writer = CodedWriter(fileWriter, changeColumns + headerRow, columns, vocabulary) if columns and vocabulary is not None else fileWriter
+                for key in dict.fromkeys(list(before) + list(after)):
+                    for change in recordChanges(headerRow, before.get(key, []), after.get(key, []), name in updatedTables):
+                        tally[change[0]] += 1
+                        writer.writerow(change)
+                fileWriter.writeBatch()
+        summaryPath = parsePath / changesDir / changesSummary
+        with summaryPath.open('w', encoding='UTF-8') as outfile:
+            json.dump({'collections': list(collections), 'changes': counts}, outfile, indent=1)
+        return counts
+
+def printChanges(parsePath, counts):
+    '''tell what a change feed holds'''
+    for name, tally in counts.items():
+        print(f'    {name}: {tally["insert"]:,} inserted, {tally["update"]:,} updated and {tally["delete"]:,} deleted rows')
+    print(f'The changes to each data file are available in folder {parsePath.joinpath(changesDir).absolute()}')
+
+def readRange(outPath, start, end):
+    '''the rows of a data file in the byte range [start, end)'''
+    with outPath.open('rb') as infile:
+        infile.seek(start)
+        data = infile.read(end - start)
+    return csv.reader(io.StringIO(data.decode('UTF-8'), newline = ''), delimiter = '\t')
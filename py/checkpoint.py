@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# Checkpoints of the full runs of iterparse_all.py, in CA_TM_checkpoint.json: the synced length of
+# each data file after each collection or chunk (or the shards and merges done, in parallel runs),
+# from which --resume carries on without losing or repeating a row.
+
+import json
+import os
+
+checkpointFile = 'CA_TM_checkpoint.json'
+
+def syncPath(path):
+    '''flush a closed file's data to disk'''
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+def truncateFile(path, length):
+    '''cut a data file back to length bytes, dropping anything written after a checkpoint'''
+    with path.open('r+b') as outfile:
+        outfile.truncate(length)
+
+def unitKey(filename, chunk):
+    '''the name of a collection, or of one chunk of it, in the checkpoint'''
+    return filename.name if chunk is None else f'{filename.name}:{chunk[0]}'
+
+def runSettings(sourceList, **options):
+    '''the options of a run and the size and modification time of each of its collections,
+    which a resumed run must share with the checkpoint it resumes
+    '''
+    sources = {}
+    for filename in sourceList:
+        stat = filename.stat()
+        sources[filename.name] = [stat.st_size, stat.st_mtime_ns]
+    return json.loads(json.dumps(dict(options, sources = sources))) # as read back from the checkpoint
+
+class Checkpoint:
+    '''the progress of a full run, saved to the csv folder parsePath as it is committed'''
+    def __init__(self, parsePath, settings):
+        self.path = parsePath / checkpointFile
+        self.state = {
+            'settings': settings,
+            'lengths': {},     # data file -> bytes committed to it (single-process runs)
+            'collections': {}, # collection -> {'records', 'chunks' done, 'starts' of its rows, manifest 'entry' once done}
+            'shards': {},      # collection or chunk -> {'records', 'rows'} once its shards are complete (parallel runs)
+            'merged': {},      # data file -> {collection: byte range} once its shards are merged (parallel runs)
+            'codes': None      # the vocabulary of a dictionary-encoded run, as of the checkpoint
+        }
+        self.resumed = False
+
+    @classmethod
+    def start(cls, parsePath, settings, resume = False):
+        '''the checkpoint of an interrupted run with these settings, if resume and there is one;
+        otherwise a new checkpoint, saved at once in place of any earlier one
+        '''
+        checkpoint = cls(parsePath, settings)
+        if not checkpoint.path.exists():
+            if resume: print('No checkpoint of an interrupted run was found. Starting over...')
+            checkpoint.save()
+            return checkpoint
+        if not resume:
+            print(f'The checkpoint of an interrupted run ({checkpointFile}) is replaced by this run; use --resume to carry on from it instead.')
+            checkpoint.save()
+            return checkpoint
+        with checkpoint.path.open('r', encoding='UTF-8') as infile:
+            state = json.load(infile)
+        if state.get('settings') != settings:
+            print('The checkpoint was taken by a run with other options, or over other or changed collections. Starting over...')
+            checkpoint.save()
+            return checkpoint
+        checkpoint.state = state
+        checkpoint.resumed = True
+        done = sum(entry['records'] for entry in state['collections'].values()) + sum(entry['records'] for entry in state['shards'].values())
+        print(f'Resuming the interrupted run from its checkpoint, after {done:,} records...')
+        return checkpoint
+
+    def save(self):
+        tempPath = self.path.with_suffix('.tmp')
+        with tempPath.open('w', encoding='UTF-8') as outfile:
+            json.dump(self.state, outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        tempPath.replace(self.path)
+
+    def remove(self):
+        '''remove the checkpoint of a completed run'''
+        self.path.unlink(missing_ok=True)
+
+    def restore(self, vocabulary):
+        '''set the codes of a resumed dictionary-encoded run to those of the checkpoint, in place
+        (before any CodedWriter takes the vocabulary's columns)
+        '''
+        if self.resumed and vocabulary is not None and self.state['codes'] is not None:
+            vocabulary.codes.clear()
+            vocabulary.codes.update(self.state['codes'])
+
+    def snapshot(self, vocabulary):
+        if vocabulary is not None: self.state['codes'] = vocabulary.codes
+
+    # single-process runs
+
+    def lengths(self):
+        return self.state['lengths']
+
+    def begin(self, lengths):
+        '''record the lengths of the data files at the start of a run, holding their label rows'''
+        self.state['lengths'] = lengths
+        self.save()
+
+    def collection(self, filename):
+        '''the progress of a collection: its records so far, the chunks done, the starts of its rows
+        in the data files and, once it is done, its manifest entry
+        '''
+        return self.state['collections'].setdefault(filename.name, {'records': 0, 'chunks': [], 'starts': None, 'entry': None})
+
+    def chunkDone(self, filename, chunk):
+        return unitKey(filename, chunk) in self.collection(filename)['chunks']
+
+    def commit(self, filename, chunk, records, lengths, vocabulary = None):
+        '''record a chunk (or whole collection) parsed, with the lengths of the data files once its
+        rows have been synced to disk
+        '''
+        progress = self.collection(filename)
+        progress['records'] += records
+        progress['chunks'].append(unitKey(filename, chunk))
+        self.state['lengths'] = lengths
+        self.snapshot(vocabulary)
+        self.save()
+
+    def finish(self, filename, entry):
+        '''record a collection done, with its manifest entry'''
+        self.collection(filename)['entry'] = entry
+        self.save()
+
+    # parallel runs
+
+    def shard(self, filename, chunk):
+        '''the records and rows of a collection or chunk whose shards are complete, or None'''
+        return self.state['shards'].get(unitKey(filename, chunk))
+
+    def shardDone(self, filename, chunk, records, rows, shardPaths):
+        '''record a collection or chunk whose shards are complete, once they are synced to disk'''
+        for path in shardPaths: syncPath(path)
+        self.state['shards'][unitKey(filename, chunk)] = {'records': records, 'rows': rows}
+        self.save()
+
+    def merged(self, outFile):
+        '''the byte range of each collection's rows in a data file whose shards are merged, or None'''
+        return self.state['merged'].get(outFile)
+
+    def mergeDone(self, outFile, outPath, ranges, vocabulary = None):
+        '''record a data file whose shards are merged, once it is synced to disk'''
+        syncPath(outPath)
+        self.state['merged'][outFile] = ranges
+        self.snapshot(vocabulary)
+        self.save()
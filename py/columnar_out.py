@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# Typed, zstd-compressed Parquet or Arrow IPC versions of the data files, typed as listed in
+# st96_fields.tableTypes. Requires pyarrow. Used by iterparse_all.py --columnar, or run as a script:
+#     python columnar_out.py path/to/csv --format parquet
+
+import argparse
+import csv
+import sys
+from datetime import date
+from pathlib import Path
+
+from canada_tm import ask
+from csv_out import codesFile, dataName, findData, openData
+from st96_fields import tableCodes, tableTypes
+
+columnarFormats = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# the value converter for each column type
+
+converters = {
+    'int8':     int,
+    'int16':    int,
+    'int32':    int,
+    'date32':   lambda value: date.fromisoformat(value[:10]),
+    'string':   str
+}
+
+def columnarPath(outDir, outFile, format):
+    '''the columnar version of a data file, e.g. CA_TM_main.parquet'''
+    return outDir / Path(outFile).with_suffix(columnarFormats[format]).name
+
+class ColumnarWriter:
+    '''a stand-in for csv.writer that writes the rows of a data file as typed columns to a
+    Parquet or Arrow IPC file, in row groups of rowGroupSize rows
+    '''
+    def __init__(self, outPath, headerRow, columnTypes, format = 'parquet', rowGroupSize = 100000):
+        import pyarrow
+        self.pyarrow = pyarrow
+        self.outPath = outPath
+        self.headerRow = headerRow
+        self.types = [columnTypes.get(column, 'string') for column in headerRow]
+        self.converters = [converters[columnType] for columnType in self.types]
+        self.schema = pyarrow.schema([(column, getattr(pyarrow, columnType)()) for column, columnType in zip(headerRow, self.types)])
+        self.rowGroupSize = rowGroupSize
+        self.columns = [[] for column in headerRow]
+        self.rows = 0
+        if format == 'parquet':
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(outPath, self.schema, compression = 'zstd')
+        else:
+            self.writer = pyarrow.ipc.new_file(outPath, self.schema, options = pyarrow.ipc.IpcWriteOptions(compression = 'zstd'))
+
+    def writerow(self, row):
+        for index, value in enumerate(row):
+            if value is None or value == '': self.columns[index].append(None)
+            else:
+                try:
+                    self.columns[index].append(self.converters[index](value))
+                except ValueError:
+                    raise ValueError(f'{self.outPath.name}: cannot store {value!r} in {self.types[index]} column {self.headerRow[index]}') from None
+        self.rows += 1
+        if self.rows >= self.rowGroupSize: self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        '''write the queued rows as one row group (or record batch)'''
+        if not self.rows: return
+        pyarrow = self.pyarrow
+        batch = pyarrow.record_batch([pyarrow.array(values, type = field.type) for values, field in zip(self.columns, self.schema)], schema = self.schema)
+        self.writer.write_batch(batch)
+        self.columns = [[] for column in self.headerRow]
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def convertCSV(csvPath, outPath, format = 'parquet', rowGroupSize = 100000, codedColumns = ()):
+    '''write the columnar version of a tab-delimited (or compressed) data file, in a single sequential read of it;
+    the codedColumns of a dictionary-encoded data file are typed as integers'''
+    csv.field_size_limit(sys.maxsize) # long goods and services descriptions
+    with openData(csvPath) as infile:
+        rows = csv.reader(infile, delimiter = '\t')
+        headerRow = next(rows)
+        with ColumnarWriter(outPath, headerRow, {**tableTypes.get(dataName(csvPath), {}), **{column: 'int32' for column in codedColumns}}, format, rowGroupSize) as writer:
+            writer.writerows(rows)
+
+def argumentParser():
+    '''the command-line options of columnar_out.py'''
+    parser = argparse.ArgumentParser(description='Write typed Parquet or Arrow versions of the Canada Trademarks Dataset data files.')
+    parser.add_argument('csvDir', nargs='?', help='full path of the csv folder (prompted for if omitted)')
+    parser.add_argument('--format', choices=list(columnarFormats), default='parquet', help='columnar format (default: parquet); files are written to a sibling folder named for the format')
+    parser.add_argument('--row-group', type=int, default=100000, help='rows per row group (default: 100000)')
+    return parser
+
+def main(args = None):
+
+    args = args or argumentParser().parse_args()
+
+    csvDir = Path(ask(args.csvDir, 'Provide full path of csv folder:', 'csvDir'))
+    dataPaths = {outFile: findData(csvDir, outFile) for outFile in tableTypes}
+    dataPaths = {outFile: path for outFile, path in dataPaths.items() if path is not None}
+    if not dataPaths:
+        print(f'No data files were found in folder {csvDir.absolute()}')
+        return
+    outDir = csvDir.parent / args.format
+    outDir.mkdir(exist_ok=True)
+    for outFile, csvPath in dataPaths.items():
+        outPath = columnarPath(outDir, outFile, args.format)
+        codedColumns = tableCodes.get(outFile, []) if csvDir.joinpath(codesFile).exists() else [] # a dictionary-encoded run
+        convertCSV(csvPath, outPath, args.format, args.row_group, codedColumns)
+        print(f'Dataset {outPath.name} is now available in folder {outDir.absolute()}')
+
+if __name__ == "__main__": main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# Buffered, batched output of the tab-delimited data files: BatchWriter hands rows to csv.writer a
+# batch at a time, optionally through a compressing writer thread (gzip or zstd), and CodedWriter
+# writes the categorical columns as codes from a lookup table, CA_TM_codes.csv.
+
+import csv
+import io
+import os
+import queue
+import threading
+import time
+import zlib
+
+outputBuffer = 8 * 1024 * 1024 # bytes buffered before each write to a data file
+compressSuffixes = {'gzip': '.gz', 'zstd': '.zst'}
+codesFile = 'CA_TM_codes.csv' # the lookup table of dictionary-encoded runs
+codesHeader = ['Column', 'Code', 'Value']
+
+def dataPath(parsePath, outFile, compress = None):
+    '''the path of a data file, with the suffix of its compression, e.g. CA_TM_main.csv.gz'''
+    return parsePath / (outFile + compressSuffixes.get(compress, ''))
+
+def findData(parsePath, outFile):
+    '''the path of a data file as it was written, compressed or not, or None if there is none'''
+    for compress in [None, *compressSuffixes]:
+        if dataPath(parsePath, outFile, compress).exists(): return dataPath(parsePath, outFile, compress)
+    return None
+
+def dataName(dataPath):
+    '''the name of the data file at dataPath, without the suffix of any compression'''
+    for suffix in compressSuffixes.values():
+        if dataPath.name.endswith(suffix): return dataPath.name[:-len(suffix)]
+    return dataPath.name
+
+def zstandardModule():
+    '''the zstandard package, which zstd compression requires'''
+    try:
+        import zstandard
+    except ImportError:
+        raise SystemExit('zstd compression requires the zstandard package (pip install zstandard); use --compress gzip instead') from None
+    return zstandard
+
+class CompressingSink(io.RawIOBase):
+    '''a binary file that compresses what is written to it in a writer thread of its own;
+    the writes are queued (up to queueSize blocks), so that the writer blocks only when the
+    compressor falls behind
+    '''
+    def __init__(self, outPath, compress, append = False, queueSize = 16):
+        super().__init__()
+        self.outfile = outPath.open('ab' if append else 'wb')
+        if compress == 'gzip':
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # 31: a gzip member
+        else:
+            self.compressor = zstandardModule().ZstdCompressor(level = 3).compressobj()
+        self.queue = queue.Queue(queueSize)
+        self.error = None
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.error: raise self.error
+        self.queue.put(bytes(data))
+        return len(data)
+
+    def run(self):
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None: break
+                self.outfile.write(self.compressor.compress(data))
+            self.outfile.write(self.compressor.flush())
+        except Exception as error: # raised in the writing thread at its next write, or on closing
+            self.error = error
+            while self.queue.get() is not None: pass
+        finally:
+            self.outfile.close()
+
+    def close(self):
+        if not self.closed:
+            self.queue.put(None)
+            self.thread.join()
+            super().close()
+            if self.error: raise self.error
+
+def openOutput(outPath, mode = 'w', compress = None):
+    '''open a data file (or shard) for writing text, with a large buffer; if compress ('gzip'
+    or 'zstd') is given, through a compressing writer thread, appending a new member if mode is 'a'
+    '''
+    if compress is None:
+        return outPath.open(mode, newline='', encoding='UTF-8', buffering = outputBuffer)
+    sink = CompressingSink(outPath, compress, append = mode == 'a')
+    return io.TextIOWrapper(io.BufferedWriter(sink, outputBuffer), encoding='UTF-8', newline='')
+
+def openData(dataPath):
+    '''open a data file for reading text, decompressing it if its suffix says it is compressed'''
+    if dataPath.suffix == compressSuffixes['gzip']:
+        import gzip
+        return gzip.open(dataPath, 'rt', newline='', encoding='UTF-8')
+    if dataPath.suffix == compressSuffixes['zstd']:
+        reader = zstandardModule().ZstdDecompressor().stream_reader(dataPath.open('rb'), read_across_frames = True)
+        return io.TextIOWrapper(io.BufferedReader(reader, outputBuffer), encoding='UTF-8', newline='')
+    return dataPath.open('r', newline='', encoding='UTF-8')
+
+class BatchWriter:
+    '''a stand-in for csv.writer that queues the rows written to it and writes them to newfile
+    with writerows in batches of batchSize rows; counts the rows written, and times the writes
+    in runReport (see run_report.py), if it is given
+    '''
+    def __init__(self, newfile, batchSize = 10000, headerRow = None, runReport = None):
+        self.newfile = newfile
+        self.runReport = runReport
+        self.writer = csv.writer(newfile, delimiter = '\t')
+        if headerRow: self.writer.writerow(headerRow)
+        self.batchSize = batchSize
+        self.batch = []
+        self.rows = 0
+
+    def writerow(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batchSize: self.writeBatch()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def writeBatch(self):
+        '''write the queued rows (timed as a stage of runReport, if one is given)'''
+        if self.runReport is not None:
+            with self.runReport.stage('write', records = len(self.batch)):
+                self.writer.writerows(self.batch)
+        else:
+            self.writer.writerows(self.batch)
+        self.rows += len(self.batch)
+        self.batch = []
+
+    def tell(self):
+        '''write the queued rows, flush the file and return its byte offset'''
+        self.writeBatch()
+        self.newfile.flush()
+        return self.newfile.buffer.tell()
+
+    def sync(self):
+        '''write the queued rows and flush the file to disk (e.g. for a checkpoint); returns its length'''
+        length = self.tell()
+        os.fsync(self.newfile.fileno())
+        return length
+
+class Vocabulary:
+    '''the integer codes of the values of the dictionary-encoded columns, by column name, numbered
+    from 1 in order of first appearance; kept in a lookup table (codesFile) beside the data files
+    '''
+    def __init__(self):
+        self.codes = {} # column -> {value: code}
+
+    @classmethod
+    def load(cls, codesPath):
+        '''the vocabulary in the lookup table at codesPath, or a new one if there is none'''
+        vocabulary = cls()
+        if codesPath.exists():
+            with openData(codesPath) as infile:
+                rows = csv.reader(infile, delimiter = '\t')
+                next(rows)
+                for column, code, value in rows:
+                    vocabulary.codes.setdefault(column, {})[value] = int(code)
+        return vocabulary
+
+    def save(self, codesPath):
+        '''write the lookup table: one row for each column, code and value'''
+        with codesPath.open('w', newline='', encoding='UTF-8') as newfile:
+            fileWriter = csv.writer(newfile, delimiter = '\t')
+            fileWriter.writerow(codesHeader)
+            for column, codes in self.codes.items():
+                fileWriter.writerows([column, code, value] for value, code in codes.items())
+
+    def labels(self, column):
+        '''the values of a column, by code'''
+        return {code: value for value, code in self.codes.get(column, {}).items()}
+
+class CodedWriter:
+    '''a stand-in for csv.writer that replaces the values of the coded columns of each row
+    (blanks excepted) with their codes in vocabulary, adding new values to it, before
+    passing the row on to writer
+    '''
+    def __init__(self, writer, headerRow, columns, vocabulary):
+        self.writer = writer
+        self.positions = [(index, vocabulary.codes.setdefault(column, {})) for index, column in enumerate(headerRow) if column in columns]
+
+    def writerow(self, row):
+        row = list(row)
+        for index, codes in self.positions:
+            value = row[index]
+            if value:
+                code = codes.get(value)
+                if code is None: code = codes[value] = len(codes) + 1
+                row[index] = code
+        self.writer.writerow(row)
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+class OutputReport:
+    '''the output throughput of a run: the rows written to each data file, their size on disk,
+    and the rate at which they were written since the report was started
+    '''
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.rows = {}
+
+    def add(self, outFile, rows):
+        self.rows[outFile] = self.rows.get(outFile, 0) + rows
+
+    def print(self, paths):
+        '''print the report for the data files at paths (by file name)'''
+        seconds = max(time.perf_counter() - self.startTime, 1e-9)
+        sizes = {outFile: path.stat().st_size for outFile, path in paths.items() if path.exists()}
+        for outFile, path in paths.items():
+            rows = f'{self.rows[outFile]:,} rows, ' if outFile in self.rows else ''
+            print(f'    {path.name}: {rows}{sizes.get(outFile, 0) / 1e6:,.1f} MB')
+        totalRows = sum(self.rows.values())
+        totalBytes = sum(sizes.values())
+        print(f'Output: {totalRows:,} rows ({totalBytes / 1e6:,.1f} MB) in {seconds:,.1f} s: {totalRows / seconds:,.0f} rows/s, {totalBytes / 1e6 / seconds:,.1f} MB/s')
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# Stata .dta (format 118) versions of the data files, with the types, value labels and storage
+# types that do/CA_TM_csv_cleanup.do would give them, written in two passes over each data file.
+# Used by iterparse_all.py --dta, or run as a script on a csv folder:
+#     python dta_out.py path/to/csv
+
+import argparse
+import csv
+import re
+import shutil
+import struct
+import sys
+import tempfile
+from datetime import date, datetime
+from pathlib import Path
+
+from canada_tm import ask
+from csv_out import Vocabulary, codesFile, findData, openData
+from st96_fields import tableCodes
+
+# value labels defined by the cleanup do-file
+
+valueLabels = {
+    'legislabel': {
+        1: 'Trade-marks Act (TMA)',
+        2: 'Unfair Competition Act (UCA)',
+        3: 'Trade Mark and Design Act (TMDA)',
+        4: 'Newfoundland Trade Marks (prior to joining Confederation) (NFLD)',
+        5: 'Act pertaining to Trade Marks (pre Confederation) (ATM)',
+        6: 'an Act to Incorporate the Canadian General Council of Boy Scouts',
+        7: 'an Act to Incorporate the Canadian General Council of Girl Guides',
+        8: "Plant Breeder's Rights Act (PBRA)",
+        9: 'an Act respecting The Royal Canadian Legion'
+    },
+    'markclasslabel': {
+        1: 'Trade-Mark',
+        2: 'Prohibited Mark; Official Mark',
+        3: 'Prohibited Mark; Arms, Crest or Flag',
+        4: 'Certification Mark',
+        5: 'Distinguishing Guise',
+        6: 'Prohibited Mark; Flag',
+        7: 'General Mark',
+        8: 'Prohibited Mark; Sign or Hallmark',
+        9: 'Prohibited Mark; Armorial Bearings',
+        10: 'Prohibited Mark; Abbreviation of the Name',
+        11: 'Prohibited Mark; Name',
+        12: 'Specific Mark',
+        13: 'Standardization Mark',
+        14: 'Union Label',
+        15: 'Denomination',
+        16: 'Geographical Indication',
+        17: 'Mark Protected by Federal Act of Incorporation',
+        18: 'Mark Protected by an Act Respecting the Royal Canadian Legion',
+        19: 'Prohibited Mark; Emblem',
+        20: 'Prohibited Mark; Arms, Crest or Emblem',
+        21: 'Prohibited Mark; Badge, Crest, Emblem or Mark'
+    },
+    'Section9label': {
+        1: 'Paragraph 9(1)(e) - Government Flags',
+        2: 'Subparagraph 9(1)(n)(i) - Her Majesties Forces',
+        3: 'Subparagraph 9(1)(n)(ii) - Universities',
+        4: 'Subparagraph 9(1)(n)(iii) - Public Authorities in Canada for specific goods and services',
+        5: 'Paragraph 9(1)(n.1) - Armorial Emblems',
+        6: 'Paragraph 9(1)(i) - Foreign Government Flags and Symbols and 6ter applications',
+        7: 'Paragraph 9(1)(i.1) - 6ter - Official Sign or Hallmark',
+        8: 'Paragraph 9(1)(i.3) - 6ter - Armorial Bearing/Emblem or Abbreviation of Name',
+        9: 'Paragraph 9(1)(i.2) - 6ter - National Flag of a Country of the Union'
+    },
+    'GIlabel': {
+        1: 'Wine',
+        2: 'Spirit',
+        3: 'Agricultural Product or Food'
+    },
+    'ClaimCodelabel': {
+        101: 'Date of Making Known in Canada',
+        102: 'Made Known in Canada since',
+        103: 'Made Known in Canada since at least as early as',
+        104: 'Made Known in Canada since as early as',
+        105: 'Made Known in Canada since at least',
+        106: 'entire text',
+        107: 'Made Known in Canada since before',
+        111: 'Used in Canada since',
+        112: 'Used in Canada since at least as early as',
+        113: 'Used in Canada since at least',
+        114: 'Used in Canada since as early as',
+        115: 'Date of first use in Canada',
+        116: 'entire text',
+        117: 'Used in Canada since before',
+        171: 'Registrability Recognized under Section 14 of the Trade-marks Act',
+        172: 'Registrability Recognized under Section 12(2) of the Trade-marks Act',
+        173: 'Registration is subject to the provisions of Section 67(1) of the Trade-marks Act, in view of Newfoundland Registration No.',
+        174: 'Entire text',
+        175: 'Registrability Recognized under Rule 10 of the Trade Mark and Design Act',
+        176: 'Registrability Recognized under Section 28(1)(d) of the Unfair Competition Act',
+        177: 'Benefit of Section 14 of the Trade-marks Act is claimed'
+    },
+    'ClaimTypeLabel': {
+        10: 'Made Known in Canada',
+        11: 'Used in Canada',
+        12: 'Priority Filing',
+        13: 'Foreign Use',
+        14: 'Foreign Registration',
+        15: 'Proposed Use in Canada',
+        16: 'Declaration of Use',
+        17: 'Registrability Recognized',
+        18: 'Foreign Application'
+    }
+}
+
+# the do-file combines the French and English labels of the provinces (except Québec) by recoding
+# the encoded values, which depend on the values present; here the names are combined before encoding
+
+provinceNames = {
+    'Colombie-Britannique':         'British Columbia',
+    'Nouveau-Brunswick':            'New Brunswick',
+    'Nouvelle-Écosse':              'Nova Scotia',
+    'Terre-Neuve-et-Labrador':      'Newfoundland and Labrador',
+    'Île-du-Prince-Édouard':        'Prince Edward Island',
+    'Territoires du Nord-Ouest':    'Northwest Territories'
+}
+
+# the treatment of each data file by the do-file: variables kept as strings (stringcols), date strings
+# converted to %td dates, categorical strings encoded, coded variables labeled (and renamed, with their
+# descriptions dropped) and long strings recast as strL; all other variables are typed as import delimited
+# would type them (numeric if every value is a number)
+
+keyStrings = ['AppNo', 'ExtNo']
+
+tableRecipes = {
+    'CA_TM_main.csv': {
+        'strings':  keyStrings + ['RegNo', 'MadridNo'],
+        'dates':    ['StatusDate', 'AppDate', 'PubDate', 'AllowDate', 'AbanDate', 'RegDate', 'RenewedDate', 'TermDate'],
+        'encode':   ['CurrStatus', 'MarkType', 'AppLanguage'],
+        'labels':   {'LegisCode': ('legislabel', 'Legis'), 'MarkClassCode': ('markclasslabel', 'MarkClass'), 'Section9Code': ('Section9label', 'Section9'), 'GICode': ('GIlabel', 'GI')},
+        'drop':     ['LegisDesc', 'MarkClassDesc', 'Section9Desc', 'GIDesc'],
+        'strL':     ['TMText', 'OwnerName']
+    },
+    'CA_TM_goods.csv':      {'strings': keyStrings},
+    'CA_TM_classes.csv':    {'strings': keyStrings},
+    'CA_TM_vienna.csv':     {'strings': keyStrings},
+    'CA_TM_parties.csv': {
+        'strings':  keyStrings,
+        'encode':   ['PartyType', 'ProceedingType', 'Province'],
+        'recode':   {'Province': provinceNames}
+    },
+    'CA_TM_allevents.csv': {
+        'strings':  keyStrings,
+        'dates':    ['FilingDate', 'EventDate'],
+        'encode':   ['EventType', 'StageDesc', 'EventDesc']
+    },
+    'CA_TM_priority.csv': {
+        'strings':  keyStrings,
+        'dates':    ['PriorityDate']
+    },
+    'CA_TM_claims.csv': {
+        'strings':  keyStrings,
+        'claimDates': ['Year', 'Month', 'Date'],
+        'labels':   {'ClaimTypeCode': ('ClaimTypeLabel', 'ClaimType'), 'ClaimCode': ('ClaimCodelabel', 'ClaimCode')},
+        'drop':     ['ClaimTypeDesc'],
+        'strL':     ['ClaimedGoods']
+    }
+}
+
+# Stata storage types (format 118): type code, struct format, missing value, range of integers it holds
+
+storageTypes = {
+    'byte':     (65530, 'b', 101, -127, 100),
+    'int':      (65529, 'h', 32741, -32767, 32740),
+    'long':     (65528, 'l', 2147483621, -2147483647, 2147483620),
+    'double':   (65526, 'd', 2.0 ** 1023, None, None)
+}
+strLType = 32768
+maxStrWidth = 2045
+
+dateFormats = {'td': '%tdDD_Mon_CCYY', 'tm': '%tmMon_CCYY', 'ty': '%tyCCYY'}
+numberPattern = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+statsEpoch = date(1960, 1, 1)
+
+def dtaPath(outDir, outFile):
+    '''the Stata version of a data file, e.g. CA_TM_main.dta'''
+    return outDir / Path(outFile).with_suffix('.dta').name
+
+def number(value):
+    '''a numeric field as Stata would import it; None where it is blank or not a number'''
+    if not numberPattern.match(value): return None
+    result = float(value)
+    return int(result) if result.is_integer() and abs(result) < 2 ** 53 else result
+
+def tdDate(value):
+    '''a YYYY-MM-DD date string as a Stata %td date (days since 1 Jan 1960), as date(value, "YMD")'''
+    try:
+        return (date.fromisoformat(value[:10]) - statsEpoch).days
+    except ValueError:
+        return None
+
+def claimDates(year, month, day):
+    '''the partial claim dates as the do-file builds them: a %ty year, a %tm month and a %td date'''
+    year, month, day = (int(value) if value.isdigit() else None for value in (year, month, day))
+    yearValue = year
+    monthValue = (year - 1960) * 12 + month - 1 if year is not None and month is not None and 1 <= month <= 12 else None
+    try:
+        dateValue = (date(year, month, day) - statsEpoch).days if None not in (year, month, day) else None
+    except ValueError:
+        dateValue = None
+    return yearValue, monthValue, dateValue
+
+class Variable:
+    '''one variable of a .dta file: how its value is taken from a row of the data file,
+    and the statistics of those values that decide its storage type
+    '''
+    def __init__(self, name, value, kind, format = None, labelName = None):
+        self.name = name
+        self.value = value          # row (a dict of field values) -> value
+        self.kind = kind            # 'string', 'strL', 'numeric', or 'auto' (numeric if every value is a number)
+        self.format = format
+        self.labelName = labelName
+        self.codes = None           # for an encoded variable, its values and their codes
+        self.numeric = kind in ('numeric', 'auto')
+        self.integers = True
+        self.low = self.high = None
+        self.width = 1
+
+    def observe(self, value):
+        '''account for one value in the first pass'''
+        if self.kind != 'numeric':
+            width = len(value.encode('UTF-8'))
+            if width > self.width: self.width = width
+            if not self.numeric or value == '': return
+            value = number(value)
+            if value is None:
+                self.numeric = False
+                return
+        if value is None: return
+        if not isinstance(value, int): self.integers = False
+        if self.low is None or value < self.low: self.low = value
+        if self.high is None or value > self.high: self.high = value
+
+    def storage(self):
+        '''the Stata storage type (or str width) of the variable, once every value is observed'''
+        if self.kind == 'strL' or (not self.numeric and self.width > maxStrWidth): return 'strL'
+        if not self.numeric: return self.width
+        if not self.integers: return 'double'
+        for name in ['byte', 'int', 'long']:
+            typeCode, code, missing, low, high = storageTypes[name]
+            if self.low is None or (low <= self.low and self.high <= high): return name
+        return 'double'
+
+def tableVariables(outFile, headerRow, encodings, codeLabels = {}):
+    '''the variables of a data file's .dta version, in order, applying its recipe to the label row;
+    encodings maps each encoded variable to its dictionary of codes, filled in the first pass;
+    the columns in codeLabels are already written as codes, labeled with their values
+    '''
+    recipe = tableRecipes.get(outFile, {'strings': keyStrings})
+    variables = []
+    for column in headerRow:
+        field = lambda row, column = column: row[column]
+        if column in recipe.get('drop', []): continue
+        if column in codeLabels:
+            variables.append(Variable(column, lambda row, column = column: number(row[column]), 'numeric', None, f'{column}_code'))
+        elif column in recipe.get('strings', []):
+            variables.append(Variable(column, field, 'string'))
+        elif column in recipe.get('strL', []):
+            variables.append(Variable(column, field, 'strL'))
+        elif column in recipe.get('dates', []):
+            variables.append(Variable(column, lambda row, column = column: tdDate(row[column]), 'numeric', dateFormats['td']))
+        elif column in recipe.get('encode', []):
+            recode = recipe.get('recode', {}).get(column, {})
+            codes = encodings.setdefault(column, {})
+            variable = Variable(column, lambda row, column = column, codes = codes, recode = recode: codes.get(recode.get(row[column], row[column])), 'numeric', None, f'{column}_code')
+            variable.codes = codes
+            variables.append(variable)
+        elif column in recipe.get('labels', {}):
+            labelName, name = recipe['labels'][column]
+            if outFile == 'CA_TM_claims.csv' and column == 'ClaimCode':
+                # the compound code: the claim type code followed by the claim code, e.g. 11 and 7 give 117
+                value = lambda row: int(str(number(row['ClaimTypeCode'])) + str(number(row['ClaimCode']))) if isinstance(number(row['ClaimTypeCode']), int) and isinstance(number(row['ClaimCode']), int) else None
+            else:
+                value = lambda row, column = column: number(row[column])
+            variables.append(Variable(name, value, 'numeric', None, labelName))
+        elif column in recipe.get('claimDates', []):
+            position = recipe['claimDates'].index(column)
+            value = lambda row, position = position: claimDates(row['Year'], row['Month'], row['Date'])[position]
+            variables.append(Variable(column, value, 'numeric', dateFormats[['ty', 'tm', 'td'][position]]))
+        else:
+            variables.append(Variable(column, field, 'auto'))
+    return variables
+
+class DtaWriter:
+    '''writes a Stata format 118 .dta file with the given variables and number of observations;
+    the rows are packed as they are written, and strL values are spooled to a temporary file
+    until the data are complete
+    '''
+    def __init__(self, outPath, variables, observations, label = ''):
+        self.outPath = outPath
+        self.variables = variables
+        self.outfile = outPath.open('wb')
+        self.strls = tempfile.TemporaryFile()
+        self.observations = observations
+        self.observation = 0
+        self.offsets = [0] * 14
+
+        self.storages = [variable.storage() for variable in variables]
+        codes = []
+        self.packers = []   # per variable: how to pack a value
+        typeCodes = []
+        for variable, storage in zip(variables, self.storages):
+            if storage == 'strL':
+                typeCodes.append(strLType)
+                codes.append('Q')
+                self.packers.append(('strL', None))
+            elif isinstance(storage, int):
+                typeCodes.append(storage)
+                codes.append(f'{storage}s')
+                self.packers.append(('string', None))
+            else:
+                typeCode, code, missing, low, high = storageTypes[storage]
+                typeCodes.append(typeCode)
+                codes.append(code)
+                self.packers.append(('number', missing))
+        self.row = struct.Struct('<' + ''.join(codes))
+
+        def tag(name, content = b''):
+            return f'<{name}>'.encode() + content + f'</{name}>'.encode()
+
+        labelBytes = label.encode('UTF-8')[:320]
+        timestamp = datetime.now().strftime('%d %b %Y %H:%M').encode()
+        self.write(b'<stata_dta>')
+        self.write(tag('header',
+            tag('release', b'118') + tag('byteorder', b'LSF') +
+            tag('K', struct.pack('<H', len(variables))) + tag('N', struct.pack('<Q', observations)) +
+            tag('label', struct.pack('<H', len(labelBytes)) + labelBytes) +
+            tag('timestamp', bytes([len(timestamp)]) + timestamp)
+        ))
+        self.mark(1)
+        self.write(tag('map', b'\x00' * 8 * 14))
+        self.mark(2)
+        self.write(tag('variable_types', b''.join(struct.pack('<H', typeCode) for typeCode in typeCodes)))
+        self.mark(3)
+        self.write(tag('varnames', b''.join(fixed(variable.name, 129) for variable in variables)))
+        self.mark(4)
+        self.write(tag('sortlist', b'\x00' * 2 * (len(variables) + 1)))
+        self.mark(5)
+        self.write(tag('formats', b''.join(fixed(self.format(variable, storage), 57) for variable, storage in zip(variables, self.storages))))
+        self.mark(6)
+        self.write(tag('value_label_names', b''.join(fixed(variable.labelName or '', 129) for variable in variables)))
+        self.mark(7)
+        self.write(tag('variable_labels', b''.join(fixed('', 321) for variable in variables)))
+        self.mark(8)
+        self.write(tag('characteristics'))
+        self.mark(9)
+        self.write(b'<data>')
+
+    def write(self, data):
+        self.outfile.write(data)
+
+    def mark(self, index):
+        '''note the offset of a section, for the map'''
+        self.offsets[index] = self.outfile.tell()
+
+    @staticmethod
+    def format(variable, storage):
+        if variable.format: return variable.format
+        if storage == 'strL': return '%9s'
+        if isinstance(storage, int): return f'%{storage}s'
+        return '%12.0g' if storage == 'long' else '%10.0g' if storage == 'double' else '%8.0g'
+
+    def writerow(self, values):
+        self.observation += 1
+        packed = []
+        for index, (value, (kind, missing)) in enumerate(zip(values, self.packers)):
+            if kind == 'number':
+                packed.append(missing if value is None else value)
+            elif kind == 'string':
+                packed.append(value.encode('UTF-8'))
+            elif value == '':
+                packed.append(0)
+            else:
+                # a strL: its data cell refers to the string, stored as a GSO keyed by (variable, observation)
+                data = value.encode('UTF-8')
+                self.strls.write(b'GSO' + struct.pack('<IQBI', index + 1, self.observation, 130, len(data) + 1) + data + b'\x00')
+                packed.append(index + 1 + (self.observation << 16))
+        self.outfile.write(self.row.pack(*packed))
+
+    def close(self, labels):
+        '''write the strLs and the value labels (a dictionary of label names and their values) and finish the file'''
+        self.write(b'</data>')
+        self.mark(10)
+        self.write(b'<strls>')
+        self.strls.seek(0)
+        shutil.copyfileobj(self.strls, self.outfile, 16 * 1024 * 1024)
+        self.strls.close()
+        self.write(b'</strls>')
+        self.mark(11)
+        self.write(b'<value_labels>')
+        for labelName, values in labels.items():
+            texts = [values[value].encode('UTF-8')[:32000] + b'\x00' for value in sorted(values)]
+            offsets = [sum(len(text) for text in texts[:index]) for index in range(len(texts))]
+            table = struct.pack('<ii', len(texts), sum(len(text) for text in texts))
+            table += struct.pack(f'<{len(texts)}i', *offsets) + struct.pack(f'<{len(texts)}i', *sorted(values)) + b''.join(texts)
+            self.write(b'<lbl>' + struct.pack('<i', len(table)) + fixed(labelName, 129) + b'\x00' * 3 + table + b'</lbl>')
+        self.write(b'</value_labels>')
+        self.mark(12)
+        self.write(b'</stata_dta>')
+        self.mark(13)
+        self.outfile.seek(self.offsets[1] + len(b'<map>'))
+        self.outfile.write(struct.pack('<14Q', *self.offsets))
+        self.outfile.close()
+
+def fixed(text, size):
+    '''a null-padded fixed-width field'''
+    return text.encode('UTF-8')[:size - 1].ljust(size, b'\x00')
+
+def writeDTA(outFile, openRows, outPath, codeLabels = {}):
+    '''write the Stata version of a data file; openRows() returns the file's label row and an
+    iterator over its rows, and is called once for each of the two passes. codeLabels gives the
+    values of the codes of each dictionary-encoded column (see csv_out.py), by column name
+    '''
+    encodings = {}
+    headerRow, rows = openRows()
+    variables = tableVariables(outFile, headerRow, encodings, codeLabels)
+    encoded = [(column, encodings[column], tableRecipes.get(outFile, {}).get('recode', {}).get(column, {})) for column in encodings]
+
+    # first pass: count the observations, find each encoded variable's values and size the other variables
+    observations = 0
+    observed = [variable for variable in variables if variable.codes is None]
+    for fields in rows:
+        row = dict(zip(headerRow, ('' if value is None else str(value) for value in fields)))
+        for column, codes, recode in encoded:
+            if row[column] != '': codes.setdefault(recode.get(row[column], row[column]), None)
+        for variable in observed: variable.observe(variable.value(row))
+        observations += 1
+    for variable in variables:
+        if variable.codes: # encode numbers the values in alphabetical order, from 1
+            for code, value in enumerate(sorted(variable.codes), start = 1): variable.codes[value] = code
+            variable.low, variable.high = 1, len(variable.codes)
+
+    # second pass: write the rows, with each auto-typed variable as a number or a string
+    labels = {name: values for name, values in valueLabels.items() if any(variable.labelName == name for variable in variables)}
+    labels.update({f'{column}_code': {code: value for value, code in codes.items()} for column, codes, recode in encoded})
+    labels.update({f'{column}_code': values for column, values in codeLabels.items() if column in headerRow and any(variable.name == column for variable in variables)})
+    writer = DtaWriter(outPath, variables, observations, Path(outFile).stem)
+    headerRow, rows = openRows()
+    for fields in rows:
+        row = dict(zip(headerRow, ('' if value is None else str(value) for value in fields)))
+        values = []
+        for variable in variables:
+            value = variable.value(row)
+            if variable.kind == 'auto' and variable.numeric: value = None if value == '' else number(value)
+            values.append(value)
+        writer.writerow(values)
+    writer.close(labels)
+
+def csvRows(csvPath):
+    '''a function returning the label row and rows of a tab-delimited (or compressed) data file, for writeDTA'''
+    def openRows():
+        csv.field_size_limit(sys.maxsize) # long goods and services descriptions
+        infile = openData(csvPath)
+        rows = csv.reader(infile, delimiter = '\t')
+        def readRows():
+            with infile: yield from rows
+        return next(rows), readRows()
+    return openRows
+
+def argumentParser():
+    '''the command-line options of dta_out.py'''
+    parser = argparse.ArgumentParser(description='Write Stata .dta versions of the Canada Trademarks Dataset data files, as do/CA_TM_csv_cleanup.do would.')
+    parser.add_argument('csvDir', nargs='?', help='full path of the csv folder (prompted for if omitted); the .dta files are written to a sibling dta folder')
+    return parser
+
+def main(args = None):
+
+    args = args or argumentParser().parse_args()
+
+    csvDir = Path(ask(args.csvDir, 'Provide full path of csv folder:', 'csvDir'))
+    dataPaths = {outFile: findData(csvDir, outFile) for outFile in tableRecipes}
+    dataPaths = {outFile: path for outFile, path in dataPaths.items() if path is not None}
+    if not dataPaths:
+        print(f'No data files were found in folder {csvDir.absolute()}')
+        return
+    dtaDir = csvDir.parent / 'dta'
+    dtaDir.mkdir(exist_ok=True)
+    vocabulary = Vocabulary.load(csvDir / codesFile) if csvDir.joinpath(codesFile).exists() else None # a dictionary-encoded run
+    for outFile, csvPath in dataPaths.items():
+        outPath = dtaPath(dtaDir, outFile)
+        codeLabels = {column: vocabulary.labels(column) for column in tableCodes.get(outFile, [])} if vocabulary else {}
+        writeDTA(outFile, csvRows(csvPath), outPath, codeLabels)
+        print(f'Dataset {outPath.name} is now available in folder {dtaDir.absolute()}')
+
+if __name__ == "__main__": main()
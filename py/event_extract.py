@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A streaming event backend for the flat tables (goods, classes and vienna): their fields are
+# gathered from lxml parser target events, without building an element tree, for iterparse_all.py
+# --events. Run as a script to check it against the tree-based output on a collection:
+#     python event_extract.py path/to/001.xml
+
+import argparse
+import importlib
+import time
+from lxml import etree
+from pathlib import Path
+
+from field_plan import parsePath, RowCollector
+from record_iter import bagTagName, iterRecords
+from xml_sources import openSource
+
+class EventField:
+    '''the entry for one field in a compiled event dictionary: called with the results
+    gathered for a record, returns the results of the field's expression within it
+    '''
+    def __init__(self, eventPlan, path):
+        self.eventPlan = eventPlan
+        self.path = path
+
+    def __call__(self, record):
+        return list(record[self.path])
+
+class EventPlan:
+    '''the text and attribute expressions gathered in one streaming pass over each record'''
+    def __init__(self, paths, namespaces):
+        self.paths = list(dict.fromkeys(paths))
+
+        # group the location paths by the tag of their final step, as in field_plan.FieldPlan
+        self.byTag = {} # final step tag -> {steps: [(path, result)]}
+        for path in self.paths:
+            for alternative in path.split('|'):
+                steps, result = parsePath(alternative.strip(), namespaces)
+                if result == 'element': raise ValueError(f'the event backend extracts text and attributes only: {path}')
+                targets = self.byTag.setdefault(steps[-1][1], {}).setdefault(tuple(steps), [])
+                if (path, result) not in targets: targets.append((path, result))
+        self.byTag = {tag: list(groups.items()) for tag, groups in self.byTag.items()}
+
+    def merge(self, other):
+        '''add the expressions of another plan to this one, so that one pass serves both'''
+        for path in other.paths:
+            if path not in self.paths: self.paths.append(path)
+        for tag, groups in other.byTag.items():
+            merged = dict(self.byTag.get(tag, []))
+            for steps, group in groups:
+                targets = merged.setdefault(steps, [])
+                targets += [target for target in group if target not in targets]
+            self.byTag[tag] = list(merged.items())
+
+def stackMatches(stack, position, steps, index):
+    '''whether the open element at stack[position] matches steps[index], with its preceding
+    steps matched by the open elements above it; the stack holds the (depth, tag, attributes)
+    of the open elements below the record whose tags appear in the plan, where a child of
+    the record is at depth 1
+    '''
+    while True:
+        axis, tag, predicate = steps[index]
+        depth, name, attrib = stack[position]
+        if name != tag or (predicate is not None and attrib.get(predicate[0]) != predicate[1]): return False
+        if index == 0: return axis == 'descendant' or depth == 1
+        if axis == 'descendant': break
+        # a child step: the parent must match the previous step
+        if position == 0 or stack[position - 1][0] != depth - 1: return False
+        position, index = position - 1, index - 1
+
+    # a descendant step: any open element above, below the record, may match the previous step
+    for ancestor in range(position - 1, -1, -1):
+        if stackMatches(stack, ancestor, steps, index - 1): return True
+    return False
+
+class RecordTarget:
+    '''an lxml parser target gathering the results of a plan for each record; the results of the
+    records completed are queued in records, each as a dictionary of lists keyed by expression
+    '''
+    def __init__(self, plan):
+        self.plan = plan
+        self.byTag = plan.byTag
+        self.stepTags = {tag for groups in plan.byTag.values() for steps, group in groups for axis, tag, predicate in steps}
+        self.records = []
+        self.results = None # the results of the record being parsed, None between records
+        self.depth = 0      # the depth of the innermost element open within the record
+        self.stack = []     # (depth, tag, attributes) of the open elements whose tags appear in the plan
+        self.texts = []     # for each element on the stack, the expressions taking its text
+        self.current = ()   # the expressions taking the text of the innermost open element
+        self.run = []       # the pieces of the text node being read
+
+    def endRun(self):
+        '''close the text node being read: each text() expression of its element takes it'''
+        text = ''.join(self.run)
+        for path in self.current: self.results[path].append(text)
+        self.run = []
+
+    def start(self, tag, attrib):
+        if self.results is None:
+            if tag == bagTagName: self.results = {path: [] for path in self.plan.paths}
+            return
+        if self.run: self.endRun()
+        self.depth += 1
+        if tag not in self.stepTags: # most elements: they cannot take part in any expression
+            self.current = ()
+            return
+        stack = self.stack
+        stack.append((self.depth, tag, attrib))
+        texts = ()
+        groups = self.byTag.get(tag)
+        if groups is not None:
+            texts = []
+            position = len(stack) - 1
+            matched = set()
+            for steps, group in groups:
+                if stackMatches(stack, position, steps, len(steps) - 1):
+                    for path, result in group:
+                        if (path, result) in matched: continue # an element matching several alternatives of a union is listed once
+                        matched.add((path, result))
+                        if result == 'text': texts.append(path)
+                        elif attrib.get(result[1]) is not None: self.results[path].append(attrib[result[1]])
+        self.texts.append(texts)
+        self.current = texts
+
+    def end(self, tag):
+        if self.results is None: return
+        if self.run: self.endRun()
+        depth = self.depth
+        if depth == 0: # the end of the record
+            self.records.append(self.results)
+            self.results = None
+            return
+        stack = self.stack
+        if stack and stack[-1][0] == depth:
+            stack.pop()
+            self.texts.pop()
+        self.depth = depth - 1
+        self.current = self.texts[-1] if stack and stack[-1][0] == depth - 1 else ()
+
+    def data(self, data):
+        if self.current: self.run.append(data)
+
+    def comment(self, text):
+        if self.run: self.endRun() # a comment splits the text around it into two nodes
+
+    def pi(self, target, data):
+        if self.run: self.endRun()
+
+    def close(self):
+        return len(self.records)
+
+def compileEvents(fields, namespaces):
+    '''compile a dictionary of fields and XPath expressions for the event backend; returns a
+    dictionary mapping each field to a callable taking the results gathered for a record
+    (fields mapped to False or None are passed through unchanged)
+    '''
+    plan = EventPlan([path for path in fields.values() if path], namespaces)
+    return {field: EventField(plan, path) if path else path for field, path in fields.items()}
+
+def eventPlans(eventNeeds):
+    '''the plans of a compiled event dictionary'''
+    return list({id(entry.eventPlan): entry.eventPlan for entry in eventNeeds.values() if entry}.values())
+
+def iterEvents(infile, plans, blockSize = 1024 * 1024):
+    '''yield the results gathered for each record of an open XML collection, in one streaming
+    pass serving every plan in plans; no element tree is built
+    '''
+    plan = EventPlan([], {})
+    for other in plans: plan.merge(other)
+    target = RecordTarget(plan)
+    parser = etree.XMLParser(target = target)
+    while True:
+        block = infile.read(blockSize)
+        if not block: break
+        parser.feed(block)
+        yield from target.records
+        target.records.clear()
+    parser.close()
+    yield from target.records
+
+def eventTable(module):
+    '''the event-backend version of an extractor module whose fields are compiled for it (as
+    eventNeeds): a table taking the results gathered for each record in place of its element
+    '''
+    class table:
+        backend = 'events'
+        outFile = module.outFile
+        headerRow = module.headerRow
+        eventNeeds = module.eventNeeds
+
+        @staticmethod
+        def extract(record, writeobject):
+            module.getData(record, writeobject, module.eventNeeds)
+    return table
+
+def timeBackend(module, collection, backend):
+    '''parse a collection and run one extractor module over it with one backend ('tree' or 'events');
+    returns the rows written and the seconds spent parsing and extracting
+    '''
+    writeobject = RowCollector()
+    startTime = time.perf_counter()
+    with openSource(Path(collection)) as infile:
+        if backend == 'tree':
+            for elem in iterRecords(etree.iterparse(infile, events=('end',), tag = bagTagName)):
+                module.extract(elem, writeobject)
+        else:
+            table = eventTable(module)
+            for record in iterEvents(infile, eventPlans(table.eventNeeds)):
+                table.extract(record, writeobject)
+    return writeobject.rows, time.perf_counter() - startTime
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Check the event backend against the tree-based output and benchmark both on an XML collection.')
+    parser.add_argument('collection', help='full path of a concatenated XML collection or ZIP archive')
+    parser.add_argument('--tables', nargs='+', default=['goods', 'classes', 'vienna'], help='extractor modules to compare (iterparse_<table>)')
+    args = parser.parse_args()
+
+    for table in args.tables:
+        module = importlib.import_module(f'iterparse_{table}')
+        expected, treeSeconds = timeBackend(module, args.collection, 'tree')
+        found, eventSeconds = timeBackend(module, args.collection, 'events')
+        parity = 'identical rows' if found == expected else 'ROWS DIFFER'
+        print(f'{table:>10}: {len(found):,} rows, {parity}; tree {treeSeconds:,.2f} s, events {eventSeconds:,.2f} s ({treeSeconds / max(eventSeconds, 1e-9):,.1f}x faster)')
+
+if __name__ == "__main__": main()
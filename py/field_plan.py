@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# Compiled field-extraction plans for the iterparse_* parsers: compileFields() turns a dictionary of
+# XPath expressions into one plan, evaluated in a single traversal of each record. Run as a script
+# to check the plans against XPath on a collection:
+#     python field_plan.py path/to/001.xml
+
+import argparse
+import importlib
+import re
+import time
+from lxml import etree
+from record_iter import bagTagName, iterRecords
+
+stepPattern = re.compile(r'^([\w.-]+):([\w.-]+)(?:\[@([\w.-]+):([\w.-]+)="([^"]*)"\])?$')
+
+def clarkName(prefix, name, namespaces):
+    return f'{{{namespaces[prefix]}}}{name}'
+
+def parsePath(path, namespaces):
+    '''split one location path into its element steps and its result: each step is
+    (axis, tag, predicate), where axis is 'child' or 'descendant' and predicate is an
+    (attribute, value) pair or None; the result is 'element', 'text' or ('attribute', name)
+    '''
+    if path.startswith('.//'): axis, rest = 'descendant', path[3:]
+    elif path.startswith('./'): axis, rest = 'child', path[2:]
+    else: raise ValueError(f'unsupported XPath expression: {path}')
+    parts = re.split(r'(//|/)', rest)
+    steps = []
+    result = 'element'
+    for index in range(0, len(parts), 2):
+        step = parts[index]
+        last = index == len(parts) - 1
+        if last and step == 'text()':
+            result = 'text'
+            continue
+        if last and step.startswith('@'):
+            prefix, name = step[1:].split(':')
+            result = ('attribute', clarkName(prefix, name, namespaces))
+            continue
+        match = stepPattern.match(step)
+        if not match: raise ValueError(f'unsupported XPath step {step!r} in {path}')
+        prefix, name, attrPrefix, attrName, value = match.groups()
+        predicate = (clarkName(attrPrefix, attrName, namespaces), value) if attrName else None
+        steps.append((axis, clarkName(prefix, name, namespaces), predicate))
+        if index + 1 < len(parts): axis = 'descendant' if parts[index + 1] == '//' else 'child'
+    if not steps: raise ValueError(f'unsupported XPath expression: {path}')
+    return steps, result
+
+def pathMatches(node, steps, index, context):
+    '''whether node, found below context, matches steps[index] with its preceding steps
+    matched by its ancestors below context
+    '''
+    while True:
+        axis, tag, predicate = steps[index]
+        if node.tag != tag or (predicate is not None and node.get(predicate[0]) != predicate[1]): return False
+        parent = node.getparent()
+        if index == 0: return axis == 'descendant' or parent is context
+        if axis == 'descendant': break
+        if parent is context: return False
+        node, index = parent, index - 1 # a child step: the parent must match the previous step
+
+    # a descendant step: any ancestor below context may match the previous step
+    while parent is not context:
+        if pathMatches(parent, steps, index - 1, context): return True
+        parent = parent.getparent()
+    return False
+
+def textNodes(node):
+    '''the text() children of an element, as XPath returns them'''
+    texts = [] if node.text is None else [node.text]
+    texts += [child.tail for child in node if child.tail is not None]
+    return texts
+
+class PlanField:
+    '''the entry for one field in a compiled dictionary: called with a record
+    (or sub-element), returns the results of the field's expression within it
+    '''
+    def __init__(self, plan, path):
+        self.plan = plan
+        self.path = path
+
+    def __call__(self, elem):
+        plan = self.plan
+        if elem is not plan.context: # the first field looked up in this element: run the plan
+            plan.results = plan.evaluate(elem)
+            plan.context = elem
+        return list(plan.results[self.path])
+
+class FieldPlan:
+    '''a set of XPath expressions evaluated together in a single traversal of each element'''
+    def __init__(self, paths, namespaces):
+        self.namespaces = namespaces
+        self.paths = list(dict.fromkeys(paths))
+
+        # group the location paths by the tag of their final step, and paths with the same steps
+        # (e.g. an element's text and one of its attributes) together, to be matched once
+        self.byTag = {} # final step tag -> {steps: [(path, result)]}
+        self.finalTags = {} # path -> the tags of the final steps of its alternatives
+        for path in self.paths:
+            for alternative in path.split('|'):
+                steps, result = parsePath(alternative.strip(), namespaces)
+                self.finalTags.setdefault(path, set()).add(steps[-1][1])
+                targets = self.byTag.setdefault(steps[-1][1], {}).setdefault(tuple(steps), [])
+                if (path, result) not in targets: targets.append((path, result)) # e.g. a union of one path with itself
+        self.byTag = {tag: list(groups.items()) for tag, groups in self.byTag.items()}
+
+        # a node can only match the same path twice (and must then be listed once) where
+        # alternatives of a union end in the same tag with different steps
+        self.unions = {tag for tag, groups in self.byTag.items() if len(groups) > 1 and any('|' in path for steps, group in groups for path, result in group)}
+
+        # a final step that is a descendant search without a predicate, for a single path (most of them),
+        # needs no check of the element's ancestors: these are recorded separately for a fast path
+        self.simple = {}
+        for tag, groups in self.byTag.items():
+            if len(groups) == 1 and len(groups[0][0]) == 1 and groups[0][0][0][0] == 'descendant' and groups[0][0][0][2] is None:
+                self.simple[tag] = groups[0][1]
+        self.tags = list(self.byTag)
+        self.context = None
+        self.results = None
+        self.xpaths = {}
+
+    def evaluate(self, context):
+        '''the results of every expression within context, gathered in one pass in document order'''
+        results = {path: [] for path in self.paths}
+        reorder = set()
+        simple = self.simple
+        for node in context.iterdescendants(*self.tags):
+            tag = node.tag
+            targets = simple.get(tag)
+            if targets is None:
+                matched = set() if tag in self.unions else None
+                for steps, group in self.byTag[tag]:
+                    if pathMatches(node, steps, len(steps) - 1, context):
+                        for path, result in group:
+                            if matched is not None:
+                                if (path, result) in matched: continue # a node matching several alternatives of a union is listed once
+                                matched.add((path, result))
+                            collect(results[path], node, result)
+                            if result == 'text' and len(node) and self.nested(node, path): reorder.add(path)
+                continue
+            for path, result in targets:
+                if result == 'text' and not len(node):
+                    if node.text is not None: results[path].append(node.text)
+                else:
+                    collect(results[path], node, result)
+                    if result == 'text' and self.nested(node, path): reorder.add(path)
+
+        # the text after a nested match belongs after the nested match's text: these (rare) paths are left to XPath
+        for path in reorder:
+            if path not in self.xpaths: self.xpaths[path] = etree.XPath(path, namespaces = self.namespaces, smart_strings=False)
+            results[path] = self.xpaths[path](context)
+        return results
+
+    def nested(self, node, path):
+        '''whether an element whose text a path takes contains an element that the path may also match'''
+        return any(True for descendant in node.iterdescendants(*self.finalTags[path]))
+
+def collect(found, node, result):
+    '''add the result of an expression for a matching node to the list found'''
+    if result == 'element': found.append(node)
+    elif result == 'text': found += textNodes(node)
+    else:
+        value = node.get(result[1])
+        if value is not None: found.append(value)
+
+def compileFields(fields, namespaces):
+    '''compile a dictionary of fields and XPath expressions into a single plan; returns a
+    dictionary mapping each field to a callable, for use in place of compiled etree.XPath
+    expressions (fields mapped to False or None are passed through unchanged)
+    '''
+    plan = FieldPlan([path for path in fields.values() if path], namespaces)
+    return {field: PlanField(plan, path) if path else path for field, path in fields.items()}
+
+def compileXPaths(fields, namespaces):
+    '''compile a dictionary of fields and XPath expressions as etree.XPath expressions, one per field,
+    for the dictionaries that a plan does not speed up (see st96_fields.py)
+    '''
+    return {field: etree.XPath(path, namespaces = namespaces, smart_strings=False) if path else path for field, path in fields.items()}
+
+def isPlanned(entry):
+    '''whether a dictionary entry is a compiled plan field (checked by attribute, since this
+    module is loaded twice, as field_plan and as __main__, when it is run as a script)
+    '''
+    return hasattr(entry, 'plan') and hasattr(entry, 'path')
+
+def planDictionaries(module):
+    '''the compiled field dictionaries defined at the top level of an extractor module'''
+    return {
+        name: value for name, value in vars(module).items()
+        if isinstance(value, dict) and any(isPlanned(entry) for entry in value.values())
+    }
+
+class RowCollector:
+    '''a stand-in for csv.writer that keeps the rows written'''
+    def __init__(self):
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(list(row))
+
+def timeExtract(module, collection):
+    '''run an extractor module over a collection; returns the rows written and the seconds spent extracting'''
+    writeobject = RowCollector()
+    seconds = 0.0
+    with open(collection, 'rb') as infile:
+        for elem in iterRecords(etree.iterparse(infile, events=('end',), tag = bagTagName)):
+            startTime = time.perf_counter()
+            module.extract(elem, writeobject)
+            seconds += time.perf_counter() - startTime
+    return writeobject.rows, seconds
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Check compiled field plans against per-field XPath and benchmark them on an XML collection.')
+    parser.add_argument('collection', help='full path of a concatenated XML collection')
+    parser.add_argument('--tables', nargs='+', default=['main', 'parties', 'allevents', 'claims', 'priority', 'goods', 'classes', 'vienna'], help='extractor modules to compare (iterparse_<table>)')
+    args = parser.parse_args()
+
+    for table in args.tables:
+        module = importlib.import_module(f'iterparse_{table}')
+
+        # swap each compiled dictionary's entries for the equivalent etree.XPath expressions, in place,
+        # so that every reference to the dictionary (e.g. in recursives) sees the swap
+        dictionaries = planDictionaries(module)
+        planned = {name: dict(fields) for name, fields in dictionaries.items()}
+        for fields in dictionaries.values():
+            for field, entry in fields.items():
+                if isPlanned(entry):
+                    fields[field] = etree.XPath(entry.path, namespaces = entry.plan.namespaces, smart_strings=False)
+        expected, xpathSeconds = timeExtract(module, args.collection)
+        for name, fields in dictionaries.items():
+            fields.update(planned[name])
+        found, planSeconds = timeExtract(module, args.collection)
+
+        parity = 'identical rows' if found == expected else 'ROWS DIFFER'
+        print(f'{table:>10}: {len(found):,} rows, {parity}; XPath {xpathSeconds:,.2f} s, plan {planSeconds:,.2f} s ({xpathSeconds / max(planSeconds, 1e-9):,.1f}x faster)')
+
+if __name__ == "__main__": main()
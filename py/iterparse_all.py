@@ -0,0 +1,830 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A single-pass streaming xml parser to extract data for all Canada Trademarks Dataset files at once.
+# Each TrademarkBag is parsed once and handed to the extract() function of every
+# table-specific iterparse_* script, each of which writes its own CSV file. The flat tables
+# selected with --events are instead extracted by the streaming event backend (event_extract.py),
+# in a pass of their own that builds no element trees.
+# To be executed after CIPO-Canada's IP Horizons Trademark Bulk Data has been
+# downloaded and processed using sftp-secure.py
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+import shutil
+import sys
+from tqdm import tqdm
+import csv
+from lxml import etree
+from pathlib import Path
+
+from record_iter import trackRecords, trackProgress
+from run_report import RunReport, TimedTable, runReportFile, timed, timedRecords, timing
+from event_extract import eventTable, eventPlans, iterEvents
+from xml_sources import findSourceChunks, openSource, countRecords
+from record_store import RecordStore, storeFile, exportCSV
+from columnar_out import columnarFormats, columnarPath, convertCSV
+from dta_out import csvRows, dtaPath, writeDTA
+from csv_out import BatchWriter, CodedWriter, OutputReport, Vocabulary, codesFile, compressSuffixes, dataPath, openData, openOutput
+from canada_tm import ask
+from checkpoint import Checkpoint, checkpointFile, runSettings, truncateFile
+from quarantine import Quarantine, RecordRows, extractRecord, mergeQuarantines, quarantineFile, quarantineSummary, recoverRecords
+from record_digest import DigestIndex, UnchangedFilter, digestFile, dropDigests, recordDigests, unchangedKeys
+from change_feed import ChangeFeed, changesDir, printChanges, readRange
+from update_manifest import loadManifest, saveManifest, fileChecksum, archiveEntry, archiveChanged, readKeys, rewriteOutput
+import iterparse_main
+import iterparse_parties
+import iterparse_allevents
+import iterparse_claims
+import iterparse_priority
+import iterparse_goods
+import iterparse_classes
+import iterparse_vienna
+import st96_fields
+
+# a dictionary of the tables that can be extracted, mapped to the scripts that extract them;
+# any module exposing headerRow, outFile and extract(elem, writeobject) can be plugged in here
+
+extractors = {
+    'main':     iterparse_main,
+    'parties':  iterparse_parties,
+    'events':   iterparse_allevents,
+    'claims':   iterparse_claims,
+    'priority': iterparse_priority,
+    'goods':    iterparse_goods,
+    'classes':  iterparse_classes,
+    'vienna':   iterparse_vienna
+}
+
+def fast_iter(context, tables, count, loop, quiet = False, runReport = None, quarantine = None, unchanged = None):
+    '''a fast iterating parser script for large XML files,
+    from https://www.ibm.com/developerworks/xml/library/x-hiperfparse/
+    as revised in https://stackoverflow.com/questions/7171140/using-python-iterparse-for-large-xml-files/7171543#7171543
+    Each record is passed to every (extractor, writeobject) pair in tables, unless unchanged
+    skips it, and then released; returns the number of records parsed
+    '''
+    records = 0
+    if runReport is None: elements = trackRecords(context, count, loop, quiet)
+    else: elements = trackProgress(timedRecords(context, runReport), count, loop, quiet)
+    if quarantine is not None: tables = [(extractor, RecordRows(writeobject)) for extractor, writeobject in tables]
+    for elem in elements:
+        records += 1
+        if unchanged is not None and unchanged.unchanged(elem): continue
+        if extractRecord(elem, tables, quarantine) and unchanged is not None: unchanged.record()
+    del context # clears the parsed event from memory
+    return records
+
+def event_iter(infile, tables, count, loop, quiet = False, runReport = None):
+    '''the event backend's counterpart of fast_iter: the results gathered for each record
+    of an open collection, in one streaming pass serving every table, are passed to every
+    (extractor, writeobject) pair in tables. Returns the number of records parsed.
+    '''
+    records = 0
+    plans = [plan for extractor, writeobject in tables for plan in eventPlans(extractor.eventNeeds)]
+    gathered = iterEvents(infile, plans)
+    if runReport is not None: gathered = timed(gathered, runReport, 'tokenize')
+    for record in trackProgress(gathered, count, loop, quiet):
+        for extractor, writeobject in tables:
+            extractor.extract(record, writeobject)
+        records += 1
+    return records
+
+def parseCollection(filename, tables, count, loop, quiet = False, chunk = None, runReport = None, quarantine = None, unchanged = None):
+    '''run the parser over a concatenated XML collection or ZIP archive (or a chunk of it), passing
+    each record to every (extractor, writeobject) pair in tables; the event-backend tables are
+    extracted in a pass of their own. Returns the number of records parsed
+    '''
+    if quarantine is not None: quarantine.collection = filename.name
+    if unchanged is not None: unchanged.collection = filename.name
+    if runReport is not None:
+        with runReport.profiling(filename, chunk), runReport.stage('parse', filename.name):
+            tables = [(TimedTable(extractor, runReport), writeobject) for extractor, writeobject in tables]
+            return parseSource(filename, tables, count, loop, quiet, chunk, runReport, quarantine, unchanged)
+    return parseSource(filename, tables, count, loop, quiet, chunk, quarantine = quarantine, unchanged = unchanged)
+
+def parseSource(filename, tables, count, loop, quiet = False, chunk = None, runReport = None, quarantine = None, unchanged = None):
+    '''parseCollection, without the report's collection stage; the bytes read in each pass are
+    counted to the report's tokenize stage (except in chunks of ZIP archives, of unknown size)
+    '''
+    size = filename.stat().st_size if chunk is None else 0 if filename.suffix == '.zip' else chunk[1] - chunk[0]
+    treeTables = [(extractor, writeobject) for extractor, writeobject in tables if getattr(extractor, 'backend', 'tree') == 'tree']
+    eventTables = [(extractor, writeobject) for extractor, writeobject in tables if getattr(extractor, 'backend', 'tree') == 'events']
+    records = 0
+    if treeTables or not eventTables:
+        with openSource(filename, chunk) as infile:
+
+            #initialize the iterative parser to search for application container tags
+            #(in --recover runs, restarting after each malformed record: see quarantine.py)
+            if quarantine is None: record = etree.iterparse(infile, events=('end',), tag = f'{{http://www.wipo.int/standards/XMLSchema/ST96/Trademark}}TrademarkBag')
+            else: record = recoverRecords(infile, quarantine)
+
+            #run the parser!
+            records = fast_iter(record, treeTables, count, loop, quiet, runReport, quarantine, unchanged)
+        if runReport is not None: runReport.count('tokenize', bytes = size)
+    if eventTables:
+        with openSource(filename, chunk) as infile:
+            records = event_iter(infile, eventTables, count, loop, quiet, runReport)
+        if runReport is not None: runReport.count('tokenize', bytes = size)
+    return records
+
+class recordKeys:
+    '''a pseudo-table listing the (AppNo, ExtNo) key of every record parsed; it is written to
+    shards only, during --update runs, to find the existing rows superseded by the new records
+    '''
+    outFile = 'CA_TM_keys.csv'
+    headerRow = ['AppNo', 'ExtNo']
+    tagNeeds = {'AppNo': st96_fields.keyNeeds['AppNo']}
+    eventNeeds = {'AppNo': st96_fields.keyEvents['AppNo']}
+
+    @staticmethod
+    def getData(elem, writeobject, tagDict = tagNeeds):
+        foundIt = tagDict['AppNo'](elem)
+        writeobject.writerow([foundIt[0][-9:-2], foundIt[0][-2:]])
+
+    extract = getData
+
+shardTables = dict(extractors, keys = recordKeys)
+
+# the event-backend versions of the tables whose fields are also compiled for it (see event_extract.py)
+
+eventExtractors = {name: eventTable(module) for name, module in shardTables.items() if hasattr(module, 'eventNeeds')}
+
+def tableFor(name, eventNames = ()):
+    '''the extractor for a table: its event-backend version if name is in eventNames'''
+    return eventExtractors[name] if name in eventNames else shardTables[name]
+
+def shardPath(shardDir, filename, chunk, extractor, compress = None):
+    '''the shard file holding one table's rows for one collection or chunk of a collection'''
+    if chunk is None: return dataPath(shardDir, f'{filename.stem}_{extractor.outFile}', compress)
+    return dataPath(shardDir, f'{filename.stem}_{chunk[0]:015d}_{extractor.outFile}', compress)
+
+def codedWriter(writer, extractor, vocabulary):
+    '''writer, wrapped to write the extractor's dictionary-encoded columns as codes from vocabulary,
+    if it is given (see csv_out.py)
+    '''
+    columns = st96_fields.tableCodes.get(extractor.outFile)
+    if vocabulary is None or not columns: return writer
+    return CodedWriter(writer, extractor.headerRow, columns, vocabulary)
+
+def parseShard(filename, chunk, tableNames, shardDir, count = 0, loop = None, eventNames = (), batchSize = 10000, compress = None, runReport = None, recover = False, unchanged = None):
+    '''parse one collection (or chunk) into a shard file for each table, without a label row; runs
+    in a worker process in parallel runs. unchanged is the (digest path, reparsed collections)
+    of a --skip-unchanged run. Returns the collection, the records parsed, the rows written for
+    each table and runReport
+    '''
+    with ExitStack() as stack:
+        tables = []
+        for name in tableNames:
+            extractor = tableFor(name, eventNames)
+            shardfile = stack.enter_context(openOutput(shardPath(shardDir, filename, chunk, extractor, compress), 'w', compress))
+            writer = BatchWriter(shardfile, batchSize, runReport = runReport)
+            stack.callback(writer.writeBatch) # the last batch is written before the shard is closed
+            tables.append((extractor, writer))
+        quarantine = stack.enter_context(Quarantine(shardPath(shardDir, filename, chunk, Quarantine), runReport)) if recover else None
+        unchangedFilter = movedWriter = None
+        if unchanged is not None:
+            digestWriter = BatchWriter(stack.enter_context(openOutput(shardPath(shardDir, filename, chunk, recordDigests), 'w')), batchSize)
+            stack.callback(digestWriter.writeBatch)
+            movedWriter = None
+            if unchanged[0] is not None:
+                movedWriter = BatchWriter(stack.enter_context(openOutput(shardPath(shardDir, filename, chunk, unchangedKeys), 'w')), batchSize)
+                stack.callback(movedWriter.writeBatch)
+            unchangedFilter = UnchangedFilter(unchanged[0], digestWriter, unchanged[1], runReport, movedWriter)
+            stack.callback(unchangedFilter.close)
+        records = parseCollection(filename, tables, count, loop, quiet = loop is None, chunk = chunk, runReport = runReport, quarantine = quarantine, unchanged = unchangedFilter)
+    written = {extractor.outFile: writer.rows for extractor, writer in tables}
+    if unchanged is not None: written[recordDigests.outFile] = digestWriter.rows
+    if movedWriter is not None: written[unchangedKeys.outFile] = movedWriter.rows
+    return filename, records, written, runReport
+
+def parseShards(workUnits, tableNames, shardDir, workers, eventNames = (), batchSize = 10000, compress = None, runReport = None, checkpoint = None, recover = False, unchanged = None):
+    '''parse each (collection, chunk) work unit into shards, in a pool of worker processes if
+    workers > 1, and checksum each collection; with a checkpoint, work units already parsed are
+    passed over. Returns the records and checksum of each collection and the rows of each table
+    '''
+    sourceList = list(dict.fromkeys(filename for filename, chunk in workUnits))
+    records = {filename.name: 0 for filename in sourceList}
+    checksums = {}
+    rows = {}
+
+    def tally(filename, chunk, count, written):
+        records[filename.name] += count
+        for outFile, number in written.items(): rows[outFile] = rows.get(outFile, 0) + number
+        if checkpoint is not None and checkpoint.shard(filename, chunk) is None:
+            shards = [shardPath(shardDir, filename, chunk, shardTables[name], compress) for name in tableNames]
+            if recover: shards.append(shardPath(shardDir, filename, chunk, Quarantine))
+            if unchanged is not None: shards.append(shardPath(shardDir, filename, chunk, recordDigests))
+            if unchanged is not None and unchanged[0] is not None: shards.append(shardPath(shardDir, filename, chunk, unchangedKeys))
+            checkpoint.shardDone(filename, chunk, count, written, shards)
+
+    if checkpoint is not None:
+        for filename, chunk in workUnits:
+            done = checkpoint.shard(filename, chunk)
+            if done is not None: tally(filename, chunk, done['records'], done['rows'])
+        workUnits = [(filename, chunk) for filename, chunk in workUnits if checkpoint.shard(filename, chunk) is None]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            sums = {pool.submit(fileChecksum, filename): filename for filename in sourceList}
+            jobs = {pool.submit(parseShard, filename, chunk, tableNames, shardDir, eventNames = eventNames, batchSize = batchSize, compress = compress, runReport = runReport and runReport.child(), recover = recover, unchanged = unchanged): chunk for filename, chunk in workUnits}
+            for job in tqdm(
+                as_completed(jobs),
+                total=len(workUnits),
+                ncols=100,
+                desc=f'Total Progress ({workers} workers)',
+                position=0,
+                leave=True,
+                unit=' chunk' if len(workUnits) > len(sourceList) else 'archive'
+            ):
+                filename, count, written, shardReport = job.result()
+                if shardReport is not None: runReport.merge(shardReport)
+                tally(filename, jobs[job], count, written)
+            for job, filename in sums.items():
+                checksums[filename.name] = job.result()
+    else:
+        for filename, chunk in tqdm(
+            workUnits,
+            total=len(workUnits),
+            ncols=100,
+            desc='Total Progress',
+            position=0,
+            leave=True,
+            unit='archive'
+        ):
+            filename, count, written, shardReport = parseShard(filename, chunk, tableNames, shardDir, countRecords(filename), f'{filename.stem[-3:]} of {len(sourceList)}', eventNames, batchSize, compress, runReport, recover, unchanged)
+            tally(filename, chunk, count, written)
+        for filename in sourceList:
+            with timing(runReport, 'checksum', filename.name, bytes = filename.stat().st_size):
+                checksums[filename.name] = fileChecksum(filename)
+    return records, checksums, rows
+
+def mergeShards(workUnits, tableNames, shardDir, parsePath, append = False, compress = None, vocabulary = None, runReport = None, checkpoint = None):
+    '''concatenate the shard files for each table, in collection and chunk order, behind its label
+    row (or, if append, onto the existing file), encoding the coded columns if vocabulary is
+    given, and remove them. Returns the byte range of each collection's rows in each file
+    '''
+    csv.field_size_limit(sys.maxsize) # long goods and services descriptions
+    ranges = {}
+    for name in tableNames:
+        extractor = extractors[name]
+        outPath = dataPath(parsePath, extractor.outFile, compress)
+        merged = checkpoint.merged(extractor.outFile) if checkpoint is not None else None
+        if merged is not None:
+            for archive, span in merged.items(): ranges.setdefault(archive, {})[extractor.outFile] = span
+            for filename, chunk in workUnits: # left if the run was interrupted as they were being removed
+                shardPath(shardDir, filename, chunk, extractor, compress).unlink(missing_ok=True)
+            continue
+        mergedShards = []
+        if not append:
+            with openOutput(outPath, 'w', compress) as newfile:
+                csv.writer(newfile, delimiter = '\t').writerow(extractor.headerRow)
+        columns = st96_fields.tableCodes.get(extractor.outFile) if vocabulary is not None else None
+        shardBytes = sum(shardPath(shardDir, filename, chunk, extractor, compress).stat().st_size for filename, chunk in workUnits)
+        with ExitStack() as stack:
+            stack.enter_context(timing(runReport, f'merge {extractor.outFile}', bytes = shardBytes))
+            if columns:
+                # the shards' rows are read back and written with the coded columns encoded
+                fileWriter = BatchWriter(stack.enter_context(openOutput(outPath, 'a', compress)))
+                stack.callback(fileWriter.writeBatch)
+                writer = CodedWriter(fileWriter, extractor.headerRow, columns, vocabulary)
+                position = (lambda: 0) if compress else fileWriter.tell
+            else:
+                newfile = stack.enter_context(outPath.open('ab'))
+                position = newfile.tell
+            for filename, chunk in workUnits:
+                start = position()
+                shard = shardPath(shardDir, filename, chunk, extractor, compress)
+                if columns:
+                    with openData(shard) as shardfile:
+                        writer.writerows(csv.reader(shardfile, delimiter = '\t'))
+                else:
+                    with shard.open('rb') as shardfile:
+                        shutil.copyfileobj(shardfile, newfile, 16 * 1024 * 1024)
+                if checkpoint is None: shard.unlink()
+                else: mergedShards.append(shard)
+                span = ranges.setdefault(filename.name, {}).setdefault(extractor.outFile, [start, start])
+                span[1] = position()
+        if checkpoint is not None:
+            checkpoint.mergeDone(extractor.outFile, outPath, {archive: outputs[extractor.outFile] for archive, outputs in ranges.items() if extractor.outFile in outputs}, vocabulary)
+            for shard in mergedShards: shard.unlink()
+    return ranges
+
+def mergeQuarantine(workUnits, shardDir, parsePath):
+    '''merge the quarantine shards of a --recover run into its quarantine file, in collection and chunk order'''
+    mergeQuarantines([shardPath(shardDir, filename, chunk, Quarantine) for filename, chunk in workUnits], parsePath / quarantineFile)
+
+def loadDigests(digests, workUnits, shardDir, runReport = None):
+    '''record the digests in the recordDigests shards of a --skip-unchanged run in the DigestIndex digests'''
+    with timing(runReport, 'load digests'):
+        digests.load([shardPath(shardDir, filename, chunk, recordDigests) for filename, chunk in workUnits])
+
+def printQuarantine(parsePath):
+    '''tell what a --recover run set aside'''
+    records, fragments, recovered = quarantineSummary(parsePath / quarantineFile)
+    if not records and not fragments:
+        print('No records were quarantined, and no malformed XML was found.')
+        return
+    print(f'{records:,} records could not be extracted and were quarantined, and {fragments:,} malformed records were found, from which {recovered:,} were repaired: see {quarantineFile} in folder {parsePath.absolute()}')
+
+def filePositions(newfiles):
+    '''write the queued rows of each (name, BatchWriter) pair in newfiles and return its file's byte offset, by name'''
+    return {outFile: writer.tell() for outFile, writer in newfiles}
+
+def syncFiles(newfiles):
+    '''filePositions, with each file flushed to disk, for a checkpoint'''
+    return {outFile: writer.sync() for outFile, writer in newfiles}
+
+def chunkRecords(filename, chunk, count):
+    '''the number of records in a chunk of a collection of count records, for its progress bar:
+    exact for ZIP archives (one record per file), estimated from its size otherwise
+    '''
+    if chunk is None: return count
+    if filename.suffix == '.zip': return chunk[1] - chunk[0]
+    return round(count * (chunk[1] - chunk[0]) / max(filename.stat().st_size, 1))
+
+def splitWork(sourceList, chunkSize):
+    '''the (collection, chunk) work units for a run: collections larger than chunkSize
+    are split into chunks aligned on TrademarkBag start tags; chunk is None for whole collections
+    '''
+    workUnits = []
+    for filename in sourceList:
+        if chunkSize and filename.stat().st_size > chunkSize:
+            workUnits += [(filename, chunk) for chunk in findSourceChunks(filename, chunkSize)]
+        else:
+            workUnits.append((filename, None))
+    return workUnits
+
+def moveRows(movedRows, extractor, shardDir, vocabulary = None):
+    '''append the rows of a table dropped from its data file to the shards of the work units they
+    are moved to, as movedRows maps them, with their coded columns decoded from vocabulary, if it
+    is given, as the shards hold values; returns the number of rows moved
+    '''
+    columns = st96_fields.tableCodes.get(extractor.outFile) if vocabulary is not None else None
+    labels = [(index, vocabulary.labels(column)) for index, column in enumerate(extractor.headerRow) if column in columns] if columns else []
+    moved = 0
+    for (filename, chunk), unitRows in movedRows.items():
+        with openOutput(shardPath(shardDir, filename, chunk, extractor), 'a') as shardfile:
+            writer = csv.writer(shardfile, delimiter = '\t')
+            for row in unitRows:
+                for index, values in labels:
+                    if row[index]: row[index] = values[int(row[index])]
+                writer.writerow(row)
+        moved += len(unitRows)
+    return moved
+
+def updateOutputs(pending, tableNames, sourceDir, parsePath, manifest, workers, chunkSize, eventNames = (), batchSize = 10000, vocabulary = None, runReport = None, recover = False, digests = None, changes = None):
+    '''parse only the pending (new or changed) collections and upsert their rows into the existing
+    CSV files: the rows of their records, and of the changed collections, are dropped before the
+    new rows are appended. With digests, unchanged records are skipped and their rows moved to
+    the collection that skipped them. Returns the number of rows appended to each file
+    '''
+    shardDir = parsePath / 'shards'
+    shardDir.mkdir(exist_ok=True)
+    workUnits = splitWork(pending, chunkSize if workers > 1 else 0)
+    unchanged = (digests.path, [filename.name for filename in pending]) if digests is not None else None
+    records, checksums, rows = parseShards(workUnits, tableNames + ['keys'], shardDir, workers, eventNames, batchSize, runReport = runReport, recover = recover, unchanged = unchanged)
+    if recover: mergeQuarantine(workUnits, shardDir, parsePath)
+
+    # the keys of all records in the pending collections supersede any existing rows for them
+    keyShards = [shardPath(shardDir, filename, chunk, recordKeys) for filename, chunk in workUnits]
+    with timing(runReport, 'read keys'):
+        unitKeys = [readKeys([keyShard]) for keyShard in keyShards]
+        newKeys = set().union(*unitKeys)
+    for keyShard in keyShards: keyShard.unlink()
+    print(f'{sum(records.values())} records parsed from {len(pending)} new or changed collections. Updating...')
+
+    # the rows of the records skipped as unchanged are moved to the last work unit that skipped
+    # them (unless a later one extracted them), so that they leave the range of the collection
+    # they were parsed from, which may be parsed again, along with their digests
+    movedTo = {}
+    if digests is not None:
+        rows.pop(recordDigests.outFile)
+        skipped = rows.pop(unchangedKeys.outFile, 0)
+        print(f'{skipped:,} of them were unchanged since they were last parsed, and were skipped; the others were extracted.')
+        for unit, keys in zip(workUnits, unitKeys):
+            movedShard = shardPath(shardDir, *unit, unchangedKeys)
+            for key in keys: movedTo.pop(key, None)
+            for key in readKeys([movedShard]): movedTo[key] = unit
+            movedShard.unlink()
+
+    archives = manifest['archives']
+    for name in tableNames:
+        outFile = extractors[name].outFile
+        ranges = {archive: entry['outputs'][outFile] for archive, entry in archives.items()}
+        movedRows = {}
+
+        def dropped(row, table = Path(outFile).stem):
+            if changes is not None: changes.removed(table, row)
+            unit = movedTo.get(tuple(row[:2]))
+            if unit is not None: movedRows.setdefault(unit, []).append(row)
+
+        with timing(runReport, f'rewrite {outFile}', bytes = parsePath.joinpath(outFile).stat().st_size):
+            spans = rewriteOutput(parsePath / outFile, newKeys | movedTo.keys(), ranges, [filename.name for filename in pending], dropped)
+        for archive, span in spans.items():
+            archives[archive]['outputs'][outFile] = list(span)
+        if movedRows: rows[outFile] = rows.get(outFile, 0) + moveRows(movedRows, extractors[name], shardDir, vocabulary)
+
+    for archive, outputs in mergeShards(workUnits, tableNames, shardDir, parsePath, append = True, vocabulary = vocabulary, runReport = runReport).items():
+        filename = sourceDir / archive
+        archives[archive] = archiveEntry(filename, checksums[archive], records[archive], outputs)
+        if changes is not None:
+            with timing(runReport, 'changes', archive):
+                for outFile, (start, end) in outputs.items():
+                    for row in readRange(parsePath / outFile, start, end): changes.added(Path(outFile).stem, row)
+    if digests is not None:
+        digests.dropArchives([filename.name for filename in pending])
+        loadDigests(digests, workUnits, shardDir, runReport) # once the rows they stand for are in place
+    shardDir.rmdir()
+    return rows
+
+def storeCollections(sourceList, tableNames, parsePath, manifest, eventNames = (), compress = None, vocabulary = None, runReport = None, quarantine = None, unchanged = None, changes = None):
+    '''parse collections into the record store, in collection order, so that each record replaces
+    any older version of the same application, then export the selected tables' data files
+    from the store. The records last parsed from the collections already stored, which have
+    changed, are dropped first. Returns the number of rows exported to each file
+    '''
+    storePath = parsePath / storeFile
+    storeTables = tableHeaders(tableNames)
+    with RecordStore(storePath, storeTables, changes = changes) as store:
+
+        # the key pseudo-table comes first, to start each record before its rows are written
+        tables = [(tableFor('keys', eventNames), store.keyWriter())]
+        tables += [(tableFor(name, eventNames), store.writer(Path(extractors[name].outFile).stem)) for name in tableNames]
+        if unchanged is not None: unchanged.moved = store.moveWriter()
+
+        # as an update of the data files drops the rows of the changed collections before parsing them again
+        changed = [filename.name for filename in sourceList if filename.name in manifest['stored']]
+        if changed:
+            with timing(runReport, 'drop changed'):
+                print(f'{store.dropArchives(changed):,} records last parsed from {len(changed)} changed collections were dropped from the store.')
+            if unchanged is not None: unchanged.writeobject.dropArchives(changed)
+
+        for filename in tqdm(
+            sourceList,
+            total=len(sourceList),
+            ncols=100,
+            desc='Total Progress',
+            position=0,
+            leave=True,
+            unit='archive'
+        ):
+            counter = countRecords(filename)
+            store.collection = filename.name
+            records = parseCollection(filename, tables, counter, f'{filename.stem[-3:]} of {len(sourceList)}', runReport = runReport, quarantine = quarantine, unchanged = unchanged)
+            with timing(runReport, 'store', filename.name, records = records):
+                store.flush()
+            if unchanged is not None: unchanged.writeobject.flush()
+            with timing(runReport, 'checksum', filename.name, bytes = filename.stat().st_size):
+                checksum = fileChecksum(filename)
+            manifest['stored'][filename.name] = archiveEntry(filename, checksum, records, {})
+
+    print('Exporting data files from the record store...')
+    rows = {}
+    for name, stem in zip(tableNames, storeTables):
+        outFile = extractors[name].outFile
+        with timing(runReport, f'export {outFile}'):
+            rows[outFile] = exportCSV(storePath, stem, dataPath(parsePath, outFile, compress), compress, st96_fields.tableCodes.get(outFile), vocabulary)
+        if runReport is not None: runReport.count(f'export {outFile}', bytes = dataPath(parsePath, outFile, compress).stat().st_size, records = rows[outFile])
+
+    # the exported files are ordered by the store, so the manifest's byte ranges no longer apply
+    manifest['archives'] = {}
+    return rows
+
+def tableHeaders(tableNames):
+    '''the label row of each selected table, by the name of its data file (e.g. CA_TM_main)'''
+    return {Path(extractors[name].outFile).stem: extractors[name].headerRow for name in tableNames}
+
+def saveCodes(parsePath, vocabulary, manifest):
+    '''write the lookup table of a dictionary-encoded run, or remove that of an earlier run;
+    note in the manifest whether the data files are dictionary-encoded
+    '''
+    manifest['codes'] = vocabulary is not None
+    if vocabulary is None: parsePath.joinpath(codesFile).unlink(missing_ok=True)
+    else: vocabulary.save(parsePath / codesFile)
+
+def writeColumnar(tableNames, parsePath, format, compress = None, vocabulary = None, runReport = None):
+    '''write the columnar version of each selected table's data file, in a sibling folder named for the format
+    (timed in runReport, if it is given)'''
+    outDir = parsePath.parent / format
+    outDir.mkdir(exist_ok=True)
+    for name in tableNames:
+        outFile = extractors[name].outFile
+        outPath = columnarPath(outDir, outFile, format)
+        with timing(runReport, f'{format} {outFile}', bytes = dataPath(parsePath, outFile, compress).stat().st_size):
+            convertCSV(dataPath(parsePath, outFile, compress), outPath, format, codedColumns = st96_fields.tableCodes.get(outFile, []) if vocabulary else [])
+        print(f'Dataset {outPath.name} is now available in folder {outDir.absolute()}')
+
+def writeStata(tableNames, parsePath, compress = None, vocabulary = None, runReport = None):
+    '''write the Stata version of each selected table's data file, as the cleanup do-file would, in a sibling dta folder;
+    in dictionary-encoded runs, the coded columns are labeled with their values in vocabulary (timed in runReport, if it is given)
+    '''
+    outDir = parsePath.parent / 'dta'
+    outDir.mkdir(exist_ok=True)
+    for name in tableNames:
+        outFile = extractors[name].outFile
+        outPath = dtaPath(outDir, outFile)
+        codeLabels = {column: vocabulary.labels(column) for column in st96_fields.tableCodes.get(outFile, [])} if vocabulary else {}
+        with timing(runReport, f'dta {outFile}', bytes = dataPath(parsePath, outFile, compress).stat().st_size):
+            writeDTA(outFile, csvRows(dataPath(parsePath, outFile, compress)), outPath, codeLabels)
+        print(f'Dataset {outPath.name} is now available in folder {outDir.absolute()}')
+
+def saveRunReport(runReport, reportPath, report, outPaths, **details):
+    '''save the run report, if the run is timed, with the rows and bytes of each data file written (and any further details)'''
+    if runReport is None: return
+    outputs = {path.name: {'rows': report.rows.get(outFile, 0), 'bytes': path.stat().st_size} for outFile, path in outPaths.items() if path.exists()}
+    runReport.save(reportPath, outputs = outputs, **details)
+
+def argumentParser():
+    '''the command-line options of iterparse_all.py (also those of canada_tm.py parse)'''
+    parser = argparse.ArgumentParser(description='Extract all Canada Trademarks Dataset CSV files in a single pass over the XML collections.')
+    parser.add_argument('sourceDir', nargs='?', help='full path of XML_raw folder (prompted for if omitted)')
+    parser.add_argument('--tables', nargs='+', choices=list(extractors), default=list(extractors), help='tables to extract (default: all)')
+    parser.add_argument('--workers', type=int, default=1, help='number of collections to parse in parallel worker processes (default: 1)')
+    parser.add_argument('--zips', action='store_true', help='parse the ZIP archives in the source folder directly instead of concatenated XML collections')
+    parser.add_argument('--chunk-mb', type=float, default=0, help='with --workers, split collections larger than this many MB into chunks parsed in parallel (default: 0, no splitting)')
+    parser.add_argument('--update', action='store_true', help='parse only collections that are new or have changed since the last run, and update the existing CSV files in place')
+    parser.add_argument('--events', nargs='+', choices=[name for name in eventExtractors if name in extractors], default=[], help='flat tables to extract with the streaming event backend, which builds no element trees, instead of the tree-based parser')
+    parser.add_argument('--columnar', choices=list(columnarFormats), help='also write typed, compressed Parquet or Arrow versions of the data files (requires pyarrow), to a sibling folder named for the format')
+    parser.add_argument('--dta', action='store_true', help='also write Stata .dta versions of the data files, typed and labeled as do/CA_TM_csv_cleanup.do would, to a sibling dta folder')
+    parser.add_argument('--batch-rows', type=int, default=10000, help='rows queued for each data file before they are written together (default: 10000)')
+    parser.add_argument('--compress', choices=list(compressSuffixes), help='compress the data files as they are written, in a writer thread (zstd requires the zstandard package); not used with --update, which rewrites the data files in place')
+    parser.add_argument('--codes', action='store_true', help=f'write the categorical columns listed in st96_fields.py (e.g. CurrStatus, EventDesc, PartyType) as integer codes, with a lookup table of their values ({codesFile})')
+    parser.add_argument('--store', action='store_true', help=f'parse into the record store ({storeFile}), in which newer records replace older versions of the same application, and export the CSV files from it; with --update, amend the existing store')
+    parser.add_argument('--recover', action='store_true', help=f'repair malformed XML where libxml2 can, and set aside records that cannot be extracted in {quarantineFile} in the target folder instead of ending the run')
+    parser.add_argument('--skip-unchanged', action='store_true', help=f'keep a digest of each record parsed ({digestFile}, in the target folder), and with --update skip the records whose content is unchanged since they were last parsed; other runs remove the digests, which they would leave out of date')
+    parser.add_argument('--changes', action='store_true', help=f'with --update, also write a change feed of the rows inserted, updated and deleted in each data file, to a {changesDir} folder in the target folder, in place of that of the last update')
+    parser.add_argument('--resume', action='store_true', help=f'carry on from the checkpoint of an interrupted run ({checkpointFile}, in the target folder), with the same options over the same collections; rows written after the checkpoint are dropped and parsed again')
+    parser.add_argument('--checkpoint-mb', type=float, default=256, help='in a single process, take checkpoints within collections larger than this many MB, after each chunk of this size, as well as after each collection (default: 256; 0 for collections only)')
+    parser.add_argument('--report', nargs='?', const=runReportFile, help=f'save a JSON report of the wall-clock and CPU time, bytes and records of each stage of the run (tokenize, extract, cleanup, write, merge...), in total and by collection, to this file in the target folder (default: {runReportFile}); timing every record slows the run a little')
+    parser.add_argument('--profile', metavar='COLLECTION', help='profile the parsing of one collection (e.g. 003) with cProfile and tracemalloc, saving its profile to a profiles folder beside the run report; implies --report')
+    return parser
+
+def main(args = None):
+
+    args = args or argumentParser().parse_args()
+
+    # set filepath variables
+
+    sourceDir = Path(ask(args.sourceDir, 'Provide full path of XML_raw folder:', 'sourceDir'))
+    rootDir = sourceDir.parent
+    parsePath = rootDir / 'csv' # output path for final execution
+    # parsePath = rootDir / 'test' # output path for testing
+    print(f'Root Directory: {rootDir.absolute()}')
+    print(f'Source Directory: {sourceDir.absolute()}')
+    print(f'Target Directory: {parsePath.absolute()}')
+    print('Finding XML Collections...')
+    parsePath.mkdir(exist_ok=True)
+
+    # with --report (or --profile), the stages of the run are timed (see run_report.py)
+
+    reportPath = parsePath / (args.report or runReportFile)
+    runReport = RunReport(args.profile, reportPath.parent / 'profiles') if args.report or args.profile else None
+
+    # build the list of xml files (or zip archives) for parsing, in collection order
+    sourceType = '.zip' if args.zips else '.xml'
+    sourceList = sorted(item for item in sourceDir.iterdir() if item.is_file() and item.suffix == sourceType)
+
+    print(f'{len(sourceList)} {"ZIP archives" if args.zips else "XML collections"} found. Parsing {len(args.tables)} tables...')
+
+    chunkSize = int(args.chunk_mb * 1024 * 1024)
+
+    # in an update, parse only the collections that are new or have changed since the last run,
+    # provided that every selected table's rows from the last run are recorded in the manifest
+
+    manifest = loadManifest(parsePath)
+    manifest.setdefault('stored', {})
+    outFiles = [extractors[name].outFile for name in args.tables]
+    if args.compress and args.update and not args.store:
+        print('An update rewrites the data files in place, so --compress is not used with --update. Writing uncompressed data files...')
+        args.compress = None
+    outPaths = {outFile: dataPath(parsePath, outFile, args.compress) for outFile in outFiles}
+    report = OutputReport()
+
+    # in dictionary-encoded runs, the codes already assigned are kept, so that they stay the same from run to run;
+    # an update of data files written with (or without) codes must be made with (or without) them
+
+    vocabulary = Vocabulary.load(parsePath / codesFile) if args.codes else None
+
+    # with --recover, records that cannot be extracted are quarantined rather than ending the run (see quarantine.py)
+
+    quarantinePath = parsePath / quarantineFile
+
+    # with --skip-unchanged, the digest of each record is kept, and updates skip the records whose digest is unchanged
+    # (see record_digest.py); the digests must match the data files, so runs without it remove them
+
+    digestPath = parsePath / digestFile
+    digestSettings = {'tables': sorted(args.tables), 'store': args.store}
+    if not args.skip_unchanged: dropDigests(parsePath)
+
+    # the tables to extract with the event backend; the record keys are too, where no tree is otherwise needed
+
+    eventNames = {name for name in args.events if name in args.tables}
+    if eventNames and eventNames == set(args.tables):
+        eventNames.add('keys')
+    elif eventNames and args.store:
+        print('The record store must start each record before its rows are written, so --events is used with --store only when every selected table uses it. Parsing with the tree-based parser...')
+        eventNames = set()
+    if eventNames and args.recover:
+        print('Malformed records are cut out of the stream and repaired by the tree-based parser, so --events is not used with --recover. Parsing with the tree-based parser...')
+        eventNames = set()
+    if eventNames and args.skip_unchanged:
+        print('The digest of each record is taken from its tree, so --events is not used with --skip-unchanged. Parsing with the tree-based parser...')
+        eventNames = set()
+
+    # with --store, parse into the record store in a single process and export from it
+
+    if args.store:
+        amending = args.update and parsePath.joinpath(storeFile).exists()
+        if amending:
+            sourceList = [filename for filename in sourceList if archiveChanged(manifest['stored'], filename)]
+            print(f'{len(sourceList)} collections are new or have changed since they were stored.')
+        else:
+            parsePath.joinpath(storeFile).unlink(missing_ok=True)
+            manifest['stored'] = {}
+        with ExitStack() as stack:
+            quarantine = stack.enter_context(Quarantine(quarantinePath, runReport)) if args.recover else None
+            unchanged = None
+            if args.skip_unchanged:
+                digests = stack.enter_context(DigestIndex(digestPath, digestSettings, fresh = not amending))
+                unchanged = UnchangedFilter(digests if amending else None, digests, [filename.name for filename in sourceList], runReport)
+            changes = ChangeFeed(tableHeaders(args.tables)) if args.changes and amending else None
+            for outFile, rows in storeCollections(sourceList, args.tables, parsePath, manifest, eventNames, args.compress, vocabulary, runReport, quarantine, unchanged, changes).items():
+                report.add(outFile, rows)
+            if unchanged is not None and amending and sourceList: print(f'{unchanged.skipped:,} records were unchanged since they were last parsed, and were skipped.')
+        if changes is not None:
+            printChanges(parsePath, changes.write(parsePath, [filename.name for filename in sourceList], st96_fields.tableCodes, vocabulary))
+        elif args.changes:
+            print('There is no earlier record store to compare with, so no change feed is written.')
+        saveCodes(parsePath, vocabulary, manifest)
+        saveManifest(parsePath, manifest)
+        report.print(outPaths)
+        if args.recover: printQuarantine(parsePath)
+        for outPath in outPaths.values():
+            print(f'Dataset {outPath.name} is now available in folder {parsePath.absolute()}')
+        if args.columnar: writeColumnar(args.tables, parsePath, args.columnar, args.compress, vocabulary, runReport)
+        if args.dta: writeStata(args.tables, parsePath, args.compress, vocabulary, runReport)
+        saveRunReport(runReport, reportPath, report, outPaths)
+        return
+
+    if args.update:
+        archives = manifest['archives']
+        if archives and manifest.get('codes', False) == args.codes and all(parsePath.joinpath(outFile).exists() for outFile in outFiles) \
+                and all(outFile in entry['outputs'] for entry in archives.values() for outFile in outFiles):
+            pending = [filename for filename in sourceList if archiveChanged(archives, filename)]
+            print(f'{len(pending)} of {len(sourceList)} collections are new or have changed since the last run.')
+            changes = ChangeFeed(tableHeaders(args.tables)) if args.changes else None
+            if pending:
+                with ExitStack() as stack:
+                    digests = stack.enter_context(DigestIndex(digestPath, digestSettings)) if args.skip_unchanged else None
+                    for outFile, rows in updateOutputs(pending, args.tables, sourceDir, parsePath, manifest, args.workers, chunkSize, eventNames, args.batch_rows, vocabulary, runReport, args.recover, digests, changes).items():
+                        if outFile in outPaths: report.add(outFile, rows)
+                report.print(outPaths) # the data files are rewritten, so all of their bytes are written
+                if args.recover: printQuarantine(parsePath)
+            # the rows of the data files are compared as written, so the change feed needs no encoding
+            if changes is not None: printChanges(parsePath, changes.write(parsePath, [filename.name for filename in pending]))
+            saveCodes(parsePath, vocabulary, manifest)
+            saveManifest(parsePath, manifest)
+            for name in args.tables:
+                print(f'Dataset {extractors[name].outFile} is now up to date in folder {parsePath.absolute()}')
+            if args.columnar: writeColumnar(args.tables, parsePath, args.columnar, vocabulary = vocabulary, runReport = runReport)
+            if args.dta: writeStata(args.tables, parsePath, vocabulary = vocabulary, runReport = runReport)
+            saveRunReport(runReport, reportPath, report, outPaths)
+            return
+        print('No manifest of a previous run covering the selected tables was found. Parsing all collections...')
+    if args.changes: print('A change feed is only written by an update of existing data files, so none is written by this run.')
+
+    manifest['archives'] = {}
+
+    # a full run takes checkpoints as it goes, from which it can be resumed (--resume) if it is
+    # interrupted (see checkpoint.py); the compressed data files of a single process cannot be
+    # cut back to a checkpoint, so such runs take none
+
+    checkpointSize = int(args.checkpoint_mb * 1024 * 1024)
+    checkpoint = None
+    if args.workers > 1 or not args.compress:
+        settings = runSettings(sourceList, tables = args.tables, events = sorted(eventNames), parallel = args.workers > 1, chunkSize = chunkSize if args.workers > 1 else checkpointSize, compress = args.compress, codes = args.codes, recover = args.recover, skipUnchanged = args.skip_unchanged)
+        checkpoint = Checkpoint.start(parsePath, settings, args.resume)
+        checkpoint.restore(vocabulary)
+    elif args.resume:
+        print('Compressed data files written in a single process cannot be cut back to a checkpoint, so this run takes no checkpoints. Starting over...')
+
+    # a full run records the digest of every record (those of a resumed run's checkpoint are kept)
+
+    digests = DigestIndex(digestPath, digestSettings, fresh = checkpoint is None or not checkpoint.resumed) if args.skip_unchanged else None
+
+    if args.workers > 1:
+
+        # split large collections into chunks aligned on TrademarkBag start tags
+
+        workUnits = splitWork(sourceList, chunkSize)
+
+        # dispatch each collection or chunk to a worker process; merge the shards in collection order
+
+        shardDir = parsePath / 'shards'
+        shardDir.mkdir(exist_ok=True)
+        records, checksums, rows = parseShards(workUnits, args.tables, shardDir, args.workers, eventNames, args.batch_rows, args.compress, runReport, checkpoint, args.recover, (None, ()) if digests is not None else None)
+        rows.pop(recordDigests.outFile, None)
+        for outFile, number in rows.items(): report.add(outFile, number)
+        print('Merging shards...')
+        for archive, outputs in mergeShards(workUnits, args.tables, shardDir, parsePath, compress = args.compress, vocabulary = vocabulary, runReport = runReport, checkpoint = checkpoint).items():
+            # the byte ranges of compressed files cannot be rewritten by an update, so they are not recorded
+            manifest['archives'][archive] = archiveEntry(sourceDir / archive, checksums[archive], records[archive], {} if args.compress else outputs)
+        if args.recover: mergeQuarantine(workUnits, shardDir, parsePath)
+        if digests is not None: loadDigests(digests, workUnits, shardDir, runReport)
+        shardDir.rmdir()
+
+    else:
+
+        with ExitStack() as stack:
+
+            # create a container csv file and a batched CSV output object for each table; pass each its label row
+            # (in a resumed run, cut each file back to its length at the checkpoint and append to it instead)
+
+            resuming = checkpoint is not None and bool(checkpoint.lengths())
+            tables = []
+            newfiles = []
+            for name in args.tables:
+                extractor = tableFor(name, eventNames)
+                if resuming:
+                    truncateFile(outPaths[extractor.outFile], checkpoint.lengths()[extractor.outFile])
+                    newfile = stack.enter_context(openOutput(outPaths[extractor.outFile], 'a', args.compress))
+                    fileWriter = BatchWriter(newfile, args.batch_rows, runReport = runReport)
+                else:
+                    newfile = stack.enter_context(openOutput(outPaths[extractor.outFile], 'w', args.compress))
+                    fileWriter = BatchWriter(newfile, args.batch_rows, extractor.headerRow, runReport)
+                stack.callback(fileWriter.writeBatch) # the last batch is written before the file is closed
+                tables.append((extractor, codedWriter(fileWriter, extractor, vocabulary)))
+                newfiles.append((extractor.outFile, fileWriter))
+            # the quarantine is checkpointed with the data files, so that it too is cut back on resuming
+            quarantine = None
+            checkpointFiles = newfiles
+            if args.recover:
+                if resuming: truncateFile(quarantinePath, checkpoint.lengths()[quarantineFile])
+                quarantine = stack.enter_context(Quarantine(quarantinePath, runReport, append = resuming))
+                checkpointFiles = newfiles + [(quarantineFile, quarantine)]
+            if checkpoint is not None and not resuming:
+                checkpoint.begin(syncFiles(checkpointFiles)) # the label rows
+            # the digests are recorded as each chunk's rows are committed
+            unchanged = UnchangedFilter(None, digests, runReport = runReport) if digests is not None else None
+
+            # loop over concatenated XML collections
+            for filename in tqdm(
+                sourceList,
+                total=len(sourceList),
+                ncols=100,
+                desc='Total Progress',
+                position=0,
+                leave=True,
+                unit='archive'
+            ):
+                # a collection parsed before the run was interrupted is not parsed again
+                progress = checkpoint.collection(filename) if checkpoint is not None else None
+                if progress is not None and progress['entry'] is not None:
+                    manifest['archives'][filename.name] = progress['entry']
+                    continue
+
+                # count the number of records to be parsed
+                counter = countRecords(filename)
+
+                # note where the collection's rows start and end in each file, for the manifest
+                # (the byte ranges of compressed files cannot be rewritten by an update, so they are not recorded)
+                if args.compress:
+                    records = parseCollection(filename, tables, counter, f'{filename.stem[-3:]} of {len(sourceList)}', runReport = runReport, quarantine = quarantine, unchanged = unchanged)
+                    if digests is not None: digests.flush()
+                    outputs = {}
+                else:
+                    # parse the collection a chunk at a time (all at once, if it is no larger than --checkpoint-mb),
+                    # taking a checkpoint after each chunk; the chunks done before an interruption are skipped
+                    if progress['starts'] is None: progress['starts'] = filePositions(newfiles)
+                    for filename, chunk in splitWork([filename], checkpointSize):
+                        if checkpoint.chunkDone(filename, chunk): continue
+                        records = parseCollection(filename, tables, chunkRecords(filename, chunk, counter), f'{filename.stem[-3:]} of {len(sourceList)}', chunk = chunk, runReport = runReport, quarantine = quarantine, unchanged = unchanged)
+                        checkpoint.commit(filename, chunk, records, syncFiles(checkpointFiles), vocabulary)
+                        if digests is not None: digests.flush()
+                    records = progress['records']
+                    ends = filePositions(newfiles)
+                    outputs = {outFile: [progress['starts'][outFile], ends[outFile]] for outFile in ends}
+                with timing(runReport, 'checksum', filename.name, bytes = filename.stat().st_size):
+                    checksum = fileChecksum(filename)
+                manifest['archives'][filename.name] = archiveEntry(filename, checksum, records, outputs)
+                if checkpoint is not None: checkpoint.finish(filename, manifest['archives'][filename.name])
+
+        for outFile, fileWriter in newfiles: report.add(outFile, fileWriter.rows)
+
+    if digests is not None: digests.close()
+    saveCodes(parsePath, vocabulary, manifest)
+    saveManifest(parsePath, manifest)
+    if checkpoint is not None: checkpoint.remove() # the run is complete
+
+    report.print(outPaths)
+    if args.recover: printQuarantine(parsePath)
+    for outPath in outPaths.values():
+        print(f'Dataset {outPath.name} is now available in folder {parsePath.absolute()}')
+    if args.columnar: writeColumnar(args.tables, parsePath, args.columnar, args.compress, vocabulary, runReport)
+    if args.dta: writeStata(args.tables, parsePath, args.compress, vocabulary, runReport)
+    saveRunReport(runReport, reportPath, report, outPaths)
+
+if __name__ == "__main__": main()
@@ -7,238 +7,191 @@
 # To be executed after CIPO-Canada's IP Horizons Trademark Bulk Data has been 
 # downloaded and processed using sftp-secure.py
 
+import argparse
 import os
 from tqdm import tqdm
 import csv
 import lxml
 from lxml import etree
 from pathlib import Path
-
-def main():
-
-### namespace map for the xml parser
-    ns_dict = {
-        'catmk' : "http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Trademark",
-        'com' : "http://www.wipo.int/standards/XMLSchema/ST96/Common",
-        'cacom' : "http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Common",
-        'tmk' : "http://www.wipo.int/standards/XMLSchema/ST96/Trademark" 
-    }
-      
-### Dictionaries of a series of fields for the parser to search at various levels of the XML hierarchy
-
-    # Root-level Tags:
-
-    tagNeeds = {
-        'AppNo':            etree.XPath('.//tmk:Trademark/com:ApplicationNumber/com:ST13ApplicationNumber/text()', namespaces=ns_dict, smart_strings=False),
-        'ExtNo':            etree.XPath('.//tmk:Trademark/com:ApplicationNumber/com:ST13ApplicationNumber/text()', namespaces=ns_dict, smart_strings=False),
-        'EventBag':         etree.XPath('.//tmk:MarkEvent', namespaces=ns_dict, smart_strings=False),
-        'FootnoteBag':      etree.XPath('.//catmk:Footnote', namespaces=ns_dict, smart_strings=False),
-        'CancelBag':        etree.XPath('.//tmk:CancellationProceedings', namespaces=ns_dict, smart_strings=False),  
-        'OppBag':           etree.XPath('.//tmk:OppositionProceedingBag', namespaces=ns_dict, smart_strings=False)
-    }
-
-    # Tags to search within the OppositionProceedingBag Tag, one level down from root:
-
-    FootnoteTags = {
-        'EventCode':        etree.XPath('.//cacom:CategoryCode/text()', namespaces=ns_dict, smart_strings=False),
-        'EventDesc':        etree.XPath('.//cacom:CategoryDescription/text()', namespaces=ns_dict, smart_strings=False),
-        'FilingDate':       etree.XPath('.//cacom:RegisteredDate/text()', namespaces=ns_dict, smart_strings=False),
-        'EventDate':        etree.XPath('.//cacom:ChangedDate/text()', namespaces=ns_dict, smart_strings=False)
-    }
-    
-    OppTags = {
-        'EventType':        etree.XPath('.//catmk:OppositionCaseTypeDescription[@com:languageCode="en"]/text()', namespaces=ns_dict, smart_strings=False),
-        'ProceedingSeq':    etree.XPath('.//com:OppositionIdentifier/text()', namespaces=ns_dict, smart_strings=False),
-        'FilingDate':       etree.XPath('.//com:OppositionDate/text()', namespaces=ns_dict, smart_strings=False),
-        'ProceedingStage':  etree.XPath('.//catmk:ProceedingStage', namespaces=ns_dict, smart_strings=False)
-    }
-
-    # Tags to search within the CancellationProceedings Tag, one level down from root
-    # (note: the CIPO data dictionary has some mistakes here)
-
-    CancelTags = {
-        'EventType':        etree.XPath('.//catmk:OppositionCaseTypeDescription[@com:languageCode="en"]/text()', namespaces=ns_dict, smart_strings=False),
-        'ProceedingSeq':    etree.XPath('.//tmk:LegalProceedingIdentifier/text()', namespaces=ns_dict, smart_strings=False),
-        'FilingDate':       etree.XPath('.//tmk:LegalProceedingFilingDate/text()', namespaces=ns_dict, smart_strings=False),
-        'ProceedingStage':  etree.XPath('.//catmk:ProceedingStage', namespaces=ns_dict, smart_strings=False)
-
-    }
-
-    # Proceeding Stage tags: two levels down from root, within the Opposition or Cancellation bags
-    
-    stageTags = {
-        'StageCode':        etree.XPath('.//catmk:ProceedingStageCode/text()', namespaces=ns_dict, smart_strings=False),
-        'StageDesc':        etree.XPath('.//catmk:ProceedingStageDescriptionText[@com:languageCode="en"]/text()',namespaces=ns_dict, smart_strings=False),
-        'StageEvents':      etree.XPath('.//tmk:ProceedingEvent', namespaces=ns_dict, smart_strings=False)
-    }
-
-    # Event data: Either lifecycle events one level down from root 
-    # or proceeding events three levels down from root
+from xml_sources import countRecords
+from canada_tm import ask
+from record_iter import trackRecords
+import st96_fields
+
+# the dictionaries of destination data fields and associated XPath expressions for which data will be extracted,
+# compiled once in the shared registry (st96_fields.py)
+
+tagNeeds = st96_fields.allevents.tagNeeds
+FootnoteTags = st96_fields.allevents.FootnoteTags
+OppTags = st96_fields.allevents.OppTags
+CancelTags = st96_fields.allevents.CancelTags
+stageTags = st96_fields.allevents.stageTags
+eventTags = st96_fields.allevents.eventTags
+
+# a list of fields for which no further recursive searching will be needed:
+
+textFields = [
+    'EventType',
+    'ProceedingSeq', 
+    'FilingDate', 
+    'StageCode',
+    'StageDesc',
+    'EventCode',
+    'EventDesc',
+    'EventDate'
+]
+
+# a dictionary of fields that trigger a recursive search one level down the hierarchy,  
+# mapped to the dictionary of fields to be searched within the recursive loop
+
+recursives = {
+    'OppBag':           OppTags,
+    'CancelBag':        CancelTags,
+    'ProceedingStage':  stageTags,
+    'StageEvents':      eventTags
+}
+
+# Lay out a label row for the CSV file
+
+headerRow = [
+    'AppNo',
+    'ExtNo',
+    'EventType',
+    'ProceedingSeq',
+    'FilingDate',
+    'StageCode',
+    'StageDesc',
+    'EventCode', 
+    'EventDesc', 
+    'EventDate'
+]
+
+outFile = 'CA_TM_allevents.csv'
+
+def getData(elem, writeobject, tagDict, stem = {}):
+    ''' Recursively pulls and processes the data for the CA_TM_allevents.csv file 
+    from the iterparse context using the dictionaries of tags of interest
+    '''
+    def printIt(rowdata, writeobject = writeobject, headerRow = headerRow, stem = stem):
+        writeobject.writerow([rowdata.get(field) or '' for field in headerRow]) # blank where a field is not found
+
+    # create boolean variable to determine whether further recursion is needed
+    lastlayer = True
+
+    # initialize containers for parsed data
+    rowdata = stem
     
-    eventTags = {
-        'EventCode':        etree.XPath('.//tmk:MarkEventCode/text()', namespaces=ns_dict, smart_strings=False),
-        'EventDesc':        etree.XPath('.//tmk:MarkEventDescriptionText/text()', namespaces=ns_dict, smart_strings=False),
-        'EventDate':        etree.XPath('.//tmk:MarkEventDate/text()', namespaces=ns_dict, smart_strings=False)
-    }
-    
-    # a list of fields for which no further recursive searching will be needed:
-
-    textFields = [
-        'EventType',
-        'ProceedingSeq', 
-        'FilingDate', 
-        'StageCode',
-        'StageDesc',
-        'EventCode',
-        'EventDesc',
-        'EventDate'
-    ]
-
-    # a dictionary of fields that trigger a recursive search one level down the hierarchy,  
-    # mapped to the dictionary of fields to be searched within the recursive loop
-
-    recursives = {
-        'OppBag':           OppTags,
-        'CancelBag':        CancelTags,
-        'ProceedingStage':  stageTags,
-        'StageEvents':      eventTags
-    }
+    # search through the active tag dictionary
 
-    def fast_iter(context, func, writeobject, count=0, loop='Parsing', tagDict = {}, stem = {}, quiet = False):
-        '''a fast iterating parser script for large XML files, 
-        from https://www.ibm.com/developerworks/xml/library/x-hiperfparse/
-        as revised in https://stackoverflow.com/questions/7171140/using-python-iterparse-for-large-xml-files/7171543#7171543
-        '''
-        for event, elem in tqdm( # initializes the progress bar 
-            context, 
-            ncols=100, 
-            total = count, 
-            desc=f'Parsing collection {loop}',
-            unit=' records',
-            disable = quiet
-        ): 
-            func(elem, writeobject, tagDict, stem) # passes the parser context, the search fields, and any already-parsed data to the data-extraction function
-            elem.clear() # clears the processed data from memory after parsing
-            for ancestor in elem.xpath('ancestor-or-self::*'): # clears everything below the root tag of the processed data from memory
-                while ancestor.getprevious() is not None: 
-                    del ancestor.getparent()[0]
-        del context # clears the parsed event from memory
-
-    def getData(elem, writeobject, tagDict, stem = {}):
-        ''' Recursively pulls and processes the data for the CA_TM_allevents.csv file 
-        from the iterparse context using the dictionaries of tags of interest
-        '''
-        def printIt(rowdata, writeobject = writeobject, headerRow = headerRow, stem = stem):
-            thisRow = []
-            for field in headerRow:
-                foundData = rowdata.get(field)
-                if foundData:
-                    thisRow.append(foundData)
-                else: thisRow.append('')
-            writeobject.writerow(thisRow)
-
-        # create boolean variable to determine whether further recursion is needed
-        lastlayer = True
-
-        # initialize containers for parsed data
-        rowdata = stem
+    for field, searchPath in tagDict.items():
         
-        # search through the active tag dictionary
+        foundIt = searchPath(elem)
 
-        for field, searchPath in tagDict.items():
+        # pull the Application Number and Serial Number for each Record:
+        
+        if field == 'AppNo': 
             
-            foundIt = searchPath(elem)
-
-            # pull the Application Number and Serial Number for each Record:
+            lastlayer = False
+            rowdata = {field: searchPath(elem)[0][-9:-2]}
+        
+        elif field == 'ExtNo':
             
-            if field == 'AppNo': 
-                
-                lastlayer = False
-                rowdata = {field: searchPath(elem)[0][-9:-2]}
+            lastlayer = False
+            rowdata[field] = searchPath(elem)[0][-2:]
             
-            elif field == 'ExtNo':
-                
-                lastlayer = False
-                rowdata[field] = searchPath(elem)[0][-2:]
-                
-            # for non-adversarial events: populate unneeded fields with blank strings
-            # before recursively searching for event data:
+        # for non-adversarial events: populate unneeded fields with blank strings
+        # before recursively searching for event data:
+        
+        elif field == 'FootnoteBag':
             
-            elif field == 'FootnoteBag':
-                
-                lastlayer = False
-                rowdata['EventType'] = "Amendment"
-                for i in range(3, 6):
-                    rowdata[i] = ''
+            lastlayer = False
+            rowdata['EventType'] = "Amendment"
+            for i in range(3, 6):
+                rowdata[i] = ''
 
-                for result in foundIt:
-                    getData(result, writeobject, tagDict = FootnoteTags, stem = rowdata)
+            for result in foundIt:
+                getData(result, writeobject, tagDict = FootnoteTags, stem = rowdata)
 
-            # for footnote (registration amendment) events: populate unneeded fields with blank strings
-            # before recursively searching for event data:
-            elif field == 'EventBag':
-                
-                lastlayer = False
-                rowdata['EventType'] = 'Office Action'
-                for i in range(3, 6):
-                    rowdata[i] = ''
-                
-                # Build an iterative parser object from the current element; 
-                # pass it back into the parser function:
+        # for footnote (registration amendment) events: populate unneeded fields with blank strings
+        # before recursively searching for event data:
+        elif field == 'EventBag':
+            
+            lastlayer = False
+            rowdata['EventType'] = 'Office Action'
+            for i in range(3, 6):
+                rowdata[i] = ''
+            
+            # Build an iterative parser object from the current element; 
+            # pass it back into the parser function:
 
-                for result in foundIt:
-                    getData(result, writeobject, tagDict = eventTags, stem = rowdata)
+            for result in foundIt:
+                getData(result, writeobject, tagDict = eventTags, stem = rowdata)
 
-            # pull text fields for each record at the current level of the XML hierarchy
+        # pull text fields for each record at the current level of the XML hierarchy
+        
+        elif field in textFields:
+            if foundIt:
+                for result in foundIt:
+                    # keep running value for event date 
+                    # to fill empty date fields per CIPO definitions
+                    if field == 'EventDate':
+                        if foundIt: currentDate = result
+                        else: 
+                            if rowdata['EventType'] == 'Amendment':
+                                rowdata['EventDate'] = rowdata['FilingDate']
+                            else:
+                                result = currentDate
+                    rowdata[field] = result
+            else: 
+                rowdata[field] = ''
+
+        # recursively search fields that have sub-fields of interest
+        # by parsing them as separate etree elements and feeding them 
+        # back into the fast_iter function
+
+        elif field in recursives.keys():
+            lastlayer = False
             
-            elif field in textFields:
-                if foundIt:
-                    for result in foundIt:
-                        # keep running value for event date 
-                        # to fill empty date fields per CIPO definitions
-                        if field == 'EventDate':
-                            if foundIt: currentDate = result
-                            else: 
-                                if rowdata['EventType'] == 'Amendment':
-                                    rowdata['EventDate'] = rowdata['FilingDate']
-                                else:
-                                    result = currentDate
-                        rowdata[field] = result
-                else: 
-                    rowdata[field] = ''
-
-            # recursively search fields that have sub-fields of interest
-            # by parsing them as separate etree elements and feeding them 
-            # back into the fast_iter function
-
-            elif field in recursives.keys():
-                lastlayer = False
-                
-                if foundIt:
-                    for result in foundIt:
-                        getData(result, writeobject, tagDict = recursives.get(field), stem = rowdata)
+            if foundIt:
+                for result in foundIt:
+                    getData(result, writeobject, tagDict = recursives.get(field), stem = rowdata)
 
-        # When there are no further recursive loops, check for event data
-        # If present, write to the CSV file
-        if lastlayer == True and len(rowdata) > 2:
-            
-            printIt(rowdata)
+    # When there are no further recursive loops, check for event data
+    # If present, write to the CSV file
+    if lastlayer == True and len(rowdata) > 2:
+        
+        printIt(rowdata)
+
+def extract(elem, writeobject):
+    '''single-record entry point shared with the combined extractor in iterparse_all.py:
+    starts the recursive search at the root-level tags of one TrademarkBag
+    '''
+    getData(elem, writeobject, tagNeeds)
+
+def argumentParser():
+    '''the command-line options of iterparse_allevents.py'''
+    parser = argparse.ArgumentParser(description=f'Extract the Canada Trademarks Dataset file {outFile} from the XML collections.')
+    parser.add_argument('sourceDir', nargs='?', help='full path of XML_raw folder (prompted for if omitted)')
+    return parser
+
+def main(args = None):
 
-    def countEm(archive):
-        '''a counter to determine the number of records in each collection 
-        by counting the files in the folder from which the collection was built
+    args = args or argumentParser().parse_args()
+
+    def fast_iter(context, func, writeobject, count=0, loop='Parsing', tagDict = {}, stem = {}, quiet = False):
+        '''a fast iterating parser script for large XML files, 
+        from https://www.ibm.com/developerworks/xml/library/x-hiperfparse/
+        as revised in https://stackoverflow.com/questions/7171140/using-python-iterparse-for-large-xml-files/7171543#7171543
         '''
-        fileCount = 0
-        for foldername in sourceDir.iterdir():
-            if foldername.name.endswith(archive):
-                for f in foldername.iterdir(): 
-                    if f.suffix == '.xml': fileCount += 1
-                break
-        return fileCount
-    
+        for elem in trackRecords(context, count, loop, quiet): # releases each record from memory once it is processed
+            func(elem, writeobject, tagDict, stem) # passes the parser context, the search fields, and any already-parsed data to the data-extraction function
+        del context # clears the parsed event from memory
+
+
     # set filepath variables; create a CSV file to receive parsed data
 
-    sourceDir = Path(input('Provide full path of XML_raw folder:'))
+    sourceDir = Path(ask(args.sourceDir, 'Provide full path of XML_raw folder:', 'sourceDir'))
     rootDir = sourceDir.parent
     parsePath = rootDir / 'csv' # output path for final execution
     # parsePath = rootDir / 'test' # output path for testing
@@ -252,23 +205,10 @@ def main():
     # create a container csv file to receive parsed data; 
     # create a CSV output object to pass data to the new file    
 
-    with parsePath.joinpath('CA_TM_allevents.csv').open('w', newline='', encoding='UTF-8')  as newfile:
+    with parsePath.joinpath(outFile).open('w', newline='', encoding='UTF-8')  as newfile:
         fileWriter = csv.writer(newfile, delimiter = '\t')
-        
-    # Create a label row for the CSV file; pass it to the new file
-    
-        headerRow = [
-            'AppNo',
-            'ExtNo',
-            'EventType',
-            'ProceedingSeq',
-            'FilingDate',
-            'StageCode',
-            'StageDesc',
-            'EventCode', 
-            'EventDesc', 
-            'EventDate'
-        ]
+
+        # feed in the row of column header labels
 
         fileWriter.writerow(headerRow) 
     
@@ -294,12 +234,12 @@ def main():
                 record = etree.iterparse(infile, events = ('end',), tag = (f'{{http://www.wipo.int/standards/XMLSchema/ST96/Trademark}}TrademarkBag'))
                 
                 # count the number of records to be parsed
-                counter = countEm(filename.name[0:3])
+                counter = countRecords(filename)
                 
                 #run the parser!
                 
                 fast_iter(record, getData, fileWriter, counter, f'{filename.name[0:3]} of {len(sourceList)}', tagNeeds, quiet = False)
                 
-    print(f'Dataset CA_TM_allevents.csv is now available in folder {parsePath.absolute()}')
+    print(f'Dataset {outFile} is now available in folder {parsePath.absolute()}')
    
 if __name__ == "__main__": main()
\ No newline at end of file
@@ -7,92 +7,83 @@
 # To be executed after CIPO-Canada's IP Horizons Trademark Bulk Data has been 
 # downloaded and processed using sftp-secure.py
 
+import argparse
 import os
 from tqdm import tqdm
 import csv
 import lxml
 from lxml import etree
 from pathlib import Path
+from xml_sources import countRecords
+from canada_tm import ask
+from record_iter import trackRecords
+import st96_fields
 
-def main():
+# the dictionary of destination data fields and associated XPath expressions for which data will be extracted,
+# compiled once in the shared registry (st96_fields.py)
+
+tagNeeds = st96_fields.classes.tagNeeds
+eventNeeds = st96_fields.classes.eventNeeds # the same fields for the streaming event backend (event_extract.py)
+
+# Create the label row and destination file for the CSV output
+
+headerRow = ['AppNo', 'ExtNo']
+for i in range(1, 46):
+    headerRow.append(f'IC{i}')
+
+outFile = 'CA_TM_classes.csv'
+
+def getData(elem, writeobject, tagDict = tagNeeds):
+    ''' Pull and process the data for the classes.csv file 
+    using the tagNeeds XPath dictionary defined above 
+    (or, for the event backend, eventNeeds and the results gathered for the record in place of elem)
+    '''
+    # initialize list to capture parsed data and separate list for international classes found
+    rowdata = ['' for x in range(1, 48)]
+    classificationValues = []
+    # extract Class numbers; destring; report results
+    for field, searchPath in tagDict.items():
+        foundIt = searchPath(elem)
+        if foundIt:
+            if field == 'AppNo': rowdata[0]=foundIt[0][-9:-2]
+            elif field == 'ExtNo': rowdata[1]=foundIt[0][-2:]
+            elif field == 'Classes':
+                for number in foundIt:
+                    classificationValues.append(number)
+                    classificationValues = list(map(int, classificationValues)) 
+                    for i in range(1, 46):
+                        rowdata[i+1]= 1 if i in classificationValues else 0
+        else:
+            continue
+    # print(rowdata) # un-comment for verbose parsing
+    writeobject.writerow(rowdata)
+
+# single-record entry point shared with the combined extractor in iterparse_all.py
+
+extract = getData
+
+def argumentParser():
+    '''the command-line options of iterparse_classes.py'''
+    parser = argparse.ArgumentParser(description=f'Extract the Canada Trademarks Dataset file {outFile} from the XML collections.')
+    parser.add_argument('sourceDir', nargs='?', help='full path of XML_raw folder (prompted for if omitted)')
+    return parser
+
+def main(args = None):
+
+    args = args or argumentParser().parse_args()
 
     def fast_iter(context, func, count, loop, writeobject):
         '''a fast iterating parser script for large XML files, 
         from https://www.ibm.com/developerworks/xml/library/x-hiperfparse/
         as revised in https://stackoverflow.com/questions/7171140/using-python-iterparse-for-large-xml-files/7171543#7171543
         '''
-        for event, elem in tqdm(
-            context, 
-            ncols=100, 
-            total = count, 
-            desc=f'Parsing collection {loop}',
-            unit=' records'
-        ):       
+        for elem in trackRecords(context, count, loop): # releases each record from memory once it is processed
             func(elem, writeobject)
-            elem.clear() # clears the processed data from memory
-            for ancestor in elem.xpath('ancestor-or-self::*'): # clears everything below the root tag of the processed data from memory
-                while ancestor.getprevious() is not None: #clears parent tags of the processed data
-                    del ancestor.getparent()[0]
-                if ancestor.getprevious() is None: #clears siblings of the processed data
-                    for x in ancestor.iterchildren(): del x
         del context # clears the parsed event from memory
     
-    def getData(elem, writeobject):
-        ''' Pull and process the data for the classes.csv file 
-        using the tagNeeds XPath dictionary defined above 
-        '''
-        # initialize list to capture parsed data and separate list for international classes found
-        rowdata = ['' for x in range(1, 48)]
-        classificationValues = []
-        # extract Class numbers; destring; report results
-        for field, searchPath in tagNeeds.items():
-            foundIt = searchPath(elem)
-            if foundIt:
-                if field == 'AppNo': rowdata[0]=foundIt[0][-9:-2]
-                elif field == 'ExtNo': rowdata[1]=foundIt[0][-2:]
-                elif field == 'Classes':
-                    for number in foundIt:
-                        classificationValues.append(number)
-                        classificationValues = list(map(int, classificationValues)) 
-                        for i in range(1, 46):
-                            rowdata[i+1]= 1 if i in classificationValues else 0
-            else:
-                continue
-        # print(rowdata) # un-comment for verbose parsing
-        writeobject.writerow(rowdata)
-
-    def countEm(archive):
-        '''a counter to determine the number of records in each collection 
-        by counting the files in the folder from which the collection was built
-        '''
-        fileCount = 0
-        for foldername in sourceDir.iterdir():
-            if foldername.name.endswith(archive):
-                for f in foldername.iterdir(): 
-                    if f.suffix == '.xml': fileCount += 1
-                break
-        return fileCount
-    
-    # create an xml namespace dictionary for the parser
-    
-    ns_dict = {
-        'catmk' : "http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Trademark",
-        'com' : "http://www.wipo.int/standards/XMLSchema/ST96/Common",
-        'cacom' : "http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Common",
-        'tmk' : "http://www.wipo.int/standards/XMLSchema/ST96/Trademark" 
-    }
-
-    # Create a dictionary of destination data fields and associated XPath expressions for which data will be extracted
-    
-    tagNeeds = {
-        'AppNo':    etree.XPath('.//tmk:Trademark/com:ApplicationNumber/com:ST13ApplicationNumber/text()', namespaces = ns_dict, smart_strings=False),
-        'ExtNo': etree.XPath('.//tmk:Trademark/com:ApplicationNumber/com:ST13ApplicationNumber/text()', namespaces = ns_dict, smart_strings=False),
-        'Classes':  etree.XPath('.//tmk:GoodsServicesClassification/tmk:ClassNumber/text()', namespaces = ns_dict, smart_strings=False)
-    }
-    
     # set filepath variables; create a CSV file to receive parsed data
 
-    sourceDir = Path(input('Provide full path of XML_raw folder:'))
+    sourceDir = Path(ask(args.sourceDir, 'Provide full path of XML_raw folder:', 'sourceDir'))
     rootDir = sourceDir.parent
     parsePath = rootDir / 'csv' # output path for final execution
     # parsePath = rootDir / 'test' # output path for testing
@@ -102,16 +93,10 @@ def main():
     print('Finding XML Collections...')
     parsePath.mkdir(exist_ok=True)
     sourceList = []
-
-    # Create the label row for the CSV file
-
-    headerRow = ['AppNo', 'ExtNo']
-    for i in range(1, 46):
-        headerRow.append(f'IC{i}')
         
     # create a container csv file to receive parsed data; 
     # create a CSV output object to pass data to the new file; pass it the label row
-    with parsePath.joinpath('CA_TM_classes.csv').open('w', newline='', encoding='UTF-8') as newfile:
+    with parsePath.joinpath(outFile).open('w', newline='', encoding='UTF-8') as newfile:
         fileWriter = csv.writer(newfile, delimiter = '\t')
         fileWriter.writerow(headerRow)
             
@@ -136,12 +121,12 @@ def main():
                 record = etree.iterparse(infile, events=('end',), tag = f'{{http://www.wipo.int/standards/XMLSchema/ST96/Trademark}}TrademarkBag')
                 
                 # count the number of records to be parsed
-                counter = countEm(filename.name[0:3])
+                counter = countRecords(filename)
                             
                 #run the parser!
 
                 fast_iter(record, getData, counter, f'{filename.name[0:3]} of {len(sourceList)}', fileWriter)
                 #print(f'Parsing of {filename} complete!')
-    print(f'Dataset CA_TM_classes.csv is now available in folder {parsePath.absolute()}')
+    print(f'Dataset {outFile} is now available in folder {parsePath.absolute()}')
    
 if __name__ == "__main__": main()
\ No newline at end of file
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A pipelined build of the Canada Trademarks Dataset, from CIPO's SFTP server to the data files:
+# the download, unzip, split and parse stages run at once, in threads joined by bounded queues,
+# and the data files are those iterparse_all.py --zips would write. Also python canada_tm.py pipeline.
+
+import argparse
+from contextlib import ExitStack
+import queue
+import threading
+import time
+from tqdm import tqdm
+from lxml import etree
+from pathlib import Path
+from zipfile import ZipFile
+
+from record_iter import bagTagName
+from run_report import RunReport
+from xml_sources import closeString, openString, recordBody, zipMembers
+from csv_out import BatchWriter, OutputReport, Vocabulary, codesFile, compressSuffixes, dataPath, openOutput
+from update_manifest import loadManifest, saveManifest, fileChecksum, archiveEntry
+from quarantine import Quarantine, quarantineFile, recoverRecords
+from record_digest import dropDigests
+from canada_tm import ask
+from sftp_download import downloadArchives
+from sftp_secure import listArchives, remoteDir, sftpHost, signIn
+from iterparse_all import extractors, codedWriter, fast_iter, filePositions, printQuarantine, saveCodes, saveRunReport, tableFor
+
+pipelineReportFile = 'CA_TM_pipeline_report.json' # the run report of the pipeline, in the csv folder
+blockSize = 1024 * 1024 # bytes of records in each block passed from the split stage to the parse stage
+
+class Stopped(Exception):
+    '''raised in a stage of the pipeline when another stage has failed'''
+
+class StageQueue:
+    '''a bounded queue between two stages of the pipeline, which records its depth as items are put
+    on it; the time a stage spends waiting to put an item on it while it is full (held back by the
+    next stage) or to get one while it is empty (starved by the last) is timed as a stage of
+    runReport, named for the queue, e.g. "blocks queue full"
+    '''
+    def __init__(self, name, size, stopped, runReport):
+        self.name = name
+        self.size = size
+        self.queue = queue.Queue(size)
+        self.stopped = stopped
+        self.runReport = runReport
+        self.lock = threading.Lock()
+        self.items = 0
+        self.depths = 0 # the sum of the depths of the queue after each put
+        self.peak = 0
+
+    def wait(self, operation, *args):
+        '''repeat a blocking put or get until it succeeds, unless the pipeline is stopped meanwhile'''
+        while True:
+            try:
+                return operation(*args, timeout = 0.5)
+            except (queue.Full, queue.Empty):
+                if self.stopped.is_set(): raise Stopped() from None
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            with self.runReport.stage(f'{self.name} queue full'):
+                self.wait(self.queue.put, item)
+        depth = self.queue.qsize()
+        with self.lock:
+            self.items += 1
+            self.depths += depth
+            self.peak = max(self.peak, depth)
+
+    def get(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            with self.runReport.stage(f'{self.name} queue empty'):
+                return self.wait(self.queue.get)
+
+    def summary(self):
+        return {'size': self.size, 'items': self.items, 'meanDepth': self.depths / max(self.items, 1), 'peakDepth': self.peak}
+
+class Pipeline:
+    '''the queues and stage threads of a run; a stage that fails stops the others, and its error
+    is raised again in the calling thread by finish()
+    '''
+    def __init__(self, runReport, queueSizes):
+        self.runReport = runReport
+        self.stopped = threading.Event()
+        self.errors = []
+        self.threads = []
+        self.queues = {name: StageQueue(name, size, self.stopped, runReport) for name, size in queueSizes.items()}
+
+    def start(self, name, target, *args):
+        '''run target(*args) as a stage, in a thread of its own'''
+        def run():
+            try:
+                target(*args)
+            except Stopped:
+                pass
+            except BaseException as error:
+                self.errors.append(error)
+                self.stopped.set()
+        thread = threading.Thread(target = run, name = name, daemon = True)
+        self.threads.append(thread)
+        thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def finish(self):
+        '''wait for the stage threads to end; raise the error of any that failed'''
+        for thread in self.threads:
+            thread.join()
+        if self.errors: raise self.errors[0]
+
+def downloadStage(pipeline, connect, remoteDir, archiveNames, targetDir, connections):
+    '''download the archives into targetDir over up to connections SFTP connections, putting each
+    on the archives queue once it and every archive before it have arrived; a download thread
+    waiting on a full queue starts no further download
+    '''
+    archives = pipeline.queues['archives']
+    order = {name: index for index, name in enumerate(archiveNames)}
+    turn = threading.Condition()
+    nextArchive = [0] # the index of the next archive to put on the queue
+
+    def handOff(localPath):
+        with turn:
+            while nextArchive[0] != order[localPath.name]:
+                turn.wait(0.5)
+                if pipeline.stopped.is_set(): raise Stopped()
+            archives.put(localPath)
+            nextArchive[0] += 1
+            turn.notify_all()
+
+    downloadArchives(connect, remoteDir, archiveNames, targetDir, connections, runReport = pipeline.runReport, onFetched = handOff, onFailed = pipeline.stop)
+
+def localStage(pipeline, archivePaths):
+    '''the download stage of a --local run: put the archives already on disk on the archives queue'''
+    for archivePath in archivePaths:
+        pipeline.queues['archives'].put(archivePath)
+
+def unzipStage(pipeline, archiveCount):
+    '''checksum each archive on the archives queue and decompress its record files onto the
+    members queue, behind a header of (archive path, number of record files, checksum) and
+    followed by None
+    '''
+    archives, members = pipeline.queues['archives'], pipeline.queues['members']
+    runReport = pipeline.runReport
+    for index in range(archiveCount):
+        filename = archives.get()
+        with runReport.stage('checksum', filename.name, bytes = filename.stat().st_size):
+            checksum = fileChecksum(filename)
+        with ZipFile(filename) as archive:
+            names = zipMembers(archive)
+            members.put((filename, len(names), checksum))
+            for name in names:
+                runReport.start('unzip', filename.name)
+                data = archive.read(name)
+                runReport.stop(bytes = len(data), records = 1)
+                members.put(data)
+        members.put(None)
+
+def splitStage(pipeline, archiveCount):
+    '''strip each record file on the members queue down to its TrademarkBag records, and put each
+    archive's records on the blocks queue in blocks of about blockSize bytes, wrapped in the
+    top-level tags as a single collection, behind the archive's header and followed by None
+    '''
+    members, blocks = pipeline.queues['members'], pipeline.queues['blocks']
+    runReport = pipeline.runReport
+    head = openString.encode('UTF-8')
+    tail = closeString.encode('UTF-8')
+    for index in range(archiveCount):
+        header = members.get()
+        collection = header[0].name
+        blocks.put(header)
+        block = [head]
+        size = len(head)
+        while True:
+            data = members.get()
+            if data is None: break
+            runReport.start('split', collection)
+            body = recordBody(data)
+            block.append(body)
+            size += len(body)
+            full = None
+            if size >= blockSize:
+                full = b''.join(block)
+                block = []
+                size = 0
+            runReport.stop(bytes = len(body), records = 1)
+            if full: blocks.put(full)
+        block.append(tail)
+        blocks.put(b''.join(block))
+        blocks.put(None)
+
+class QueueReader:
+    '''a read-only file-like object presenting the blocks of one archive on the blocks queue to lxml as a collection'''
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.block = b''
+        self.position = 0
+        self.done = False
+
+    def read(self, size = -1):
+        while self.position >= len(self.block):
+            if self.done: return b''
+            self.block = self.blocks.get()
+            self.position = 0
+            if self.block is None:
+                self.block = b''
+                self.done = True
+        if size is None or size < 0: size = len(self.block) - self.position
+        data = self.block[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def drain(self):
+        '''read to the end of the archive, past anything the parser left unread'''
+        while not self.done:
+            self.block = b''
+            self.read()
+
+def parseStage(pipeline, archiveCount, tables, newfiles, manifest, compress = None, quarantine = None):
+    '''parse the blocks of each archive on the blocks queue as one collection into tables, and
+    enter the archive in the manifest with the byte ranges of its rows in newfiles (unless they
+    are compressed). Returns the number of records parsed
+    '''
+    blocks = pipeline.queues['blocks']
+    runReport = pipeline.runReport
+    total = 0
+    for index in tqdm(
+        range(archiveCount),
+        total=archiveCount,
+        ncols=100,
+        desc='Total Progress',
+        position=0,
+        leave=True,
+        unit='archive'
+    ):
+        filename, count, checksum = blocks.get()
+        reader = QueueReader(blocks)
+        starts = {} if compress else filePositions(newfiles)
+        if quarantine is not None: quarantine.collection = filename.name
+        with runReport.stage('parse', filename.name):
+            if quarantine is None: context = etree.iterparse(reader, events=('end',), tag = bagTagName)
+            else: context = recoverRecords(reader, quarantine)
+            records = fast_iter(context, tables, count, f'{filename.stem[-3:]} of {archiveCount}', quarantine = quarantine)
+            reader.drain()
+        runReport.count('parse', records = records, collection = filename.name)
+        ends = {} if compress else filePositions(newfiles)
+        outputs = {outFile: [starts[outFile], ends[outFile]] for outFile in starts}
+        manifest['archives'][filename.name] = archiveEntry(filename, checksum, records, outputs)
+        total += records
+    return total
+
+def runPipeline(pipeline, archives, targetDir, tables, newfiles, manifest, connect = None, remoteDir = None, connections = 4, compress = None, quarantine = None):
+    '''run the stages of the pipeline over the named archives, downloading them into targetDir
+    over connections made by connect() or, if connect is None, reading them from targetDir;
+    the parse stage runs in the calling thread, quarantining the records that cannot be
+    extracted, if quarantine is given. Returns the number of records parsed.
+    '''
+    if connect is None:
+        pipeline.start('download', localStage, pipeline, [targetDir / name for name in archives])
+    else:
+        pipeline.start('download', downloadStage, pipeline, connect, remoteDir, archives, targetDir, connections)
+    pipeline.start('unzip', unzipStage, pipeline, len(archives))
+    pipeline.start('split', splitStage, pipeline, len(archives))
+    try:
+        records = parseStage(pipeline, len(archives), tables, newfiles, manifest, compress, quarantine)
+    except Stopped:
+        records = 0 # another stage failed; finish() raises its error
+    finally:
+        pipeline.stop() # ends the other stages, if the parse stage failed
+        pipeline.finish()
+    return records
+
+def argumentParser():
+    '''the command-line options of pipeline.py (also those of canada_tm.py pipeline)'''
+    parser = argparse.ArgumentParser(description='Download, extract and parse the CIPO historical trademark bulk data in one pipelined run (the password is read from CA_TM_PASSWORD, or prompted for at a terminal).')
+    parser.add_argument('destDir', nargs='?', help='full path of the destination folder, to which the XML_raw and csv folders are written (prompted for if omitted)')
+    parser.add_argument('--user', help='CIPO IP Horizons username (prompted for if omitted)')
+    parser.add_argument('--connections', type=int, default=4, help='number of simultaneous SFTP connections (default: 4)')
+    parser.add_argument('--local', action='store_true', help='run the ZIP archives already in the XML_raw folder through the pipeline, without downloading anything')
+    parser.add_argument('--tables', nargs='+', choices=list(extractors), default=list(extractors), help='tables to extract (default: all)')
+    parser.add_argument('--batch-rows', type=int, default=10000, help='rows queued for each data file before they are written together (default: 10000)')
+    parser.add_argument('--compress', choices=list(compressSuffixes), help='compress the data files as they are written, in a writer thread (zstd requires the zstandard package)')
+    parser.add_argument('--codes', action='store_true', help=f'write the categorical columns listed in st96_fields.py as integer codes, with a lookup table of their values ({codesFile})')
+    parser.add_argument('--recover', action='store_true', help=f'repair malformed XML where libxml2 can, and set aside records that cannot be extracted in {quarantineFile} in the csv folder instead of ending the run')
+    parser.add_argument('--archive-queue', type=int, default=2, help='downloaded archives that may wait to be decompressed; the downloads stop while this many are waiting (default: 2)')
+    parser.add_argument('--member-queue', type=int, default=1024, help='decompressed record files that may wait to be split (default: 1024)')
+    parser.add_argument('--block-queue', type=int, default=16, help=f'blocks of about {blockSize // 1024 // 1024} MB of records that may wait to be parsed (default: 16)')
+    parser.add_argument('--report', default=pipelineReportFile, help=f'file in the csv folder to which the run report, with the time of each stage and the depth of each queue, is saved (default: {pipelineReportFile})')
+    return parser
+
+def main(args = None):
+
+    args = args or argumentParser().parse_args()
+
+    # set filepath variables
+
+    localpath = Path(ask(args.destDir, 'Enter full destination path (NOTE: at least 70GB free disk space needed):', 'destDir'))
+    targetDir = localpath / 'XML_raw'
+    parsePath = localpath / 'csv'
+    targetDir.mkdir(parents=True, exist_ok=True)
+    parsePath.mkdir(exist_ok=True)
+    dropDigests(parsePath) # the data files are rewritten, so any record digests would be out of date
+
+    # the archives to run through the pipeline: those on the SFTP server, or with --local those already in XML_raw
+
+    if args.local:
+        connect = None
+        archives = sorted(item.name for item in targetDir.iterdir() if item.is_file() and item.suffix == '.zip')
+        print(f'{len(archives)} ZIP archives found in {targetDir.absolute()}.')
+    else:
+        import pysftp # imported here, so that the script's help and --local runs do not need it
+        userID, userPWD = signIn(args.user)
+
+        def connect():
+            return pysftp.Connection(
+                host=sftpHost,
+                username = userID,
+                password = userPWD
+            )
+
+        archives = listArchives(connect, localpath)
+    if not archives:
+        raise SystemExit('No archives to run through the pipeline.')
+
+    runReport = RunReport()
+    queueSizes = {'archives': args.archive_queue, 'members': args.member_queue, 'blocks': args.block_queue}
+    if min(queueSizes.values()) < 1:
+        raise SystemExit('Each queue must hold at least 1 item.')
+    pipeline = Pipeline(runReport, queueSizes)
+
+    # the run replaces the data files and the manifest of any earlier run
+
+    manifest = loadManifest(parsePath)
+    manifest['archives'] = {}
+    outPaths = {extractors[name].outFile: dataPath(parsePath, extractors[name].outFile, args.compress) for name in args.tables}
+    vocabulary = Vocabulary.load(parsePath / codesFile) if args.codes else None
+    report = OutputReport()
+
+    print(f'Running {len(archives)} archives through the pipeline, extracting {len(args.tables)} tables...')
+    startTime = time.perf_counter()
+
+    with ExitStack() as stack:
+
+        # create a container csv file and a batched CSV output object for each table; pass each its label row
+
+        tables = []
+        newfiles = []
+        for name in args.tables:
+            extractor = tableFor(name)
+            newfile = stack.enter_context(openOutput(outPaths[extractor.outFile], 'w', args.compress))
+            fileWriter = BatchWriter(newfile, args.batch_rows, extractor.headerRow, runReport)
+            stack.callback(fileWriter.writeBatch) # the last batch is written before the file is closed
+            tables.append((extractor, codedWriter(fileWriter, extractor, vocabulary)))
+            newfiles.append((extractor.outFile, fileWriter))
+        quarantine = stack.enter_context(Quarantine(parsePath / quarantineFile, runReport)) if args.recover else None
+
+        records = runPipeline(pipeline, archives, targetDir, tables, newfiles, manifest, connect, remoteDir, args.connections, args.compress, quarantine)
+
+    for outFile, fileWriter in newfiles: report.add(outFile, fileWriter.rows)
+    saveCodes(parsePath, vocabulary, manifest)
+    saveManifest(parsePath, manifest)
+
+    print(f'\n{records:,} records from {len(archives)} archives parsed in {time.perf_counter() - startTime:,.1f} s.')
+    report.print(outPaths)
+    if args.recover: printQuarantine(parsePath)
+    queues = {name: stageQueue.summary() for name, stageQueue in pipeline.queues.items()}
+    saveRunReport(runReport, parsePath / args.report, report, outPaths, queues = queues)
+    for name, summary in queues.items():
+        print(f'    {name} queue: {summary["items"]:,} items, mean depth {summary["meanDepth"]:,.1f} and peak depth {summary["peakDepth"]:,} of {summary["size"]:,}')
+    for outPath in outPaths.values():
+        print(f'Dataset {outPath.name} is now available in folder {parsePath.absolute()}')
+    print(f'\nThe ZIP archives are kept in the folder {targetDir.absolute()}; run iterparse_all.py --zips --update on it to update the data files.')
+
+if __name__ == "__main__": main()
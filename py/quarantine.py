@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# The quarantine of --recover runs, CA_TM_quarantine.jsonl: a record that an extractor fails on is
+# set aside there instead of ending the run, and a malformed TrademarkBag is cut out of the stream,
+# repaired by lxml's recover parser and listed there, with the keys of the records repaired.
+
+import json
+import os
+import re
+import shutil
+import traceback
+from lxml import etree
+
+from record_iter import bagTagName
+from xml_sources import bagPattern, bagTag, closeString, openString
+from st96_fields import appNumber, ns_dict
+from record_digest import recordKey
+
+quarantineFile = 'CA_TM_quarantine.jsonl'
+
+appNumberPattern = re.compile(rb'<com:ST13ApplicationNumber>\s*([^<\s]+)')
+
+class UnclosedRecord(Exception):
+    '''a TrademarkBag found inside another, whose end tags are missing (e.g. a truncated record file)'''
+
+class Quarantine:
+    '''the quarantine file of a --recover run (or of one shard of a parallel run), at path'''
+    outFile = quarantineFile # named as a data file is, for its shards
+
+    def __init__(self, path, runReport = None, append = False):
+        self.path = path
+        self.outfile = path.open('a' if append else 'w', encoding='UTF-8')
+        self.runReport = runReport
+        self.collection = None # the collection being parsed, set by the parser
+
+    def write(self, entry):
+        self.outfile.write(json.dumps(entry, ensure_ascii = False) + '\n')
+
+    def add(self, record, error):
+        '''set aside a record (a TrademarkBag element) that could not be extracted'''
+        try:
+            appNo = (record.xpath(appNumber, namespaces = ns_dict) or [None])[0]
+        except etree.Error:
+            appNo = None
+        self.write({
+            'kind': 'record',
+            'collection': self.collection,
+            'AppNo': appNo,
+            'error': f'{type(error).__name__}: {error}',
+            'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+            'xml': etree.tostring(record, encoding = 'unicode')
+        })
+        if self.runReport is not None: self.runReport.count('quarantine', records = 1)
+
+    def malformed(self, fragment, error, repairs, records):
+        '''list a malformed fragment of a collection: the strict parser's error, the repairs made
+        by the recover parser and the number and (AppNo, ExtNo) keys of the records recovered from
+        it, whose rows are written to the data files
+        '''
+        found = appNumberPattern.search(fragment)
+        self.write({
+            'kind': 'xml',
+            'collection': self.collection,
+            'AppNo': found.group(1).decode('UTF-8', 'replace') if found else None,
+            'error': f'{type(error).__name__}: {error}',
+            'repairs': [f'line {entry.line}, column {entry.column}: {entry.message.strip()}' for entry in repairs],
+            'recovered': len(records),
+            'keys': [list(key) for key in map(recordKey, records) if key is not None],
+            'xml': fragment.decode('UTF-8', 'replace')
+        })
+        if self.runReport is not None: self.runReport.count('recover', records = len(records))
+
+    def recover(self, fragment, error):
+        '''yield the iterparse event of each record that lxml's recover parser can repair in a
+        malformed fragment, and list the fragment in the quarantine
+        '''
+        parser = etree.XMLParser(recover = True)
+        root = etree.fromstring(openString.encode('UTF-8') + fragment + closeString.encode('UTF-8'), parser)
+        records = [] if root is None else list(root.iter(bagTagName))
+        self.malformed(fragment, error, parser.error_log, records)
+        for elem in records:
+            yield 'end', elem
+
+    def sync(self):
+        '''write the entries so far to disk for a checkpoint (see checkpoint.py); returns the file's length'''
+        self.outfile.flush()
+        os.fsync(self.outfile.fileno())
+        return self.outfile.tell()
+
+    def close(self):
+        self.outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class BagReader:
+    '''a read-only file-like object passing an open collection through to lxml while keeping the
+    bytes from the start tag of the TrademarkBag being parsed, so that a malformed one can be cut
+    out of the stream and the parse started again from the next
+    '''
+    def __init__(self, infile):
+        self.infile = infile
+        self.buffer = bytearray() # the bytes read from the start of the pending record on
+        self.base = 0             # the offset in the collection of the buffer's first byte
+        self.starts = []          # the offsets of the pending record's start tag and of those read after it
+        self.lastStart = -1
+        self.replay = b''         # the bytes to pass to a restarted parser before reading on
+        self.ended = False
+
+    def read(self, size = -1):
+        if size is None or size < 0: size = 1 << 62
+        if self.replay:
+            data, self.replay = self.replay[:size], self.replay[size:]
+            return data
+        return self.fill(size)
+
+    def fill(self, size):
+        '''read on from the collection, noting the start tags read'''
+        data = self.infile.read(size)
+        if not data: self.ended = True
+        # a start tag in the last len(bagTag) bytes read is found once the bytes after it have been read
+        scanFrom = max(len(self.buffer) - len(bagTag), 0)
+        self.buffer += data
+        for found in bagPattern.finditer(self.buffer, scanFrom):
+            start = self.base + found.start()
+            if start > self.lastStart:
+                self.starts.append(start)
+                self.lastStart = start
+        return data
+
+    def trim(self, start):
+        del self.buffer[:start - self.base]
+        self.base = start
+
+    def recordDone(self):
+        '''drop the bytes of the record just parsed'''
+        if self.starts: self.starts.pop(0)
+        if self.starts: self.trim(self.starts[0])
+        else: self.trim(max(self.base + len(self.buffer) - len(bagTag), self.base)) # all but a start tag's worth
+
+    def skip(self):
+        '''cut the pending record out of the stream, after a syntax error in it: returns its bytes
+        and whether there is a record after it, from which the bytes read next (by a new parser)
+        then start, behind the top-level opening tag
+        '''
+        if not self.starts: return None, False # the error was not in a record
+        while len(self.starts) < 2 and not self.ended:
+            self.fill(1024 * 1024)
+        start = self.starts.pop(0)
+        if not self.starts:
+            fragment = bytes(self.buffer[start - self.base:])
+            end = fragment.rfind(closeString.encode('UTF-8'))
+            return fragment[:end] if end >= 0 else fragment, False
+        fragment = bytes(self.buffer[start - self.base:self.starts[0] - self.base])
+        self.trim(self.starts[0])
+        self.replay = openString.encode('UTF-8') + bytes(self.buffer)
+        return fragment, True
+
+def recoverRecords(infile, quarantine):
+    '''the iterparse events of each TrademarkBag of an open collection, as etree.iterparse would
+    give them, with each malformed one repaired as far as lxml's recover parser can (see above)
+    '''
+    reader = BagReader(infile)
+    more = True
+    while more:
+        context = etree.iterparse(reader, events=('end',), tag = bagTagName)
+        try:
+            for event, elem in context:
+                if elem.getparent() is not None and elem.getparent().getparent() is not None:
+                    raise UnclosedRecord(f'a TrademarkBag starts inside another, at line {elem.sourceline}')
+                yield event, elem
+                reader.recordDone()
+            return
+        except (etree.XMLSyntaxError, UnclosedRecord) as error:
+            fragment, more = reader.skip()
+            if fragment is not None: yield from quarantine.recover(fragment, error)
+
+def mergeQuarantines(shardPaths, outPath):
+    '''concatenate the quarantine shards of a parallel run, in order, into the quarantine file at
+    outPath; the shards are removed once all have been copied
+    '''
+    with outPath.open('w', encoding='UTF-8') as outfile:
+        for shardPath in shardPaths:
+            with shardPath.open('r', encoding='UTF-8') as shardfile:
+                shutil.copyfileobj(shardfile, outfile)
+    for shardPath in shardPaths: shardPath.unlink()
+
+def quarantineSummary(path):
+    '''the number of records quarantined, of malformed fragments and of the records recovered
+    from them, in the quarantine file at path
+    '''
+    records = fragments = recovered = 0
+    with path.open('r', encoding='UTF-8') as infile:
+        for line in infile:
+            entry = json.loads(line)
+            if entry['kind'] == 'record':
+                records += 1
+            else:
+                fragments += 1
+                recovered += entry['recovered']
+    return records, fragments, recovered
+
+class RecordRows:
+    '''a stand-in for a table's writer that holds the rows of the record being extracted until
+    every table has been extracted from it, then passes them on to writer (or drops them)
+    '''
+    def __init__(self, writer):
+        self.writer = writer
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+
+    def writerows(self, rows):
+        self.rows.extend(rows)
+
+    def commit(self):
+        for row in self.rows: self.writer.writerow(row)
+        self.rows = []
+
+    def discard(self):
+        self.rows = []
+
+def extractRecord(record, tables, quarantine = None):
+    '''pass a record to every (extractor, writeobject) pair in tables; in a --recover run (with a
+    quarantine), the writeobjects are RecordRows, and a record that any extractor fails on is
+    quarantined, with none of its rows written. Returns whether the record was extracted
+    '''
+    if quarantine is None:
+        for extractor, writeobject in tables:
+            extractor.extract(record, writeobject)
+        return True
+    try:
+        for extractor, writeobject in tables:
+            extractor.extract(record, writeobject)
+    except Exception as error:
+        for extractor, rows in tables: rows.discard()
+        quarantine.add(record, error)
+        return False
+    for extractor, rows in tables: rows.commit()
+    return True
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# The record digests of iterparse_all.py --skip-unchanged runs: a digest of each record's canonical
+# (exclusive C14N) form, kept with the collection its rows are in, by (AppNo, ExtNo), in
+# CA_TM_digests.sqlite; updates skip the records whose digest is unchanged.
+
+import csv
+import hashlib
+import json
+import sqlite3
+from lxml import etree
+
+from run_report import timing
+from st96_fields import appNumber, ns_dict
+
+digestFile = 'CA_TM_digests.sqlite'
+
+appNumberPath = etree.XPath(appNumber, namespaces = ns_dict)
+
+def recordDigest(record):
+    '''the digest of a record (a TrademarkBag element) in its canonical form'''
+    digest = hashlib.blake2b(digest_size = 16)
+    for child in record:
+        digest.update(etree.tostring(child, method = 'c14n', exclusive = True, with_tail = False))
+    return digest.digest()
+
+def recordKey(record):
+    '''the (AppNo, ExtNo) key of a record, as recordKeys in iterparse_all.py gives it, or None if it has no application number'''
+    found = appNumberPath(record)
+    if not found: return None
+    return found[0][-9:-2], found[0][-2:]
+
+def dropDigests(parsePath):
+    '''remove the digests of an earlier --skip-unchanged run, which a run without it would leave out of date'''
+    digestPath = parsePath / digestFile
+    if not digestPath.exists(): return
+    digestPath.unlink()
+    print(f'The record digests of an earlier --skip-unchanged run ({digestFile}) are removed, as this run does not keep them up to date.')
+
+def lookupDigest(db, key):
+    '''the digest and collection recorded for a key in the digests open as db, or None'''
+    return db.execute('SELECT "Digest", "Archive" FROM digests WHERE "AppNo" = ? AND "ExtNo" = ?', key).fetchone()
+
+class recordDigests:
+    '''a pseudo-table of the (AppNo, ExtNo) key, digest and collection of each record extracted;
+    it is written to shards only, in parallel --skip-unchanged runs, to be loaded into the digests
+    '''
+    outFile = 'CA_TM_digests.csv'
+    headerRow = ['AppNo', 'ExtNo', 'Digest', 'Archive']
+
+class unchangedKeys:
+    '''a pseudo-table of the (AppNo, ExtNo) key of each record skipped, whose rows are moved to the
+    collection being parsed; written to shards only, in --update --skip-unchanged runs
+    '''
+    outFile = 'CA_TM_unchanged.csv'
+    headerRow = ['AppNo', 'ExtNo']
+
+class DigestIndex:
+    '''the record digests at path, for runs with the given settings; those recorded with other
+    settings (or any, if fresh) are discarded. Digests written are only recorded when flushed
+    '''
+    def __init__(self, path, settings, fresh = False):
+        if fresh: path.unlink(missing_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS digests ("AppNo" TEXT, "ExtNo" TEXT, "Digest" BLOB, "Archive" TEXT, PRIMARY KEY ("AppNo", "ExtNo")) WITHOUT ROWID')
+        self.db.execute('CREATE TABLE IF NOT EXISTS settings ("Value" TEXT)')
+        stored = self.db.execute('SELECT "Value" FROM settings').fetchone()
+        settings = json.dumps(settings, sort_keys = True)
+        if stored is not None and stored[0] != settings:
+            print('The record digests were kept for other tables, or outside (or inside) the record store. Recording them afresh...')
+            self.db.execute('DELETE FROM digests')
+        self.db.execute('DELETE FROM settings')
+        self.db.execute('INSERT INTO settings VALUES (?)', (settings,))
+        self.db.commit()
+        self.pending = []
+
+    def writerow(self, row):
+        '''queue the digest of a record extracted: (AppNo, ExtNo, hex digest, collection)'''
+        self.pending.append((row[0], row[1], bytes.fromhex(row[2]), row[3]))
+
+    def flush(self):
+        '''record the queued digests, replacing those recorded for the same keys, and commit'''
+        self.db.executemany('INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)', self.pending)
+        self.pending = []
+        self.db.commit()
+
+    def dropArchives(self, archives):
+        '''forget the digests of the records parsed from the named collections, which are parsed
+        again, so that a record they no longer hold is not skipped if it is published again
+        '''
+        self.db.executemany('DELETE FROM digests WHERE "Archive" = ?', [(archive,) for archive in archives])
+        self.db.commit()
+
+    def load(self, shardPaths):
+        '''record the digests listed in the given recordDigests shards, in order, and remove them
+        (any already loaded and removed before an interruption are passed over)
+        '''
+        for shardPath in shardPaths:
+            if not shardPath.exists(): continue
+            with shardPath.open('r', newline='', encoding='UTF-8') as shardfile:
+                for row in csv.reader(shardfile, delimiter = '\t'):
+                    self.writerow(row)
+                    if len(self.pending) >= 100000: self.flush()
+            self.flush()
+            shardPath.unlink()
+
+    def close(self):
+        '''close the digests, dropping any not flushed (e.g. after an error)'''
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class UnchangedFilter:
+    '''the record filter of a --skip-unchanged run: a record is skipped if its digest is the one
+    in index (a DigestIndex, or its path in a worker process; None in a full run) and its rows
+    are not in one of the reparsed collections. The digest of every record is written to
+    writeobject with the collection being parsed, and the key of each record skipped to moved
+    '''
+    def __init__(self, index, writeobject, reparsed = (), runReport = None, moved = None):
+        self.owned = index is not None and not isinstance(index, DigestIndex)
+        if self.owned: self.db = sqlite3.connect(f'file:{index}?mode=ro', uri = True) if index.exists() else None
+        else: self.db = index and index.db
+        self.writeobject = writeobject
+        self.moved = moved
+        self.reparsed = set(reparsed)
+        self.runReport = runReport
+        self.collection = None
+        self.skipped = 0
+        self.current = None # the key and digest of the record being extracted
+
+    def unchanged(self, record):
+        '''whether a record can be skipped; if not, its key and digest are kept for record()'''
+        self.current = None
+        key = recordKey(record)
+        if key is None: return False # left to the extractors, which fail on it
+        with timing(self.runReport, 'digest'):
+            digest = recordDigest(record)
+        if self.db is not None:
+            stored = lookupDigest(self.db, key)
+            if stored is not None and stored[0] == digest and stored[1] not in self.reparsed:
+                self.skipped += 1
+                if self.runReport is not None: self.runReport.count('unchanged', records = 1)
+                self.current = key, digest
+                self.record()
+                if self.moved is not None: self.moved.writerow(list(key))
+                return True
+        self.current = key, digest
+        return False
+
+    def record(self):
+        '''write the digest of the record just extracted (or skipped)'''
+        if self.current is None: return
+        key, digest = self.current
+        self.writeobject.writerow([key[0], key[1], digest.hex(), self.collection])
+
+    def close(self):
+        if self.owned and self.db is not None: self.db.close()
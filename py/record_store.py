@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# An on-disk record store for iterparse_all.py --store: each table is kept in SQLite, keyed on
+# (AppNo, ExtNo), so that a newer record of an application replaces its older rows in every table,
+# and the data files are exported from the store. The collection each key was last parsed from is
+# kept too, so that an update drops the records a changed collection no longer holds.
+
+import argparse
+from contextlib import closing
+import sqlite3
+from pathlib import Path
+
+from canada_tm import ask
+from csv_out import BatchWriter, CodedWriter, openOutput
+from dta_out import dtaPath, writeDTA
+
+storeFile = 'CA_TM_store.sqlite'
+keyArchives = 'CA_TM_key_archives' # the collection each key was last parsed from, not exported
+
+class TableWriter:
+    '''a stand-in for csv.writer that queues the rows written by an extractor for one table'''
+    def __init__(self, rows):
+        self.rows = rows
+
+    def writerow(self, row):
+        self.rows.append(row)
+
+class KeyWriter:
+    '''a stand-in for csv.writer that starts a new record in the store for each
+    (AppNo, ExtNo) row written, replacing any rows already stored under that key
+    '''
+    def __init__(self, store):
+        self.store = store
+
+    def writerow(self, row):
+        self.store.replace((row[0], row[1]))
+
+class MoveWriter:
+    '''a stand-in for csv.writer that moves each (AppNo, ExtNo) key written, of a record skipped
+    as unchanged, to the collection being parsed, with its rows
+    '''
+    def __init__(self, store):
+        self.store = store
+
+    def writerow(self, row):
+        self.store.move((row[0], row[1]))
+
+class RecordStore:
+    '''the tables of the dataset in an SQLite database; tables maps each table name
+    (the name of its data file, e.g. CA_TM_main) to the label row giving its columns.
+    The rows replaced and added are passed to changes (a ChangeFeed), if it is given. Each key is
+    recorded with the collection being parsed, set by the parser
+    '''
+    def __init__(self, storePath, tables, batchSize = 20000, changes = None):
+        self.db = sqlite3.connect(storePath)
+        self.changes = changes
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.tables = tables
+        self.batchSize = batchSize
+        self.pending = {name: [] for name in tables}
+        self.pendingKeys = set()
+        self.inserts = {}
+        self.deletes = {}
+        self.selects = {}
+        self.collection = None
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS "{keyArchives}" ("AppNo" TEXT, "ExtNo" TEXT, "Archive" TEXT, PRIMARY KEY ("AppNo", "ExtNo")) WITHOUT ROWID')
+        self.db.execute(f'CREATE INDEX IF NOT EXISTS "{keyArchives}_archive" ON "{keyArchives}" ("Archive")')
+        for name, headerRow in tables.items():
+            columns = ', '.join(f'"{column}"' for column in headerRow)
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS "{name}" ({columns})')
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS "{name}_key" ON "{name}" ("AppNo", "ExtNo")')
+            self.inserts[name] = f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(headerRow))})'
+            self.deletes[name] = f'DELETE FROM "{name}" WHERE "AppNo" = ? AND "ExtNo" = ?'
+            self.selects[name] = f'SELECT * FROM "{name}" WHERE "AppNo" = ? AND "ExtNo" = ? ORDER BY rowid'
+
+    def writer(self, name):
+        return TableWriter(self.pending[name])
+
+    def keyWriter(self):
+        return KeyWriter(self)
+
+    def moveWriter(self):
+        return MoveWriter(self)
+
+    def replace(self, key):
+        '''start a new record: delete any rows stored under its key'''
+        if key in self.pendingKeys: self.flush() # the same application twice in one batch
+        if self.changes is not None: self.changes.replace(key, lambda: self.stored(key))
+        for name in self.tables:
+            self.db.execute(self.deletes[name], key)
+        self.move(key)
+        self.pendingKeys.add(key)
+        if len(self.pendingKeys) >= self.batchSize: self.flush()
+
+    def move(self, key):
+        '''record a key as parsed from the collection being parsed'''
+        self.db.execute(f'INSERT OR REPLACE INTO "{keyArchives}" VALUES (?, ?, ?)', (*key, self.collection))
+
+    def dropArchives(self, archives):
+        '''delete the records last parsed from the named collections, as a changed collection is
+        parsed again; returns the number of records deleted
+        '''
+        self.flush()
+        dropped = 0
+        for archive in archives:
+            keys = self.db.execute(f'SELECT "AppNo", "ExtNo" FROM "{keyArchives}" WHERE "Archive" = ?', (archive,)).fetchall()
+            for key in keys:
+                if self.changes is not None: self.changes.replace(key, lambda: self.stored(key))
+                for name in self.tables:
+                    self.db.execute(self.deletes[name], key)
+            self.db.execute(f'DELETE FROM "{keyArchives}" WHERE "Archive" = ?', (archive,))
+            dropped += len(keys)
+        self.db.commit()
+        return dropped
+
+    def stored(self, key):
+        '''the rows stored under a key, by table'''
+        return {name: self.db.execute(self.selects[name], key).fetchall() for name in self.tables}
+
+    def flush(self):
+        '''insert the queued rows and commit'''
+        for name, rows in self.pending.items():
+            if self.changes is not None:
+                for row in rows: self.changes.added(name, row)
+            self.db.executemany(self.inserts[name], rows)
+            rows.clear()
+        self.pendingKeys.clear()
+        self.db.commit()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def storedTables(storePath):
+    '''the names of the tables in the store at storePath'''
+    with closing(sqlite3.connect(storePath)) as db:
+        return [name for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY rowid") if name != keyArchives]
+
+def scanTable(db, name):
+    '''the label row and a cursor over the rows of one table, in the order they were stored'''
+    cursor = db.execute(f'SELECT * FROM "{name}" ORDER BY rowid')
+    return [column[0] for column in cursor.description], cursor
+
+def exportCSV(storePath, name, outPath, compress = None, codedColumns = None, vocabulary = None):
+    '''write one table of the store to a tab-delimited data file, as iterparse_all.py does
+    (compressed, if compress is given, and with the codedColumns written as codes from
+    vocabulary, if it is given); returns the number of rows written'''
+    with closing(sqlite3.connect(storePath)) as db, openOutput(outPath, 'w', compress) as newfile:
+        headerRow, rows = scanTable(db, name)
+        fileWriter = BatchWriter(newfile, headerRow = headerRow)
+        writer = CodedWriter(fileWriter, headerRow, codedColumns, vocabulary) if codedColumns and vocabulary is not None else fileWriter
+        writer.writerows(rows)
+        fileWriter.writeBatch()
+    return fileWriter.rows
+
+def exportDTA(storePath, name, outPath):
+    '''write one table of the store to a Stata .dta file, with the types and labels of the cleanup do-file
+    (see dta_out.py), in two sequential scans of the table'''
+    with closing(sqlite3.connect(storePath)) as db:
+        writeDTA(f'{name}.csv', lambda: scanTable(db, name), outPath)
+
+def argumentParser():
+    '''the command-line options of record_store.py'''
+    parser = argparse.ArgumentParser(description='Export the Canada Trademarks Dataset data files from the record store built by iterparse_all.py --store.')
+    parser.add_argument('csvDir', nargs='?', help='full path of the csv folder holding the store (prompted for if omitted)')
+    parser.add_argument('--format', choices=['csv', 'dta'], default='csv', help='export format (default: csv; dta files are written to a sibling dta folder)')
+    return parser
+
+def main(args = None):
+
+    args = args or argumentParser().parse_args()
+
+    csvDir = Path(ask(args.csvDir, 'Provide full path of csv folder:', 'csvDir'))
+    storePath = csvDir / storeFile
+    if not storePath.exists():
+        print(f'No record store found at {storePath.absolute()}')
+        return
+    for name in storedTables(storePath):
+        outFile = f'{name}.csv'
+        if args.format == 'csv':
+            exportCSV(storePath, name, csvDir / outFile)
+            print(f'Dataset {outFile} is now available in folder {csvDir.absolute()}')
+        else:
+            dtaDir = csvDir.parent / 'dta'
+            dtaDir.mkdir(exist_ok=True)
+            exportDTA(storePath, name, dtaPath(dtaDir, outFile))
+            print(f'Dataset {dtaPath(dtaDir, outFile).name} is now available in folder {dtaDir.absolute()}')
+
+if __name__ == "__main__": main()
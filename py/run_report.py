@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# Per-stage timing of the runs of the Canada Trademarks Dataset scripts: the wall-clock and CPU
+# time, bytes and records of each stage, by collection, saved as JSON; one collection may also be
+# profiled with cProfile and tracemalloc.
+
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import json
+import sys
+import threading
+import time
+
+from record_iter import peakRSS, releaseRecord
+
+runReportFile = 'CA_TM_run_report.json' # the default name of the report, in the csv folder
+
+def newTotals():
+    return {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes': 0, 'records': 0}
+
+def addTotals(totals, other):
+    for key, value in other.items():
+        totals[key] = totals.get(key, 0) + value
+
+class RunReport:
+    '''the wall-clock and CPU time, bytes and records of each stage of a run, in total and by collection;
+    profile, if given, names a collection (e.g. 003, 003.xml or TM_HIST_003.zip) to profile, with
+    the profiles saved to the folder profileDir
+    '''
+    def __init__(self, profile = None, profileDir = None):
+        self.profile = profile
+        self.profileDir = profileDir
+        self.stages = {} # stage -> totals
+        self.collections = {} # collection -> {stage -> totals}
+        self.profiles = {} # collection -> profile summary
+        self.startTime = datetime.now().astimezone()
+        self.startWall = time.perf_counter()
+        self.startCPU = time.process_time()
+        self.lock = threading.Lock()
+        self.local = threading.local() # the stack of stages running in each thread
+
+    def __getstate__(self): # sent to and returned from worker processes
+        state = self.__dict__.copy()
+        del state['lock'], state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def child(self):
+        '''an empty report with the same profiling settings, for a worker process to fill and return'''
+        return RunReport(self.profile, self.profileDir)
+
+    def running(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None: stack = self.local.stack = []
+        return stack
+
+    def start(self, stage, collection = None):
+        '''start timing a stage (of the collection of the enclosing stage, if collection is not given)'''
+        stack = self.running()
+        if collection is None and stack: collection = stack[-1][1]
+        stack.append([stage, collection, time.perf_counter(), time.thread_time(), 0.0, 0.0])
+
+    def stop(self, bytes = 0, records = 0):
+        '''stop timing the stage last started in this thread, crediting it with bytes and records'''
+        stack = self.running()
+        stage, collection, wall, cpu, innerWall, innerCPU = stack.pop()
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+        if stack:
+            stack[-1][4] += wall
+            stack[-1][5] += cpu
+        self.add(stage, collection, wall - innerWall, cpu - innerCPU, bytes, records)
+
+    @contextmanager
+    def stage(self, stage, collection = None, bytes = 0, records = 0):
+        '''time the enclosed code as a stage'''
+        self.start(stage, collection)
+        try:
+            yield
+        finally:
+            self.stop(bytes, records)
+
+    def add(self, stage, collection = None, wall = 0.0, cpu = 0.0, bytes = 0, records = 0, calls = 1):
+        '''add a stage's times, bytes and records (e.g. measured in another thread) to the report'''
+        with self.lock:
+            targets = [self.stages.setdefault(stage, newTotals())]
+            if collection is not None: targets.append(self.collections.setdefault(collection, {}).setdefault(stage, newTotals()))
+            for totals in targets:
+                totals['calls'] += calls
+                totals['wall'] += wall
+                totals['cpu'] += cpu
+                totals['bytes'] += bytes
+                totals['records'] += records
+
+    def count(self, stage, bytes = 0, records = 0, collection = None):
+        '''credit a stage with bytes and records, but no time (of the collection of the running stage, if not given)'''
+        stack = self.running()
+        if collection is None and stack: collection = stack[-1][1]
+        self.add(stage, collection, bytes = bytes, records = records, calls = 0)
+
+    def merge(self, other):
+        '''add the stages and profiles of a report made in a worker process to this one'''
+        with self.lock:
+            for stage, totals in other.stages.items():
+                addTotals(self.stages.setdefault(stage, newTotals()), totals)
+            for collection, stages in other.collections.items():
+                for stage, totals in stages.items():
+                    addTotals(self.collections.setdefault(collection, {}).setdefault(stage, newTotals()), totals)
+            self.profiles.update(other.profiles)
+
+    def profiled(self, filename):
+        '''whether filename is the collection to be profiled'''
+        return self.profile is not None and self.profile in (filename.name, filename.stem, filename.stem[-3:])
+
+    @contextmanager
+    def profiling(self, filename, chunk = None):
+        '''profile the enclosed code with cProfile and tracemalloc if filename is the collection to be profiled'''
+        if not self.profiled(filename):
+            yield
+            return
+        import cProfile
+        import tracemalloc
+        label = filename.stem if chunk is None else f'{filename.stem}_{chunk[0]:015d}'
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.profileDir.mkdir(parents=True, exist_ok=True)
+            profilePath = self.profileDir / f'{label}.prof'
+            profiler.dump_stats(profilePath)
+            self.profiles[label] = {
+                'profile': str(profilePath),
+                'tracedPeakMB': peak / 1e6,
+                'allocations': [
+                    {'site': f'{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}', 'MB': statistic.size / 1e6, 'blocks': statistic.count}
+                    for statistic in snapshot.statistics('lineno')[:25]
+                ]
+            }
+
+    def data(self, **details):
+        '''the report, as saved: the run's details, totals, stages (with their rates) and collections'''
+        def rates(totals):
+            totals = dict(totals)
+            if totals['wall'] > 0:
+                if totals['bytes']: totals['mbPerSecond'] = totals['bytes'] / 1e6 / totals['wall']
+                if totals['records']: totals['recordsPerSecond'] = totals['records'] / totals['wall']
+            return totals
+        return {
+            'command': sys.argv,
+            'started': self.startTime.isoformat(timespec='seconds'),
+            'seconds': time.perf_counter() - self.startWall,
+            'cpuSeconds': time.process_time() - self.startCPU, # of this process only, not its workers
+            'peakRSS': peakRSS(),
+            **details,
+            'stages': {stage: rates(totals) for stage, totals in self.stages.items()},
+            'collections': {collection: {stage: rates(totals) for stage, totals in stages.items()} for collection, stages in sorted(self.collections.items())},
+            'profiles': self.profiles
+        }
+
+    def save(self, reportPath, **details):
+        '''save the report as JSON, with any further details of the run, and print a summary of its stages'''
+        data = self.data(**details)
+        with reportPath.open('w', encoding='UTF-8') as outfile:
+            json.dump(data, outfile, indent = 1)
+        print(f'Run report ({data["seconds"]:,.1f} s) saved as {reportPath.absolute()}:')
+        for stage, totals in sorted(data['stages'].items(), key = lambda item: -item[1]['wall']):
+            rate = f', {totals["mbPerSecond"]:,.1f} MB/s' if 'mbPerSecond' in totals else ''
+            records = f', {totals["records"]:,} records' if totals['records'] else ''
+            print(f'    {stage:<32} {totals["wall"]:>9,.2f} s wall {totals["cpu"]:>9,.2f} s CPU{records}{rate}')
+        for label, profile in data['profiles'].items():
+            print(f'    Profile of {label}: {profile["profile"]} (traced peak {profile["tracedPeakMB"]:,.1f} MB)')
+
+def timed(items, runReport, stage):
+    '''pass through the items of an iterator, timing the production of each as a stage'''
+    items = iter(items)
+    while True:
+        runReport.start(stage)
+        try:
+            item = next(items)
+        except StopIteration:
+            runReport.stop()
+            return
+        runReport.stop(records = 1)
+        yield item
+
+def timedRecords(context, runReport):
+    '''iterRecords (see record_iter.py), timing the parsing of each record (tokenize) and its release (cleanup)'''
+    for event, elem in timed(context, runReport, 'tokenize'):
+        yield elem
+        runReport.start('cleanup')
+        releaseRecord(elem)
+        runReport.stop()
+
+class TimedTable:
+    '''an extractor whose extract() is timed as a stage named for its data file'''
+    def __init__(self, extractor, runReport):
+        self.extractor = extractor
+        self.runReport = runReport
+        self.stageName = f'extract {extractor.outFile}'
+
+    def __getattr__(self, name):
+        return getattr(self.extractor, name)
+
+    def extract(self, elem, writeobject):
+        self.runReport.start(self.stageName)
+        try:
+            self.extractor.extract(elem, writeobject)
+        finally:
+            self.runReport.stop()
+
+def timing(runReport, stage, collection = None, bytes = 0, records = 0):
+    '''runReport.stage(...), or a context that times nothing if there is no report'''
+    if runReport is None: return nullcontext()
+    return runReport.stage(stage, collection, bytes, records)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A concurrent downloader for CIPO's IP Horizons SFTP server: archives are fetched over a pool of
+# connections made by a caller-supplied factory (e.g. lambda: pysftp.Connection(...)), resuming
+# partial downloads after a dropped connection.
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from tqdm import tqdm
+
+from run_report import timing
+
+# errors after which a download is retried over a fresh connection
+
+try:
+    from paramiko import SSHException
+    retryErrors = (OSError, EOFError, SSHException)
+except ImportError:
+    retryErrors = (OSError, EOFError)
+
+class ConnectionPool:
+    '''one SFTP connection per download thread, opened on first use
+    and reopened after a failure
+    '''
+    def __init__(self, connect):
+        self.connect = connect
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.opened = []
+
+    def get(self):
+        sftp = getattr(self.local, 'sftp', None)
+        if sftp is None:
+            sftp = self.local.sftp = self.connect()
+            with self.lock: self.opened.append(sftp)
+        return sftp
+
+    def discard(self):
+        '''drop this thread's connection (after an error) so that the next get() reconnects'''
+        sftp = getattr(self.local, 'sftp', None)
+        self.local.sftp = None
+        if sftp is not None:
+            with self.lock: self.opened.remove(sftp)
+            try: sftp.close()
+            except Exception: pass
+
+    def close(self):
+        with self.lock:
+            for sftp in self.opened:
+                try: sftp.close()
+                except Exception: pass
+            self.opened = []
+
+def fetchArchive(pool, remotePath, localPath, callback = None, retries = 5, blockSize = 1024 * 1024):
+    '''download remotePath to localPath over a pooled connection, resuming from the end
+    of any partial local copy; dropped connections are retried up to retries times.
+    callback, if given, is called with (bytes downloaded, total bytes) as the download proceeds.
+    '''
+    attempts = 0
+    while True:
+        try:
+            sftp = pool.get()
+            remoteSize = sftp.lstat(remotePath).st_size
+            offset = localPath.stat().st_size if localPath.exists() else 0
+            if offset > remoteSize: offset = 0 # not a partial copy of this archive: start over
+            if callback: callback(offset, remoteSize)
+            with sftp.open(remotePath, 'rb') as remote, localPath.open('r+b' if offset else 'wb') as local:
+                local.seek(offset)
+                local.truncate()
+                remote.seek(offset)
+                if hasattr(remote, 'prefetch'): remote.prefetch(remoteSize) # pipeline the read requests (paramiko)
+                while offset < remoteSize:
+                    block = remote.read(min(blockSize, remoteSize - offset))
+                    if not block: raise EOFError(f'{remotePath} ended at byte {offset} of {remoteSize}')
+                    local.write(block)
+                    offset += len(block)
+                    if callback: callback(offset, remoteSize)
+            return localPath
+        except retryErrors:
+            pool.discard()
+            attempts += 1
+            if attempts > retries: raise
+            time.sleep(min(2 ** attempts, 60))
+
+def downloadArchives(connect, remoteDir, archiveNames, targetDir, connections = 4, retries = 5, onComplete = None, runReport = None, onFetched = None, onFailed = None):
+    '''download the named archives from remoteDir into targetDir over up to connections SFTP
+    connections made by connect(). onComplete is called in the calling thread with each archive
+    downloaded, or onFetched in the download thread (holding back further downloads while it
+    blocks); if a download fails, onFailed is called and the downloads not started are abandoned.
+    Returns the downloaded paths
+    '''
+    pool = ConnectionPool(connect)
+    downloaded = []
+    try:
+        # archive sizes for the progress bar, from a single directory listing
+        sizes = {attr.filename: attr.st_size for attr in pool.get().listdir_attr(remoteDir)}
+        pool.discard()
+
+        with tqdm(
+            desc=f'Downloading {len(archiveNames)} archives over {connections} connections',
+            total = sum(sizes.get(name, 0) for name in archiveNames),
+            unit_scale=True,
+            ncols=100,
+            unit='B',
+            leave=True,
+            position = 2
+        ) as pbar, ThreadPoolExecutor(max_workers = connections) as executor:
+
+            progress = {}
+            lock = threading.Lock()
+
+            def downloadBar(name):
+                def update(done, size):
+                    with lock:
+                        pbar.update(done - progress.get(name, 0))
+                        progress[name] = done
+                return update
+
+            def fetch(name):
+                with timing(runReport, 'download', name):
+                    localPath = fetchArchive(pool, f'{remoteDir}/{name}', targetDir / name, downloadBar(name), retries)
+                if runReport is not None: runReport.count('download', bytes = localPath.stat().st_size, collection = name)
+                if onFetched: onFetched(localPath)
+                return localPath
+
+            jobs = {executor.submit(fetch, name): name for name in archiveNames}
+            try:
+                for job in as_completed(jobs):
+                    localPath = job.result()
+                    downloaded.append(localPath)
+                    if onComplete: onComplete(localPath)
+            except BaseException:
+                for job in jobs: job.cancel()
+                if onFailed: onFailed()
+                raise
+    finally:
+        pool.close()
+    return downloaded
@@ -3,83 +3,194 @@
 # Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
 # https://creativecommons.org/licenses/by/4.0/legalcode
 
-# This script prepares the user's python environment to run the installer, 
-# then downloads and extracts the 2019 historic trademark applications
+# This script downloads and extracts the 2019 historic trademark applications
 # bulk data release from CIPO's IP Horizons SFTP server.
-# The user must provide their own SFTP credentials.
+# The user must provide their own SFTP credentials: the username as --user (or
+# CA_TM_USER) and the password in CA_TM_PASSWORD, or at the prompts when run at a
+# terminal. The pysftp package is required (pip install pysftp tqdm lxml).
 # The user may also need to directly connect to the SFTP server 
 # via an SFTP client prior to running this script in order to 
 # validate the server's SSH certificate on their machine.
 # XML parsers can be run on the files extracted and processed  
 # by this script to generate research-ready CSV files.
+# Also run as python canada_tm.py download (and concat, to concatenate extracted files).
 
+import argparse
 import sys
-import subprocess
-
-# implement pip as a subprocess to install needed nonstandard libraries:
-print('Installing needed nonstandard python libraries...')
-subprocess.check_call([sys.executable, '-m', 'pip', 'install',
-'pysftp', 'tqdm', 'lxml', 'regex'])
-# process output with an API in the subprocess module:
-reqs = subprocess.check_output([sys.executable, '-m', 'pip',
-'freeze'])
-installed_packages = [r.decode().split('==')[0] for r in reqs.split()]
-print(f'\nCurrently installed packages are {installed_packages}\n')
-
-import pysftp
-import getpass
 from pathlib import Path
 import os
 from zipfile import ZipFile
 from tqdm import tqdm
+import time
+from xml_sources import spliceCollection
+from sftp_download import downloadArchives
+from run_report import RunReport, timing
+from canada_tm import ask
 
-def main():
+downloadReportFile = 'CA_TM_download_report.json' # the run report of the download, in the destination folder
+checkHost = 'iphorizonspi.opic-cipo.ca' # the server against which credentials are verified
+sftpHost = '38.117.69.16' # the server from which the archives are downloaded
+remoteDir = '/dev/cipo-d1/www/clients/client1/web3/web/cipo/client_downloads/Trademarks_Historical_2019_10'
+
+def extractArchive(tempZip, targetDir, runReport = None):
+    '''extract the XML files (only) from a downloaded ZIP archive into a folder
+    of targetDir named for the archive, then delete the archive; the extraction
+    is timed in runReport, if it is given
+    '''
+    archiveStub = tempZip.stem[-3:]
+    with ZipFile(tempZip, 'r') as zip, timing(runReport, 'unzip', tempZip.name): 
+
+        # create separate destination folders for each ZIP archive's files
+        extractPath = targetDir / tempZip.stem
+        extractPath.mkdir(exist_ok=True)
+        
+        # Generate a list of XML files in the ZIP archive
+        archiveFileList = [candidate for candidate in zip.namelist() if candidate.endswith('.xml')]
+        archiveLength = len(archiveFileList)
+        
+        # Iterate over the list of XML files; extract to destination local folder
+        for confirmedXMLFile in tqdm(
+            archiveFileList, 
+            desc=f'Extracting XML records from archive {archiveStub}',
+            total = archiveLength, 
+            ncols = 100, 
+            unit=' files', 
+            leave = True,
+            position = 3
+        ):
+            zip.extract(confirmedXMLFile, path = extractPath)
+        if runReport is not None: runReport.count('unzip', bytes = sum(zip.getinfo(name).file_size for name in archiveFileList), records = archiveLength)
+       
+    # Delete local copy of ZIP archive (to save disk space; comment out if local copies desired)
+    os.remove(tempZip) 
+
+def concatenate(targetDir, runReport = None):
+    '''concatenate the XML files extracted into each archive folder of targetDir
+    into a single collection file per archive, reporting throughput as it goes
+    (and timing each collection in runReport, if it is given)
+    '''
+
+    # Build and count local archive folder list; report result
+
+    zipDirs = []
+    for folderName in targetDir.iterdir():
+        folderPath = targetDir / folderName
+        if folderPath.is_dir():
+            zipDirs.append(folderPath)
+    
+    dirCount = len(zipDirs)
     
+    print(f'\nFound {dirCount} archive folders. Concatenating .xml files...') 
+
+    # the XML header and top-level open and close tags (openString and closeString, defined in xml_sources.py)
+    # are located once in each file and only the record data between them is copied; they are
+    # written once at the start and end of the concatenated document
+
+    totalBytes = 0
+    startTime = time.perf_counter()
+
+    #loop over archive folders, build list of files in each
+
+    for count, archive in tqdm(
+        enumerate(zipDirs), 
+        desc = 'XML Processing -- Overall Progress', 
+        position = 1, 
+        leave = True, 
+        ncols=100,
+        unit=' archive',
+        total=len(zipDirs)
+    ):
+        archivename = archive.stem[-3:]
+        filenames = [f for f in archive.iterdir() if f.is_file() and f.suffix == '.xml']
+
+        # create destination concatenated file, copying the record data of each XML file into it
+        with tqdm(
+            desc = f'Concatenating Files in archive {archivename} ({count+1} of {dirCount})', 
+            ncols = 100,
+            unit='B',
+            unit_scale=True,
+            total = sum(f.stat().st_size for f in filenames),
+            position = 0
+        ) as pbar, timing(runReport, 'concatenate', f'{archivename}.xml', records = len(filenames)):
+            copied = spliceCollection(filenames, targetDir.joinpath(f'{archivename}.xml'), callback = pbar.update)
+            totalBytes += copied
+        if runReport is not None: runReport.count('concatenate', bytes = copied, collection = f'{archivename}.xml')
+
+    elapsed = time.perf_counter() - startTime
+    print(f'\nConcatenated {totalBytes / 1e6:,.1f} MB into {dirCount} collections in {elapsed:,.1f} s ({totalBytes / 1e6 / max(elapsed, 1e-9):,.1f} MB/s).')
+
+def argumentParser():
+    '''the command-line options of sftp_secure.py (also those of canada_tm.py download)'''
+    parser = argparse.ArgumentParser(description='Download and extract the CIPO historical trademark bulk data (the password is read from CA_TM_PASSWORD, or prompted for at a terminal).')
+    parser.add_argument('destDir', nargs='?', help='full path of the destination folder; at least 70GB of free disk space is needed (prompted for if omitted)')
+    parser.add_argument('--user', help='CIPO IP Horizons username (prompted for if omitted)')
+    parser.add_argument('--keep-zips', action='store_true', help='keep the ZIP archives for direct parsing (iterparse_all.py --zips) instead of extracting and concatenating them')
+    parser.add_argument('--connections', type=int, default=4, help='number of simultaneous SFTP connections (default: 4)')
+    return parser
+
+def concatParser():
+    '''the command-line options of canada_tm.py concat'''
+    parser = argparse.ArgumentParser(description='Concatenate the record files extracted into the archive folders of an XML_raw folder into one XML collection per archive.')
+    parser.add_argument('sourceDir', nargs='?', help='full path of the XML_raw folder (prompted for if omitted)')
+    return parser
+
+def concatMain(args = None):
+
+    args = args or concatParser().parse_args()
+    targetDir = Path(ask(args.sourceDir, 'Provide full path of XML_raw folder:', 'sourceDir'))
+    runReport = RunReport()
+    concatenate(targetDir, runReport)
+    runReport.save(targetDir.parent / downloadReportFile)
+
+def signIn(user = None):
+    '''the CIPO IP Horizons username and password, verified against the SFTP server: given as user
+    (or CA_TM_USER) and in CA_TM_PASSWORD, and tried once, or typed in at the prompts, with 3 attempts
+    '''
+    import pysftp # imported here, so that the script's help and the other subcommands do not need it
+
     # Verify credentials with CIPO SFTP server: 3 strikes and you're out!
+    # (only where the credentials are typed in; given credentials are tried once)
 
+    interactive = not (user or os.environ.get('CA_TM_USER')) or not os.environ.get('CA_TM_PASSWORD')
     attempts = 0
 
     while attempts < 3:
 
         try:
-            userID = input('Enter CIPO IP Horizons Username: ')
-            userPWD = getpass.getpass(f'Enter password for {userID}: ')
+            userID = ask(user, 'Enter CIPO IP Horizons Username: ', 'user')
+            userPWD = ask(None, f'Enter password for {userID}: ', 'password', secret = True)
             with pysftp.Connection(
-                host='iphorizonspi.opic-cipo.ca', 
+                host=checkHost, 
                 username = userID, 
                 password = userPWD
             ) as sftp:
                 print("Connection succesfully established ... ")
-            break
+            return userID, userPWD
 
+        except SystemExit:
+            raise
         except:
             attempts += 1
-            if attempts < 3: 
+            if attempts < 3 and interactive: 
                 print(f'Authentication Failed. Attempt {attempts} of 3.')
+                user = None
                 continue
             else: 
-                print('Authentication failed. Too many failed attempts. Disconnecting.')
-                sys.exit()
+                print('Authentication failed. Too many failed attempts. Disconnecting.' if interactive else 'Authentication failed. Disconnecting.')
+                sys.exit(1)
 
-    #identify local target directory and create local target file
-    
-    localpath = Path(input('Enter full destination path (NOTE: at least 70GB free disk space needed):'))
+def listArchives(connect, localpath):
+    '''the names of the data archives on the SFTP server (over a connection made by connect()),
+    also saved to zipfilelist.txt in the folder localpath
+    '''
     ziplist = localpath / 'zipfilelist.txt'
-    
-    # Initiate SFTP connection
-
-    with pysftp.Connection(
-        host='38.117.69.16', 
-        username = userID, 
-        password = userPWD
-    ) as sftp:
-            
-        sourceDir = '/dev/cipo-d1/www/clients/client1/web3/web/cipo/client_downloads/Trademarks_Historical_2019_10'
+
+    with connect() as sftp:
     
         # extract a list of archives and save to local index file
 
         with ziplist.open('w') as outfile:
-            sftp.cwd(sourceDir)
+            sftp.cwd(remoteDir)
             filetree = sftp.listdir()
             for f in tqdm(
                 filetree, 
@@ -91,147 +202,78 @@ def main():
                     print(f, file = outfile)
             print(f'File list saved as {ziplist.absolute()}')
 
-        # create a target local directory to receive downloaded files
-        targetDir = localpath / "XML_raw"
-        targetDir.mkdir(exist_ok=True)
+    # Read in and save list of ZIP archives (zipfilelist.txt)
+    with ziplist.open('r') as f:
+        return [item.rstrip() for item in f.readlines()]
 
-        # Read in and save list of ZIP archives (zipfilelist.txt)
-        with ziplist.open('r') as f:
+def main(args = None):
 
-            # count number of archives to be extracted and initialize counter
-            zipCounter = 0
-            archiveList = f.readlines()
-            zipTotal = len(archiveList)
-        
-            # Iterate over list of ZIP archives
-            for item in tqdm(
-                archiveList, 
-                desc='Download/Extraction--Total Progress', 
-                unit=' archive', 
-                total=zipTotal, 
-                ncols = 100, 
-                position = 1, 
-                leave = True
-            ):
-                
-                # Increment archive counter
-                zipCounter += 1
-
-                # Identify and Download the ZIP archive from the archive list
-                archiveName = item.rstrip()
-                archiveStub = archiveName[-7:-4]
-
-                # Find the archive on the SFTP server 
-                # and create a local path for its target destination
-                zipPath = sourceDir + '/' + archiveName
-                tempZip = targetDir / archiveName
-
-                # Get the archive size for the progress bar
-                filesize = sftp.lstat(zipPath).st_size
-
-                # Download the archive
-                with tqdm(
-                    desc=f'Downloading archive {archiveStub}, number {zipCounter} of {zipTotal}', 
-                    total = filesize, 
-                    unit_scale=True, 
-                    ncols=100, 
-                    unit='B', 
-                    leave=True,
-                    position = 2
-                ) as pbar:
-                    def downloadBar(downloaded, size):
-                        pbar.update(downloaded-pbar.n)
-                    #The next line is the actual download command
-                    sftp.get(remotepath = zipPath, localpath = tempZip, callback=downloadBar)
-                
-                #Extract XML files (only) from the downloaded ZIP archive
-                with ZipFile(tempZip, 'r') as zip: 
-
-                    # create separate destination folders for each ZIP archive's files
-                    extractPath = targetDir / Path(archiveName).stem
-                    extractPath.mkdir(exist_ok=True)
-                    
-                    # Generate a list of XML files in the ZIP archive
-                    archiveFileList = zip.namelist()
-                    for candidate in archiveFileList: 
-                        if candidate.endswith('.xml') == False:
-                            archiveFileList.remove(candidate)
-                    archiveLength = len(archiveFileList)
-                    
-                    # Iterate over the list of XML files; extract to destination local folder
-                    for confirmedXMLFile in tqdm(
-                        archiveFileList, 
-                        desc=f'Extracting XML records from archive {archiveStub}',
-                        total = archiveLength, 
-                        ncols = 100, 
-                        unit=' files', 
-                        leave = True,
-                        position = 3
-                    ):
-                        zip.extract(confirmedXMLFile, path = extractPath)
-                   
-                    # Delete local copy of ZIP archive (to save disk space; comment out if local copies desired)
-                    os.remove(tempZip) 
-    
-    print(f'\n{zipTotal} archives downloaded and extracted.')
-    print('\nDisconnected. SFTP session complete.')
-    print('\nProcessing XML records...')
+    args = args or argumentParser().parse_args()
+    import pysftp # imported here, so that the script's help and the other subcommands do not need it
 
-    # Build and count local archive folder list; report result
+    userID, userPWD = signIn(args.user)
 
-    zipDirs = []
-    for folderName in targetDir.iterdir():
-        folderPath = targetDir / folderName
-        if folderPath.is_dir():
-            zipDirs.append(folderPath)
+    #identify local target directory
     
-    dirCount = len(zipDirs)
+    localpath = Path(ask(args.destDir, 'Enter full destination path (NOTE: at least 70GB free disk space needed):', 'destDir'))
+
+    # ZIP archives may be kept as downloaded and parsed directly (iterparse_all.py --zips),
+    # which skips the extraction and concatenation passes and their disk space
+
+    keepZips = args.keep_zips
+    connections = args.connections
+
+    def connect():
+        return pysftp.Connection(
+            host=sftpHost, 
+            username = userID, 
+            password = userPWD
+        )
     
-    print(f'\nFound {dirCount} archive folders. Concatenating .xml files...') 
+    # extract a list of archives over an SFTP connection and save to local index file
 
-    # assign string variables for  XML header and top-level opening and closing tags 
-    # to be removed from concatenated files; they'll be added back in once 
-    # at the start and end of the concatenated document
+    archiveList = listArchives(connect, localpath)
+    zipTotal = len(archiveList)
+    sourceDir = remoteDir
 
-    openString = '<?xml version=\"1.0\" encoding=\"UTF-8\"?><tmk:TrademarkApplication xmlns:catmk=\"http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Trademark\" xmlns:ns4=\"http://www.w3.org/1998/Math/MathML\" xmlns:ns3=\"http://www.oasis-open.org/tables/exchange/1.0\" xmlns:com=\"http://www.wipo.int/standards/XMLSchema/ST96/Common\" xmlns:cacom=\"http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Common\" xmlns:xs=\"http://www.w3.org/2001/XMLSchema\" xmlns:tmk=\"http://www.wipo.int/standards/XMLSchema/ST96/Trademark\" xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\" com:st96Version=\"V3_0\" com:ipoVersion=\"V1_4\">'
-    closeString = '</tmk:TrademarkApplication>'
+    # create a target local directory to receive downloaded files
+    targetDir = localpath / "XML_raw"
+    targetDir.mkdir(exist_ok=True)
 
-    #loop over archive folders, build list of files in each
+    # Download the archives over several SFTP connections at once, extracting each archive
+    # as soon as it has arrived (unless it is kept for direct parsing); partial downloads
+    # left by a dropped connection or an earlier interrupted run are resumed
 
-    for count, archive in tqdm(
-        enumerate(zipDirs), 
-        desc = 'XML Processing -- Overall Progress', 
-        position = 1, 
-        leave = True, 
-        ncols=100,
-        unit=' archive',
-        total=len(zipDirs)
-    ):
-        archivename = archive.stem[-3:]
-        filenames = archive.iterdir()
-
-        # create destination concatenated file
-        with targetDir.joinpath(f'{archivename}.xml').open('w') as xmlout:
-            # Pass in XML header and top-level open tag
-            xmlout.write(openString)
-            # loop over XML records in archive and pass text to concatenated file, 
-            # removing XML headers and top-level tags
-            for fname in tqdm(
-                filenames, 
-                desc = f'Concatenating Files in archive {archivename} ({count+1} of {dirCount})', 
-                ncols = 100,
-                unit=' files',
-                total = len([f for f in archive.iterdir() if f.is_file() and f.suffix == '.xml']),
-                position = 0
-            ):
-                if fname.is_file() and fname.suffix == '.xml':
-                    with fname.open('r') as xmlin:
-                        for line in xmlin:
-                            xmlout.write(line.replace(openString, '').replace(closeString, ''))
-            #add top-level close tag to end of file
-            xmlout.write(closeString)
+    # the download, extraction and concatenation of each archive are timed, in a run report
+    # saved to the destination folder (see run_report.py)
+
+    runReport = RunReport()
+
+    downloadArchives(
+        connect, 
+        sourceDir, 
+        archiveList, 
+        targetDir, 
+        connections = connections, 
+        onComplete = None if keepZips else lambda tempZip: extractArchive(tempZip, targetDir, runReport),
+        runReport = runReport
+    )
+    
+    if keepZips:
+        runReport.save(localpath / downloadReportFile)
+        print(f'\n{zipTotal} archives downloaded.')
+        print('\nDisconnected. SFTP session complete.')
+        print(f'\nRun iterparse_all.py --zips on the folder {targetDir.absolute()} to parse the archives directly.')
+        return
+
+    print(f'\n{zipTotal} archives downloaded and extracted.')
+    print('\nDisconnected. SFTP session complete.')
+    print('\nProcessing XML records...')
+
+    concatenate(targetDir, runReport)
+    runReport.save(localpath / downloadReportFile)
 
     print('\nCIPO Historical TM Bulk Data has been Downloaded and Processed.')
     print(f'\nIt can be found in the folder {targetDir.absolute()}')
 
-if __name__ == "__main__": main()
\ No newline at end of file
+if __name__ == "__main__": main()
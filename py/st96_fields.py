@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# The registry of ST96 namespaces and data fields for the Canada Trademarks Dataset.
+# Each class below holds the field dictionaries for one data file, mapping the file's
+# fields to the XPath expressions from which they are extracted; every dictionary is
+# compiled once, here, at import (see field_plan.py), and imported by the iterparse_*
+# script for that file. To add a data file, add its field dictionaries here and write
+# an iterparse_* script exposing headerRow, outFile and extract(elem, writeobject). The
+# dictionaries of the flat tables are also compiled for the streaming event backend.
+# A dictionary is compiled into a single plan (compileFields) only where that is faster than
+# one XPath expression per field (compileXPaths), as measured per dictionary with field_plan.py.
+
+from field_plan import compileFields, compileXPaths
+from event_extract import compileEvents
+
+# the xml namespace dictionary for the parsers
+
+ns_dict = {
+    'catmk' : "http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Trademark",
+    'com' : "http://www.wipo.int/standards/XMLSchema/ST96/Common",
+    'cacom' : "http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Common",
+    'tmk' : "http://www.wipo.int/standards/XMLSchema/ST96/Trademark"
+}
+
+# the ST13 application number, from which every file's AppNo and ExtNo fields are taken
+
+appNumber = './/tmk:Trademark/com:ApplicationNumber/com:ST13ApplicationNumber/text()'
+keyFields = {
+    'AppNo':    appNumber,
+    'ExtNo':    appNumber
+}
+keyNeeds = compileXPaths(keyFields, ns_dict) # the record keys listed by iterparse_all.py
+keyEvents = compileEvents(keyFields, ns_dict) # the record keys listed by iterparse_all.py, for the event backend
+keyTypes = {'AppNo': 'int32', 'ExtNo': 'int8'} # typed as integers in the columnar outputs
+
+class main:
+    '''CA_TM_main.csv'''
+
+    tagNeeds = compileFields({
+        **keyFields,
+        'TMText':       './/tmk:MarkSignificantVerbalElementText/text()',
+        'TMDesc':       './/tmk:MarkDescriptionText/text()',
+        'RegNo':        './/tmk:Trademark/com:RegistrationNumber/text()',
+        'MadridNo':     './/tmk:InternationalMarkIdentifier/text()',
+        'MarkType':     './/tmk:MarkRepresentation/tmk:MarkFeatureCategory/text()',
+        'MarkClassCode': './/catmk:TrademarkClassCode/text()',
+        'MarkClassDesc': './/catmk:TrademarkClassDescription[@com:languageCode="en"]/text()',
+        'LegisCode':    './/catmk:LegislationCode/text()',
+        'LegisDesc':    './/catmk:LegislationDescription[@com:languageCode="en"]/text()',
+        'StanChar':     './/tmk:MarkStandardCharacterIndicator/text()',
+        'CurrStatus':   './/tmk:MarkCurrentStatusInternalDescriptionText/text()',
+        'StatusDate':   './/tmk:MarkCurrentStatusDate/text()',
+        'AppDate':      './/com:ApplicationDate/text()',
+        'PubDate':      './/tmk:PublicationActionDate/text()',
+        'AllowDate':    './/catmk:AllowedDate/text()',
+        'AbanDate':     './/tmk:ApplicationAbandonedDate/text()',
+        'RegDate':      './/com:RegistrationDate/text()',
+        'Canceln':      './/tmk:CancellationProceedings',
+        'Oppn':         './/tmk:OppositionProceedingBag',
+        'Doubtful':     './/catmk:DoubtfulCaseBag',
+        'RenewedDate':  './/com:RenewalDate/text()',
+        'TermDate':     './/tmk:TerminationDate/text()', # NB: This element is mislabeled in the CIPO data spec: the spec lists the namespace as com
+        'AcquiredDist': './/tmk:TradeDistinctivenessIndicator/text()',
+        'ForeignAppBasis': './/tmk:BasisForeignApplicationIndicator/text()',
+        'ForeignRegBasis': './/tmk:BasisForeignRegistrationIndicator/text()',
+        'UseBasis':     './/tmk:BasisUseIndicator/text()',
+        'ITUBasis':     './/tmk:BasisIntentToUseIndicator/text()',
+        'UseEvid':      './/tmk:UseRightIndicator/text()',
+        'NonUse':       './/tmk:NonUseCancelledIndicator/text()',
+        'Disclaimer':   './/tmk:MarkDisclaimerText/text()',
+        'Restriction':  './/tmk:UseLimitationText/text()',
+        'OwnerName':    './/tmk:ApplicantBag/tmk:Applicant/com:LegalEntityName/text()',
+        'AppLanguage':  './/com:ApplicationLanguageCode/text()',
+        'Section9Code': './/catmk:Section9Code/text()',
+        'Section9Desc': False,
+        'GICode':       './/catmk:GeographicalIndicationKindCategory/cacom:CategoryCode/text()',
+        'GIDesc':       False
+    }, ns_dict)
+
+    # the typed columns of the data file in its columnar (Parquet or Arrow) version; all others are strings
+
+    columnTypes = {
+        **keyTypes,
+        'MarkClassCode': 'int8', 'LegisCode': 'int8', 'StanChar': 'int8',
+        'StatusDate': 'date32', 'AppDate': 'date32', 'PubDate': 'date32', 'AllowDate': 'date32',
+        'AbanDate': 'date32', 'RegDate': 'date32', 'RenewedDate': 'date32', 'TermDate': 'date32',
+        'Canceln': 'int8', 'Oppn': 'int8', 'Doubtful': 'int8', 'AcquiredDist': 'int8',
+        'ForeignAppBasis': 'int8', 'ForeignRegBasis': 'int8', 'UseBasis': 'int8', 'ITUBasis': 'int8',
+        'UseEvid': 'int8', 'NonUse': 'int8', 'Disclaimer': 'int8', 'Restriction': 'int8',
+        'Section9Code': 'int8', 'GICode': 'int8'
+    }
+
+    # the categorical columns written as integer codes in dictionary-encoded runs (iterparse_all.py --codes)
+
+    codedColumns = ['MarkType', 'MarkClassDesc', 'LegisDesc', 'CurrStatus', 'AppLanguage', 'Section9Desc', 'GIDesc']
+
+class parties:
+    '''CA_TM_parties.csv'''
+
+    # Root-level Tags:
+
+    tagNeeds = compileFields({
+        **keyFields,
+        'ApplicantBag': './/tmk:Applicant',
+        'RepBag':       './/tmk:NationalRepresentative',
+        'OppBag':       './/tmk:OppositionProceedingBag',
+        'CancelBag':    './/tmk:CancellationProceedings',
+        'Interested':   './/catmk:InterestedParty'
+    }, ns_dict)
+
+    # Second-Level Tags:
+
+    oppTags = compileXPaths({
+        'ProceedingType':   './/catmk:OppositionCaseTypeDescription[@com:languageCode="en"]/text()',
+        'ProceedingSeq':    './/com:OppositionIdentifier/text()',
+        'Plaintiff':        './/tmk:Plaintiff',
+        'Defendant':        './/tmk:Defendant'
+    }, ns_dict)
+
+    cancelTags = compileXPaths({
+        'ProceedingType':   './/catmk:OppositionCaseTypeDescription[@com:languageCode="en"]/text()',
+        'ProceedingSeq':    './/tmk:LegalProceedingIdentifier/text()',
+        'Plaintiff':        './/tmk:Plaintiff',
+        'Defendant':        './/tmk:Defendant'
+    }, ns_dict)
+
+    # Deepest-level Tags
+
+    partyFields = {
+        'PartyName':        './com:Contact/com:Name/com:EntityName/text()',
+        'AgentCode':        './com:CommentText/text()',
+        'Address':          './com:Contact/com:PostalAddressBag//com:AddressLineText/text()|./com:Contact/com:PostalAddressBag//com:AddressLineText/text()',
+        'Province':         './com:Contact/com:PostalAddressBag//com:GeographicRegionName/text()',
+        'Country':          './com:Contact/com:PostalAddressBag//com:CountryCode/text()',
+        'PostCode':         './com:Contact/com:PostalAddressBag//com:PostalCode/text()'
+    }
+
+    interestedTags = compileFields({'PartyType':   './/catmk:InterestedPartyCategory/text()', **partyFields}, ns_dict)
+
+    # the same dictionary serves the parties to a proceeding (repTags in iterparse_parties.py),
+    # whose representatives are searched for as well
+
+    partyTags = compileXPaths({**partyFields, 'Representative': './/com:Representative'}, ns_dict)
+
+    # Address fields: to be cleared for recursive parsing of Representatives
+
+    postalTags = compileXPaths({
+        'Address':  './/com:AddressLineText/text()|.//com:PostalAddressText/text()',
+        'Province': './/com:GeographicRegionName/text()',
+        'Country':  './/com:CountryCode/text()',
+        'PostCode': './/com:PostalCode/text()'
+    }, ns_dict)
+
+    columnTypes = keyTypes
+    codedColumns = ['PartyType', 'ProceedingType', 'Province']
+
+class allevents:
+    '''CA_TM_allevents.csv'''
+
+    # Root-level Tags:
+
+    tagNeeds = compileXPaths({
+        **keyFields,
+        'EventBag':         './/tmk:MarkEvent',
+        'FootnoteBag':      './/catmk:Footnote',
+        'CancelBag':        './/tmk:CancellationProceedings',
+        'OppBag':           './/tmk:OppositionProceedingBag'
+    }, ns_dict)
+
+    # Tags to search within the OppositionProceedingBag Tag, one level down from root:
+
+    FootnoteTags = compileXPaths({
+        'EventCode':        './/cacom:CategoryCode/text()',
+        'EventDesc':        './/cacom:CategoryDescription/text()',
+        'FilingDate':       './/cacom:RegisteredDate/text()',
+        'EventDate':        './/cacom:ChangedDate/text()'
+    }, ns_dict)
+
+    OppTags = compileXPaths({
+        'EventType':        './/catmk:OppositionCaseTypeDescription[@com:languageCode="en"]/text()',
+        'ProceedingSeq':    './/com:OppositionIdentifier/text()',
+        'FilingDate':       './/com:OppositionDate/text()',
+        'ProceedingStage':  './/catmk:ProceedingStage'
+    }, ns_dict)
+
+    # Tags to search within the CancellationProceedings Tag, one level down from root
+    # (note: the CIPO data dictionary has some mistakes here)
+
+    CancelTags = compileXPaths({
+        'EventType':        './/catmk:OppositionCaseTypeDescription[@com:languageCode="en"]/text()',
+        'ProceedingSeq':    './/tmk:LegalProceedingIdentifier/text()',
+        'FilingDate':       './/tmk:LegalProceedingFilingDate/text()',
+        'ProceedingStage':  './/catmk:ProceedingStage'
+    }, ns_dict)
+
+    # Proceeding Stage tags: two levels down from root, within the Opposition or Cancellation bags
+
+    stageTags = compileXPaths({
+        'StageCode':        './/catmk:ProceedingStageCode/text()',
+        'StageDesc':        './/catmk:ProceedingStageDescriptionText[@com:languageCode="en"]/text()',
+        'StageEvents':      './/tmk:ProceedingEvent'
+    }, ns_dict)
+
+    # Event data: Either lifecycle events one level down from root
+    # or proceeding events three levels down from root
+
+    eventTags = compileXPaths({
+        'EventCode':        './/tmk:MarkEventCode/text()',
+        'EventDesc':        './/tmk:MarkEventDescriptionText/text()',
+        'EventDate':        './/tmk:MarkEventDate/text()'
+    }, ns_dict)
+
+    columnTypes = {**keyTypes, 'FilingDate': 'date32', 'EventCode': 'int16', 'EventDate': 'date32'}
+    codedColumns = ['EventType', 'StageDesc', 'EventDesc']
+
+class claims:
+    '''CA_TM_claims.csv'''
+
+    tagNeeds = compileFields({
+        **keyFields,
+        'Claim':            './/catmk:Claim'
+    }, ns_dict)
+
+    claimTags = compileFields({
+        'ClaimTypeCode':    './/catmk:ClaimCategoryType/text()',
+        'ClaimTypeDesc':    './/catmk:ClaimTypeDescription/text()',
+        'ClaimSerialNo':    './/catmk:ClaimNumber/text()',
+        'ClaimCode':        './/catmk:ClaimCode/text()',
+        'ClaimDesc':        './/catmk:ClaimText/text()',
+        'Country':          './/catmk:ClaimCountryCode/text()',
+        'ForeignDocNo':     './/catmk:ClaimForeignRegistrationNbr/text()',
+        'ClaimedGoods':     './/catmk:GoodsServicesReferenceIdentifier/text()',
+        'CompleteDate':     './/catmk:StructuredClaimDate/text()',
+        'PartialDate':      './/catmk:UnstructuredClaimDate'
+    }, ns_dict)
+
+    dateTags = compileXPaths({
+        'Year':     './/catmk:ClaimYear/text()',
+        'Month':    './/catmk:ClaimMonth/text()',
+        'Day':      './/catmk:ClaimDay/text()'
+    }, ns_dict)
+
+    columnTypes = {
+        **keyTypes,
+        'ClaimTypeCode': 'int8', 'ClaimSerialNo': 'int16', 'ClaimCode': 'int8',
+        'Year': 'int16', 'Month': 'int8', 'Date': 'int8'
+    }
+    codedColumns = ['ClaimTypeDesc']
+
+class priority:
+    '''CA_TM_priority.csv'''
+
+    # Root-level Tags:
+
+    tagNeeds = compileFields({
+        **keyFields,
+        'PriorityClaim':    './/tmk:Priority'
+    }, ns_dict)
+
+    priorityTags = compileFields({
+        'PriorityCountry':  './/com:PriorityCountryCode/text()',
+        'PriorityDocNo':    './/com:ApplicationNumberText/text()',
+        'PriorityDate':     './/com:PriorityApplicationFilingDate/text()',
+        'PriorityComment':  './/com:CommentText/text()',
+        'PriorityClass':    './/tmk:ClassNumber/text()',
+        'PriorityGoods':    './/tmk:GoodsServicesDescriptionText/@com:sequenceNumber'
+    }, ns_dict)
+
+    columnTypes = {**keyTypes, 'PriorityDate': 'date32', 'PriorityClass': 'int8'}
+
+class goods:
+    '''CA_TM_goods.csv'''
+
+    fields = {
+        **keyFields,
+        'GoodsClass':   './/tmk:GoodsServicesBag//tmk:ClassDescription/tmk:ClassNumber/text()',
+        'GoodsSeq':     './/tmk:GoodsServicesBag//tmk:GoodsServicesDescriptionText/@com:sequenceNumber',
+        'GoodsDesc':    './/tmk:GoodsServicesBag//tmk:GoodsServicesDescriptionText/text()'
+    }
+    tagNeeds = compileXPaths(fields, ns_dict)
+    eventNeeds = compileEvents(fields, ns_dict) # for the streaming event backend (event_extract.py)
+
+    columnTypes = {**keyTypes, 'Class': 'int8', 'GoodsSeq': 'int32'}
+
+class classes:
+    '''CA_TM_classes.csv'''
+
+    fields = {
+        **keyFields,
+        'Classes':  './/tmk:GoodsServicesClassification/tmk:ClassNumber/text()'
+    }
+    tagNeeds = compileXPaths(fields, ns_dict)
+    eventNeeds = compileEvents(fields, ns_dict) # for the streaming event backend (event_extract.py)
+
+    columnTypes = {**keyTypes, **{f'IC{i}': 'int8' for i in range(1, 46)}}
+
+class vienna:
+    '''CA_TM_vienna.csv'''
+
+    fields = {
+        **keyFields,
+        'ViennaCategory':  './/com:ViennaClassification/com:ViennaCategory/text()',
+        'ViennaDivision':  './/com:ViennaClassification/com:ViennaDivision/text()',
+        'ViennaSection':  './/com:ViennaClassification/com:ViennaSection/text()'
+    }
+    tagNeeds = compileXPaths(fields, ns_dict)
+    eventNeeds = compileEvents(fields, ns_dict) # for the streaming event backend (event_extract.py)
+
+    columnTypes = {**keyTypes, 'ViennaSeq': 'int16', 'ViennaCategory': 'int8', 'ViennaDivision': 'int8', 'ViennaSection': 'int8'}
+
+# the typed columns of each data file in its columnar version, by file name
+
+tableTypes = {
+    'CA_TM_main.csv':       main.columnTypes,
+    'CA_TM_parties.csv':    parties.columnTypes,
+    'CA_TM_allevents.csv':  allevents.columnTypes,
+    'CA_TM_claims.csv':     claims.columnTypes,
+    'CA_TM_priority.csv':   priority.columnTypes,
+    'CA_TM_goods.csv':      goods.columnTypes,
+    'CA_TM_classes.csv':    classes.columnTypes,
+    'CA_TM_vienna.csv':     vienna.columnTypes
+}
+
+# the dictionary-encoded columns of each data file, by file name
+
+tableCodes = {
+    'CA_TM_main.csv':       main.codedColumns,
+    'CA_TM_parties.csv':    parties.codedColumns,
+    'CA_TM_allevents.csv':  allevents.codedColumns,
+    'CA_TM_claims.csv':     claims.codedColumns
+}
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A generator of synthetic ST96 collections of the shape of CIPO's records, seeded so that the same
+# arguments give the same files, for testing and benchmarking the parsers without the bulk data:
+#     python synth_st96.py path/to/root --collections 3 --records 10000
+
+import argparse
+import random
+from pathlib import Path
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from xml_sources import openString, closeString, writeCount
+
+# the vocabularies the synthetic records are drawn from
+
+statuses = ['Registered', 'Abandoned', 'Formalized', 'Advertised', 'Allowed', 'Expunged', 'Opposed', 'Searched']
+provinces = ['ON', 'QC', 'BC', 'AB', 'Ontario', 'Québec', 'British Columbia', 'Colombie-Britannique', 'Nouvelle-Écosse', '']
+countries = ['CA', 'CA', 'CA', 'US', 'US', 'GB', 'FR', 'DE', 'JP', 'CN']
+names = ['ACME Inc.', 'Northern  Widgets\n Ltd.', 'Société Générale de Marques', 'Maple &amp; Co.', 'Großhandel GmbH', '株式会社サンプル']
+eventDescs = ['Filed', 'Created', 'Formalized', 'Search Recorded', 'Examiner\'s First Report', 'Approved', 'Advertised', 'Allowed', 'Registered', 'Renewed']
+goodsWords = ['clothing', 'footwear', 'headgear', 'computer software', 'retail store services', 'coffee', 'beer', 'jewellery', 'cosmetics', 'restaurant services']
+
+def date(r, start = 1950, end = 2023):
+    return f'{r.randint(start, end)}-{r.randint(1, 12):02d}-{r.randint(1, 28):02d}'
+
+def contact(r, agent = False):
+    '''a com:Contact with a name and postal address (and, for a representative, an agent number)'''
+    lines = ''.join(f'<com:AddressLineText>{r.randint(1, 9999)} {r.choice(["Main", "King", "Rue Principale"])} St. &amp; Suite {r.randint(1, 99)}</com:AddressLineText>' for line in range(r.choice([1, 1, 2, 3])))
+    region = r.choice(provinces)
+    region = f'<com:GeographicRegionName>{region}</com:GeographicRegionName>' if region else ''
+    text = (
+        f'<com:Contact><com:Name><com:EntityName>{r.choice(names)}</com:EntityName></com:Name>'
+        '<com:PostalAddressBag><com:PostalAddress><com:PostalStructuredAddress>'
+        f'{lines}{region}<com:CountryCode>{r.choice(countries)}</com:CountryCode><com:PostalCode>K{r.randint(1, 9)}A {r.randint(0, 9)}B{r.randint(1, 9)}</com:PostalCode>'
+        '</com:PostalStructuredAddress></com:PostalAddress></com:PostalAddressBag></com:Contact>'
+    )
+    if agent: text += f'<com:CommentText>{r.randint(1000, 99999)}</com:CommentText>'
+    return text
+
+def proceedingStage(r, code, desc):
+    events = ''.join(
+        f'<tmk:ProceedingEvent><tmk:MarkEventCode>{r.randint(100, 300)}</tmk:MarkEventCode><tmk:MarkEventDescriptionText>{r.choice(["Filed", "Notice", "Counter Statement", "Decision"])}</tmk:MarkEventDescriptionText><tmk:MarkEventDate>{date(r, 1990)}</tmk:MarkEventDate></tmk:ProceedingEvent>'
+        for event in range(r.randint(1, 4))
+    )
+    return (
+        f'<catmk:ProceedingStage><catmk:ProceedingStageCode>{code}</catmk:ProceedingStageCode>'
+        f'<catmk:ProceedingStageDescriptionText com:languageCode="en">{desc}</catmk:ProceedingStageDescriptionText>'
+        f'<tmk:ProceedingEventBag>{events}</tmk:ProceedingEventBag></catmk:ProceedingStage>'
+    )
+
+def record(r, number):
+    '''one synthetic TrademarkBag, for application number number'''
+    parts = ['<tmk:TrademarkBag><tmk:Trademark>']
+    add = parts.append
+    extension = r.choice(['00', '00', '00', '00', '01', '02'])
+    add(f'<com:ApplicationNumber><com:ST13ApplicationNumber>CA500000{number:09d}{extension}</com:ST13ApplicationNumber></com:ApplicationNumber>')
+    if r.random() < .6:
+        add(f'<com:RegistrationNumber>TMA{r.randint(1, 1100000)}</com:RegistrationNumber><com:RegistrationDate>{date(r)}</com:RegistrationDate>')
+    if r.random() < .05: add(f'<com:InternationalRegistrationNumber>{r.randint(1000000, 1700000)}</com:InternationalRegistrationNumber>')
+    add(f'<com:ApplicationDate>{date(r)}</com:ApplicationDate>')
+    add(f'<com:ApplicationLanguageCode>{r.choice(["en", "en", "en", "fr"])}</com:ApplicationLanguageCode>')
+    legislation = r.choice([1, 1, 1, 1, 2, 3, 4])
+    add(f'<catmk:LegislationCode>{legislation}</catmk:LegislationCode><catmk:LegislationDescription com:languageCode="en">{["TMA", "UCA", "TMDA", "NFLD"][legislation - 1]}</catmk:LegislationDescription><catmk:LegislationDescription com:languageCode="fr">LMC</catmk:LegislationDescription>')
+    add(f'<tmk:MarkCurrentStatusDate>{date(r, 2000)}</tmk:MarkCurrentStatusDate><tmk:MarkCurrentStatusInternalDescriptionText>{r.choice(statuses)}</tmk:MarkCurrentStatusInternalDescriptionText>')
+    if r.random() < .5: add(f'<tmk:PublicationDate>{date(r)}</tmk:PublicationDate>')
+    if r.random() < .02: add(f'<catmk:Section9Code>{r.randint(1, 9)}</catmk:Section9Code>')
+    if r.random() < .01: add(f'<catmk:GeographicalIndicationKindCategory><cacom:CategoryCode>{r.randint(1, 3)}</cacom:CategoryCode></catmk:GeographicalIndicationKindCategory>')
+    if r.random() < .2: add('<tmk:MarkDisclaimerText>The right to the exclusive use of the words is disclaimed apart from the trademark.</tmk:MarkDisclaimerText>')
+    add(f'<tmk:BasisUseIndicator>{r.choice(["true", "false"])}</tmk:BasisUseIndicator>')
+    markClass = r.choice([1, 1, 1, 1, 1, 2, 4])
+    add(f'<catmk:TrademarkClassCode>{markClass}</catmk:TrademarkClassCode><catmk:TrademarkClassDescription com:languageCode="en">{ {1: "Trademark", 2: "Official Mark", 4: "Certification Mark"}[markClass] }</catmk:TrademarkClassDescription>')
+
+    # the mark, with Vienna codes for design marks
+    design = r.random() < .4
+    add(f'<tmk:MarkRepresentation><tmk:MarkFeatureCategory>{"Design" if design else "Word"}</tmk:MarkFeatureCategory><tmk:MarkReproduction><tmk:WordMarkSpecification>')
+    add(f'<tmk:MarkSignificantVerbalElementText>MARK {number}  {r.choice(goodsWords).upper()}\n</tmk:MarkSignificantVerbalElementText>')
+    if r.random() < .5: add(f'<tmk:MarkStandardCharacterIndicator>{r.choice(["true", "false"])}</tmk:MarkStandardCharacterIndicator>')
+    add('</tmk:WordMarkSpecification>')
+    if design:
+        add('<tmk:MarkImageBag><tmk:MarkImage><tmk:MarkImageClassification><com:ViennaClassificationBag>')
+        for code in range(r.choice([1, 2, 3, 5, 8])):
+            add(f'<com:ViennaClassification><com:ViennaCategory>{r.randint(1, 29)}</com:ViennaCategory><com:ViennaDivision>{r.randint(1, 19)}</com:ViennaDivision><com:ViennaSection>{r.randint(1, 25)}</com:ViennaSection></com:ViennaClassification>')
+        add('</com:ViennaClassificationBag></tmk:MarkImageClassification></tmk:MarkImage></tmk:MarkImageBag>')
+    add('</tmk:MarkReproduction></tmk:MarkRepresentation>')
+
+    # goods and services, by Nice class
+    add('<tmk:GoodsServicesBag>')
+    for sequence in range(r.choice([0, 1, 1, 2, 3, 5])):
+        niceClass = r.randint(1, 45)
+        description = '; '.join(r.choice(goodsWords) for word in range(r.choice([1, 3, 10, 40])))
+        add(f'<tmk:GoodsServices><tmk:GoodsServicesClassificationBag><tmk:GoodsServicesClassification><tmk:ClassNumber>{niceClass}</tmk:ClassNumber></tmk:GoodsServicesClassification></tmk:GoodsServicesClassificationBag>')
+        add(f'<tmk:ClassDescriptionBag><tmk:ClassDescription><tmk:ClassNumber>{niceClass}</tmk:ClassNumber><tmk:GoodsServicesDescriptionText com:sequenceNumber="{sequence + 1}">{description}</tmk:GoodsServicesDescriptionText></tmk:ClassDescription></tmk:ClassDescriptionBag></tmk:GoodsServices>')
+    add('</tmk:GoodsServicesBag>')
+
+    # applicants and representatives
+    add('<tmk:ApplicantBag>')
+    for applicant in range(r.choice([1, 1, 1, 2])):
+        add(f'<tmk:Applicant><com:LegalEntityName>Owner {number}-{applicant}</com:LegalEntityName>{contact(r)}</tmk:Applicant>')
+    add('</tmk:ApplicantBag>')
+    if r.random() < .8: add(f'<tmk:NationalRepresentativeBag><tmk:NationalRepresentative>{contact(r, agent = True)}</tmk:NationalRepresentative></tmk:NationalRepresentativeBag>')
+    if r.random() < .3: add(f'<tmk:NationalCorrespondent>{contact(r)}</tmk:NationalCorrespondent>')
+
+    # priority claims
+    if r.random() < .1:
+        add('<tmk:PriorityBag>')
+        for priority in range(r.choice([1, 1, 2])):
+            add(f'<tmk:Priority><com:PriorityCountryCode>{r.choice(countries)}</com:PriorityCountryCode><com:ApplicationNumberText>{r.randint(1, 99999999)}</com:ApplicationNumberText><com:PriorityApplicationFilingDate>{date(r, 1990)}</com:PriorityApplicationFilingDate>')
+            add(f'<com:CommentText>priority  claimed\n</com:CommentText><tmk:ClassNumber>{r.randint(1, 45)}</tmk:ClassNumber>')
+            add(''.join(f'<tmk:GoodsServicesDescriptionText com:sequenceNumber="{sequence + 1}">{r.choice(goodsWords)}</tmk:GoodsServicesDescriptionText>' for sequence in range(r.randint(1, 3))))
+            add('</tmk:Priority>')
+        add('</tmk:PriorityBag>')
+
+    # the history of the application
+    add('<tmk:MarkEventBag>')
+    for event in range(r.choice([2, 4, 6, 8, 12, 20])):
+        add(f'<tmk:MarkEvent><tmk:MarkEventCode>{r.randint(1, 80)}</tmk:MarkEventCode><tmk:MarkEventDescriptionText>{r.choice(eventDescs)}</tmk:MarkEventDescriptionText><tmk:MarkEventDate>{date(r)}</tmk:MarkEventDate></tmk:MarkEvent>')
+    add('</tmk:MarkEventBag>')
+
+    # opposition and cancellation proceedings
+    if r.random() < .03:
+        add('<tmk:OppositionProceedingBag>')
+        for proceeding in range(r.choice([1, 1, 2])):
+            add(f'<tmk:OppositionProceeding><com:OppositionIdentifier>{proceeding + 1}</com:OppositionIdentifier><com:OppositionDate>{date(r, 1990)}</com:OppositionDate><catmk:OppositionCaseTypeDescription com:languageCode="en">Opposition</catmk:OppositionCaseTypeDescription>')
+            add(f'<tmk:Plaintiff>{contact(r)}<com:Representative>{contact(r, agent = True)}</com:Representative></tmk:Plaintiff><tmk:Defendant>{contact(r)}</tmk:Defendant>')
+            add(proceedingStage(r, 1, 'Statement of Opposition') + '</tmk:OppositionProceeding>')
+        add('</tmk:OppositionProceedingBag>')
+    if r.random() < .02:
+        add('<tmk:CancellationProceedingsBag><tmk:CancellationProceedings>')
+        add(f'<tmk:LegalProceedingIdentifier>1</tmk:LegalProceedingIdentifier><tmk:LegalProceedingFilingDate>{date(r, 1990)}</tmk:LegalProceedingFilingDate><catmk:OppositionCaseTypeDescription com:languageCode="en">Section 45</catmk:OppositionCaseTypeDescription>')
+        add(f'<tmk:Plaintiff>{contact(r)}</tmk:Plaintiff>{proceedingStage(r, 2, "Section 45 Notice")}')
+        add('</tmk:CancellationProceedings></tmk:CancellationProceedingsBag>')
+
+    # interested parties, footnotes and claims
+    if r.random() < .1:
+        add(f'<catmk:InterestedPartyBag><catmk:InterestedParty><catmk:InterestedPartyCategory>{r.choice(["Licensee", "Registered User", "Predecessor in Title"])}</catmk:InterestedPartyCategory>{contact(r)}</catmk:InterestedParty></catmk:InterestedPartyBag>')
+    if r.random() < .2:
+        add('<catmk:FootnoteBag>')
+        for footnote in range(r.choice([1, 2, 4])):
+            add(f'<catmk:Footnote><cacom:CategoryCode>{r.randint(1, 30)}</cacom:CategoryCode><cacom:CategoryDescription>{r.choice(["Amendment", "Change of Name", "Merger"])}</cacom:CategoryDescription><cacom:RegisteredDate>{date(r, 1980)}</cacom:RegisteredDate><cacom:ChangedDate>{date(r, 1980)}</cacom:ChangedDate></catmk:Footnote>')
+        add('</catmk:FootnoteBag>')
+    if r.random() < .5:
+        add('<catmk:ClaimBag>')
+        for claim in range(r.choice([1, 1, 2, 3])):
+            claimType = r.choice(['10', '11', '11', '11', '15', '17'])
+            add(f'<catmk:Claim><catmk:ClaimCategoryType>{claimType}</catmk:ClaimCategoryType><catmk:ClaimTypeDescription>{r.choice(["Used in Canada", "Proposed Use in Canada", "Made Known in Canada"])}</catmk:ClaimTypeDescription><catmk:ClaimNumber>{claim + 1}</catmk:ClaimNumber>')
+            add(f'<catmk:ClaimCode>{r.randint(1, 7)}</catmk:ClaimCode><catmk:ClaimText>Used in Canada  since\n at least as early as</catmk:ClaimText><catmk:ClaimCountryCode>{r.choice(countries)}</catmk:ClaimCountryCode>')
+            add(''.join(f'<catmk:GoodsServicesReferenceIdentifier>{reference + 1}</catmk:GoodsServicesReferenceIdentifier>' for reference in range(r.randint(1, 3))))
+            if r.random() < .6:
+                add(f'<catmk:StructuredClaimDate>{date(r)}</catmk:StructuredClaimDate>')
+            else:
+                day = f'<catmk:ClaimDay>{r.randint(1, 28)}</catmk:ClaimDay>' if r.random() < .3 else ''
+                add(f'<catmk:UnstructuredClaimDate><catmk:ClaimYear>{r.randint(1900, 2020)}</catmk:ClaimYear><catmk:ClaimMonth>{r.randint(1, 12):02d}</catmk:ClaimMonth>{day}</catmk:UnstructuredClaimDate>')
+            add('</catmk:Claim>')
+        add('</catmk:ClaimBag>')
+    add('</tmk:Trademark></tmk:TrademarkBag>')
+    return ''.join(parts)
+
+def writeCollections(rootDir, collections = 1, records = 10000, seed = 1, zips = False):
+    '''write synthetic collections 001.xml, 002.xml, ... (with count indexes) to rootDir/XML_raw,
+    and, if zips, the matching TM_HIST_001.zip, ... archives of record files to rootDir;
+    returns the paths of the concatenated collections
+    '''
+    r = random.Random(seed)
+    sourceDir = rootDir / 'XML_raw'
+    sourceDir.mkdir(parents=True, exist_ok=True)
+    sourceList = []
+    number = 1000000
+    for collection in range(1, collections + 1):
+        filename = sourceDir / f'{collection:03d}.xml'
+        archive = ZipFile(rootDir / f'TM_HIST_{collection:03d}.zip', 'w', ZIP_DEFLATED) if zips else None
+        with filename.open('w', encoding='UTF-8') as outfile:
+            outfile.write(openString)
+            for item in range(records):
+                number += 1
+                text = record(r, number)
+                outfile.write(text)
+                if archive: archive.writestr(f'{number}.xml', openString + text + closeString)
+            outfile.write(closeString)
+        if archive: archive.close()
+        writeCount(filename, records)
+        sourceList.append(filename)
+    return sourceList
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Write synthetic ST96 trademark collections for testing and benchmarking the parsers.')
+    parser.add_argument('rootDir', help='full path of the folder to write the XML_raw folder (and any ZIP archives) to')
+    parser.add_argument('--collections', type=int, default=1, help='number of collections (default: 1)')
+    parser.add_argument('--records', type=int, default=10000, help='records per collection (default: 10000)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    parser.add_argument('--zips', action='store_true', help='also write the collections as ZIP archives of record files, as CIPO publishes them')
+    args = parser.parse_args()
+
+    for filename in writeCollections(Path(args.rootDir), args.collections, args.records, args.seed, args.zips):
+        print(f'{filename.name}: {args.records:,} records, {filename.stat().st_size / 1e6:,.1f} MB')
+
+if __name__ == "__main__": main()
@@ -0,0 +1,38 @@
+# Shared helpers for the tests; the scripts in py/ import each other as top-level modules.
+
+import csv
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xml_sources import bagPattern, closeString, openString
+
+csv.field_size_limit(sys.maxsize)
+
+def collectionBags(filename):
+    '''the raw TrademarkBags of a concatenated collection'''
+    data = filename.read_bytes()
+    starts = [found.start() for found in bagPattern.finditer(data)]
+    end = data.rfind(closeString.encode('UTF-8'))
+    return [data[start:stop] for start, stop in zip(starts, starts[1:] + [end])]
+
+def writeCollection(filename, bags):
+    '''write TrademarkBags to a concatenated collection'''
+    filename.write_bytes(openString.encode('UTF-8') + b''.join(bags) + closeString.encode('UTF-8'))
+
+def runParse(sourceDir, *options):
+    '''run iterparse_all.py over sourceDir with the given command-line options'''
+    import iterparse_all
+    iterparse_all.main(iterparse_all.argumentParser().parse_args([str(sourceDir), *options]))
+
+def dataRows(path):
+    '''the label row and the other rows of a tab-delimited data file'''
+    with path.open('r', newline='', encoding='UTF-8') as infile:
+        rows = list(csv.reader(infile, delimiter = '\t'))
+    return rows[0], rows[1:]
+
+def withStatus(bag, status):
+    '''a TrademarkBag with its current status text replaced'''
+    return re.sub(rb'(<tmk:MarkCurrentStatusInternalDescriptionText>)[^<]*', b'\\g<1>' + status, bag, count = 1)
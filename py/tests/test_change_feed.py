@@ -0,0 +1,48 @@
+import re
+import shutil
+
+import pytest
+
+from change_feed import changePath
+from conftest import collectionBags, dataRows, runParse, withStatus, writeCollection
+from iterparse_all import extractors
+from synth_st96 import writeCollections
+
+appNumberPattern = re.compile(rb'(<com:ST13ApplicationNumber>)([^<]*)')
+
+def withAppNumber(bag, other):
+    '''a TrademarkBag with the application number of another'''
+    return appNumberPattern.sub(lambda found: found.group(1) + appNumberPattern.search(other).group(2), bag, count = 1)
+
+def applyChanges(rows, changes):
+    '''the rows of a data file with the rows of its change file applied'''
+    rows = list(rows)
+    for change in changes:
+        kind, row = change[0], change[2:]
+        if kind == 'delete': rows.remove(row)
+        elif kind == 'insert': rows.append(row)
+        else: rows = [row if old[:2] == row[:2] else old for old in rows]
+    return rows
+
+@pytest.mark.parametrize('options', [(), ('--codes',), ('--store',)])
+def test_feed_brings_old_data_up_to_date(tmp_path, options):
+    sourceDir = tmp_path / 'XML_raw'
+    writeCollections(tmp_path, collections = 2, records = 30)
+    runParse(sourceDir, *options)
+    shutil.copytree(tmp_path / 'csv', tmp_path / 'old')
+
+    # records given the numbers of others (so that the multi-row tables gain and lose rows), and changed statuses
+    bags = collectionBags(sourceDir / '001.xml')
+    renumbered = [withAppNumber(bag, bags[(index + 1) % 10]) for index, bag in enumerate(bags[:10])]
+    writeCollection(sourceDir / '003.xml', renumbered + [withStatus(bag, b'Changed') for bag in bags[10:15]])
+    runParse(sourceDir, '--update', '--changes', *options)
+
+    for extractor in extractors.values():
+        header, oldRows = dataRows(tmp_path / 'old' / extractor.outFile)
+        header, newRows = dataRows(tmp_path / 'csv' / extractor.outFile)
+        changeHeader, changes = dataRows(changePath(tmp_path / 'csv', extractor.outFile[:-4]))
+        assert changeHeader[2:] == header
+        if extractor.outFile != 'CA_TM_main.csv': assert all(change[0] != 'update' for change in changes)
+        assert sorted(applyChanges(oldRows, changes)) == sorted(newRows), extractor.outFile
+    header, changes = dataRows(changePath(tmp_path / 'csv', 'CA_TM_main'))
+    assert sum(change[0] == 'update' for change in changes) == 15
@@ -0,0 +1,55 @@
+import pytest
+
+import iterparse_all
+from checkpoint import Checkpoint, checkpointFile
+from conftest import runParse
+from csv_out import codesFile
+from iterparse_all import extractors
+from quarantine import quarantineFile
+from synth_st96 import writeCollections
+
+serial = ('--checkpoint-mb', '0.1')
+sharded = ('--workers', '3', '--chunk-mb', '0.1')
+
+def interruptAfter(count):
+    '''a wrapper raising KeyboardInterrupt once the function it wraps has been called count times'''
+    calls = []
+    def wrap(function):
+        def interrupting(*args, **kwargs):
+            result = function(*args, **kwargs)
+            calls.append(True)
+            if len(calls) == count: raise KeyboardInterrupt
+            return result
+        return interrupting
+    return wrap
+
+def outputFiles(parsePath):
+    '''the bytes of the data files, and of the codes and quarantine files, of a run'''
+    names = [extractor.outFile for extractor in extractors.values()] + [codesFile, quarantineFile]
+    return {name: parsePath.joinpath(name).read_bytes() for name in names if parsePath.joinpath(name).exists()}
+
+@pytest.mark.parametrize('options, target, count', [
+    (serial, 'extractRecord', 100),                         # partway through a chunk of the second collection
+    (serial + ('--recover', '--codes'), 'extractRecord', 100),
+    (sharded, 'Checkpoint.shardDone', 4),                   # with some shards parsed
+    (sharded + ('--codes',), 'Checkpoint.mergeDone', 3),    # with some data files merged
+], ids = ['serial', 'serial-codes', 'sharded', 'sharded-merge'])
+def test_resumed_run_matches_clean_run(tmp_path, monkeypatch, options, target, count):
+    writeCollections(tmp_path / 'clean', collections = 3, records = 60)
+    runParse(tmp_path / 'clean' / 'XML_raw', *options)
+    expected = outputFiles(tmp_path / 'clean' / 'csv')
+
+    writeCollections(tmp_path / 'resumed', collections = 3, records = 60)
+    with monkeypatch.context() as patch:
+        if target == 'extractRecord':
+            patch.setattr(iterparse_all, 'extractRecord', interruptAfter(count)(iterparse_all.extractRecord))
+        else:
+            name = target.split('.')[1]
+            patch.setattr(Checkpoint, name, interruptAfter(count)(getattr(Checkpoint, name)))
+        with pytest.raises(KeyboardInterrupt):
+            runParse(tmp_path / 'resumed' / 'XML_raw', *options)
+    assert (tmp_path / 'resumed' / 'csv' / checkpointFile).exists()
+    runParse(tmp_path / 'resumed' / 'XML_raw', '--resume', *options)
+
+    assert outputFiles(tmp_path / 'resumed' / 'csv') == expected
+    assert not (tmp_path / 'resumed' / 'csv' / checkpointFile).exists()
@@ -0,0 +1,113 @@
+import struct
+from datetime import date
+
+import dta_out
+from conftest import runParse
+from iterparse_all import extractors
+from synth_st96 import writeCollections
+
+def test_converts_compressed_data_files(tmp_path):
+    writeCollections(tmp_path, collections = 1, records = 20)
+    runParse(tmp_path / 'XML_raw', '--compress', 'gzip')
+    dta_out.main(dta_out.argumentParser().parse_args([str(tmp_path / 'csv')]))
+    for extractor in extractors.values():
+        assert dta_out.dtaPath(tmp_path / 'dta', extractor.outFile).stat().st_size > 0
+
+def test_no_data_files(tmp_path, capsys):
+    tmp_path.joinpath('csv').mkdir()
+    dta_out.main(dta_out.argumentParser().parse_args([str(tmp_path / 'csv')]))
+    assert 'No data files were found' in capsys.readouterr().out
+    assert not tmp_path.joinpath('dta').exists()
+
+# a reader of the parts of a format 118 file that DtaWriter writes, unpacked with struct
+
+sectionTags = ['<map>', '<variable_types>', '<varnames>', '<sortlist>', '<formats>', '<value_label_names>',
+    '<variable_labels>', '<characteristics>', '<data>', '<strls>', '<value_labels>', '</stata_dta>']
+typeCodes = {65530: 'b', 65529: 'h', 65528: 'l', 65526: 'd', 32768: 'Q'}
+
+def fixedFields(data, offset, count, size):
+    return [data[offset + index * size:offset + (index + 1) * size].split(b'\x00')[0].decode('UTF-8') for index in range(count)]
+
+def readDTA(path):
+    data = path.read_bytes()
+    header = data[:data.index(b'</header>')]
+    assert header.startswith(b'<stata_dta><header><release>118</release><byteorder>LSF</byteorder><K>')
+    K, = struct.unpack_from('<H', header, header.index(b'<K>') + 3)
+    N, = struct.unpack_from('<Q', header, header.index(b'<N>') + 3)
+    start = data.index(b'<map>') + 5
+    offsets = struct.unpack_from('<14Q', data, start)
+    types = struct.unpack_from(f'<{K}H', data, offsets[2] + len('<variable_types>'))
+    row = struct.Struct('<' + ''.join(typeCodes.get(typeCode, f'{typeCode}s') for typeCode in types))
+    rows = [row.unpack_from(data, offsets[9] + len('<data>') + index * row.size) for index in range(N)]
+    strls = {}
+    position = offsets[10] + len('<strls>')
+    while data.startswith(b'GSO', position):
+        v, o, t, length = struct.unpack_from('<IQBI', data, position + 3)
+        position += 3 + struct.calcsize('<IQBI')
+        strls[v, o] = (t, data[position:position + length])
+        position += length
+    labels = {}
+    position = offsets[11] + len('<value_labels>')
+    while data.startswith(b'<lbl>', position):
+        length, = struct.unpack_from('<i', data, position + 5)
+        name = fixedFields(data, position + 9, 1, 129)[0]
+        table = position + 9 + 129 + 3
+        n, textLength = struct.unpack_from('<ii', data, table)
+        textOffsets = struct.unpack_from(f'<{n}i', data, table + 8)
+        values = struct.unpack_from(f'<{n}i', data, table + 8 + 4 * n)
+        texts = data[table + 8 + 8 * n:table + 8 + 8 * n + textLength]
+        labels[name] = {value: texts[offset:texts.index(b'\x00', offset)].decode('UTF-8') for value, offset in zip(values, textOffsets)}
+        position = table + length + len('</lbl>')
+    return {
+        'data': data, 'K': K, 'N': N, 'offsets': offsets, 'types': types, 'rows': rows, 'strls': strls, 'labels': labels,
+        'names': fixedFields(data, offsets[3] + len('<varnames>'), K, 129),
+        'formats': fixedFields(data, offsets[5] + len('<formats>'), K, 57),
+        'labelNames': fixedFields(data, offsets[6] + len('<value_label_names>'), K, 129)
+    }
+
+def test_claims_layout(tmp_path):
+    headerRow = ['AppNo', 'ExtNo', 'ClaimTypeCode', 'ClaimTypeDesc', 'ClaimSerialNo', 'ClaimCode', 'ClaimDesc', 'Year', 'Month', 'Date', 'Country', 'ForeignDocNo', 'ClaimedGoods']
+    longGoods = 'jewellery; ' * 300
+    rows = [
+        ['1234567', '00', '11', 'Used in Canada', '1', '7', 'Used in Canada since before', '2060', '3', '15', 'CA', '3.5', 'clothing; footwear'],
+        ['1234567', '01', '', '', '', '', '', '', '', '', 'US', '', ''],    # missing values
+        ['7654321', '00', '10', 'Made Known in Canada', '2', '2', '', '1999', '12', '', 'GB', '12', longGoods]
+    ]
+    path = tmp_path / 'CA_TM_claims.dta'
+    dta_out.writeDTA('CA_TM_claims.csv', lambda: (headerRow, iter(rows)), path)
+    dta = readDTA(path)
+    data, offsets = dta['data'], dta['offsets']
+
+    # the map points at the start of each section, and at the end of the file
+    assert offsets[0] == 0
+    for offset, tag in zip(offsets[1:13], sectionTags):
+        assert data.startswith(tag.encode(), offset), tag
+    assert offsets[13] == len(data)
+
+    assert (dta['K'], dta['N']) == (12, 3)
+    assert dta['names'] == ['AppNo', 'ExtNo', 'ClaimType', 'ClaimSerialNo', 'ClaimCode', 'ClaimDesc', 'Year', 'Month', 'Date', 'Country', 'ForeignDocNo', 'ClaimedGoods']
+    types = dict(zip(dta['names'], dta['types']))
+    assert types == {'AppNo': 7, 'ExtNo': 2, 'ClaimType': 65530, 'ClaimSerialNo': 65530, 'ClaimCode': 65529, 'ClaimDesc': 27,
+        'Year': 65529, 'Month': 65529, 'Date': 65528, 'Country': 2, 'ForeignDocNo': 65526, 'ClaimedGoods': 32768}
+    formats = dict(zip(dta['names'], dta['formats']))
+    assert (formats['Year'], formats['Month'], formats['Date']) == ('%tyCCYY', '%tmMon_CCYY', '%tdDD_Mon_CCYY')
+    labelNames = dict(zip(dta['names'], dta['labelNames']))
+    assert (labelNames['ClaimType'], labelNames['ClaimCode'], labelNames['Year']) == ('ClaimTypeLabel', 'ClaimCodelabel', '')
+
+    # one row of each storage type: str, byte, int (the compound claim code 11 and 7), long, double and strL
+    first, missing, last = [dict(zip(dta['names'], row)) for row in dta['rows']]
+    strL = 12 # the variable number of ClaimedGoods
+    assert first['AppNo'] == b'1234567'
+    assert (first['ClaimType'], first['ClaimSerialNo'], first['ClaimCode']) == (11, 1, 117)
+    assert (first['Year'], first['Month'], first['Date']) == (2060, 100 * 12 + 2, (date(2060, 3, 15) - date(1960, 1, 1)).days)
+    assert first['ForeignDocNo'] == 3.5
+    assert first['ClaimedGoods'] == strL + (1 << 16)
+    assert (last['ClaimCode'], last['ClaimedGoods']) == (102, strL + (3 << 16))
+
+    # missing values, and an empty strL referring to no GSO
+    assert (missing['ClaimType'], missing['ClaimSerialNo'], missing['ClaimCode'], missing['Date'], missing['ForeignDocNo'], missing['ClaimedGoods']) == (101, 101, 32741, 2147483621, 2.0 ** 1023, 0)
+
+    # the strLs are keyed by (variable, observation), null-terminated
+    assert dta['strls'] == {(strL, 1): (130, b'clothing; footwear\x00'), (strL, 3): (130, longGoods.encode() + b'\x00')}
+
+    assert dta['labels'] == {name: dta_out.valueLabels[name] for name in ['ClaimTypeLabel', 'ClaimCodelabel']}
@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+from conftest import collectionBags, writeCollection
+from field_plan import RowCollector
+from iterparse_all import eventExtractors, parseCollection, shardTables
+from synth_st96 import writeCollections
+
+def backendRows(filename, name):
+    '''the rows of a table parsed from a collection with the tree-based extractor and with the event backend'''
+    found = []
+    for extractor in (shardTables[name], eventExtractors[name]):
+        writeobject = RowCollector()
+        parseCollection(filename, [(extractor, writeobject)], 0, None, quiet = True)
+        found.append(writeobject.rows)
+    return found
+
+def nestedText(match):
+    '''a description with its text split by a comment, a child element and an entity'''
+    text = match.group(2)
+    return match.group(1) + text[:3] + b'<!-- note -->' + text[3:6] + b'<tmk:Emphasis>bold</tmk:Emphasis>' + text[6:] + b' &amp; more'
+
+variants = {
+    'nested text': lambda bag: re.sub(rb'(<tmk:GoodsServicesDescriptionText[^>]*>)([^<]*)', nestedText, bag),
+    'missing sequence numbers': lambda bag: re.sub(rb' com:sequenceNumber="[^"]*"', b'', bag),
+    'missing classes': lambda bag: re.sub(rb'<tmk:GoodsServicesClassificationBag>.*?</tmk:GoodsServicesClassificationBag>', b'', bag, flags = re.S),
+    'missing class numbers': lambda bag: re.sub(rb'<tmk:ClassNumber>[^<]*</tmk:ClassNumber>', b'', bag),
+    'missing vienna divisions': lambda bag: re.sub(rb'<com:ViennaDivision>[^<]*</com:ViennaDivision>', b'', bag),
+    'empty descriptions': lambda bag: re.sub(rb'(<tmk:GoodsServicesDescriptionText[^>]*>)[^<]*', rb'\1', bag),
+}
+
+@pytest.fixture(scope = 'module')
+def collection(tmp_path_factory):
+    rootDir = tmp_path_factory.mktemp('events')
+    writeCollections(rootDir, collections = 1, records = 200, seed = 7)
+    return rootDir / 'XML_raw' / '001.xml'
+
+@pytest.mark.parametrize('name', sorted(eventExtractors))
+def test_backends_agree(collection, name):
+    tree, events = backendRows(collection, name)
+    assert tree and events == tree
+
+@pytest.mark.parametrize('variant', sorted(variants))
+@pytest.mark.parametrize('name', sorted(eventExtractors))
+def test_backends_agree_on_variant(collection, tmp_path, name, variant):
+    filename = tmp_path / 'variant.xml'
+    writeCollection(filename, [variants[variant](bag) for bag in collectionBags(collection)])
+    tree, events = backendRows(filename, name)
+    assert events == tree
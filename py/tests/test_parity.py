@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import runParse
+from iterparse_all import eventExtractors, extractors
+from synth_st96 import writeCollections
+from xml_sources import findChunks
+
+records = 60
+chunked = ('--workers', '3', '--chunk-mb', '0.05')
+events = ('--events', *sorted(name for name in eventExtractors if name in extractors))
+
+def dataFiles(parsePath):
+    return {extractor.outFile: parsePath.joinpath(extractor.outFile).read_bytes() for extractor in extractors.values()}
+
+@pytest.fixture(scope = 'module')
+def serialRun(tmp_path_factory):
+    '''the data files of a serial run over the synthetic collections'''
+    rootDir = tmp_path_factory.mktemp('serial')
+    writeCollections(rootDir, collections = 3, records = records)
+    runParse(rootDir / 'XML_raw')
+    return dataFiles(rootDir / 'csv')
+
+@pytest.mark.parametrize('options', [
+    ('--workers', '3'),
+    chunked,
+    ('--zips',),
+    ('--zips', '--workers', '3'),
+    events,
+    events + chunked,
+], ids = ['workers', 'chunks', 'zips', 'zips-workers', 'events', 'events-chunks'])
+def test_matches_serial_run(serialRun, tmp_path, options):
+    if '--zips' in options:
+        # the archives are written beside the XML_raw folder, so they are written to one of their own
+        sourceDir = tmp_path / 'XML_raw'
+        writeCollections(sourceDir, collections = 3, records = records, zips = True)
+    else:
+        sourceDir = writeCollections(tmp_path, collections = 3, records = records)[0].parent
+    if '--chunk-mb' in options:
+        # the chunks end inside the collections, not only at their ends
+        assert all(len(findChunks(filename, int(0.05 * 1024 * 1024))) > 3 for filename in sourceDir.glob('*.xml'))
+    runParse(sourceDir, *options)
+    assert dataFiles(tmp_path / 'csv') == serialRun
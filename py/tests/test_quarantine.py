@@ -0,0 +1,24 @@
+import json
+import re
+
+from conftest import collectionBags, dataRows, runParse, writeCollection
+from quarantine import quarantineFile
+from synth_st96 import writeCollections
+
+def test_repaired_records_listed(tmp_path):
+    sourceDir = tmp_path / 'XML_raw'
+    writeCollections(tmp_path, collections = 1, records = 20)
+    bags = collectionBags(sourceDir / '001.xml')
+    # an unescaped ampersand in the fifth record, which the recover parser drops
+    bags[4] = re.sub(rb'(<tmk:MarkCurrentStatusInternalDescriptionText>)', rb'\1Fish & Chips ', bags[4], count = 1)
+    writeCollection(sourceDir / '001.xml', bags)
+    runParse(sourceDir, '--recover')
+
+    entries = [json.loads(line) for line in (tmp_path / 'csv' / quarantineFile).read_text(encoding = 'UTF-8').splitlines()]
+    assert [entry['kind'] for entry in entries] == ['xml']
+    appNo = re.search(rb'<com:ST13ApplicationNumber>([^<]*)', bags[4]).group(1).decode()
+    assert entries[0]['recovered'] == 1
+    assert entries[0]['keys'] == [[appNo[-9:-2], appNo[-2:]]]
+    header, rows = dataRows(tmp_path / 'csv' / 'CA_TM_main.csv')
+    assert len(rows) == 20
+    assert [appNo[-9:-2], appNo[-2:]] in [row[:2] for row in rows]
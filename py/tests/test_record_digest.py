@@ -0,0 +1,52 @@
+import shutil
+
+import pytest
+
+from conftest import collectionBags, dataRows, runParse, withStatus, writeCollection
+from iterparse_all import extractors
+from synth_st96 import writeCollections
+
+def updateSequence(rootDir, *options):
+    '''a full run, then an update adding 005 as a copy of 002, then one cutting 002 down to 10 records'''
+    sourceDir = rootDir / 'XML_raw'
+    writeCollections(rootDir, collections = 3, records = 40)
+    runParse(sourceDir, *options)
+    shutil.copy(sourceDir / '002.xml', sourceDir / '005.xml')
+    runParse(sourceDir, '--update', *options)
+    writeCollection(sourceDir / '002.xml', collectionBags(sourceDir / '002.xml')[:10])
+    runParse(sourceDir, '--update', *options)
+
+@pytest.mark.parametrize('options', [(), ('--codes',), ('--workers', '2')])
+def test_skipped_records_survive_reparse(tmp_path, options):
+    updateSequence(tmp_path / 'skip', '--skip-unchanged', *options)
+    updateSequence(tmp_path / 'plain', *options)
+    for extractor in extractors.values():
+        skipHeader, skipRows = dataRows(tmp_path / 'skip' / 'csv' / extractor.outFile)
+        plainHeader, plainRows = dataRows(tmp_path / 'plain' / 'csv' / extractor.outFile)
+        assert sorted(skipRows) == sorted(plainRows), extractor.outFile
+    header, rows = dataRows(tmp_path / 'skip' / 'csv' / 'CA_TM_main.csv')
+    assert len({tuple(row[:2]) for row in rows}) == 120
+
+def test_changed_records_are_extracted(tmp_path):
+    sourceDir = tmp_path / 'XML_raw'
+    writeCollections(tmp_path, collections = 1, records = 20)
+    runParse(sourceDir, '--skip-unchanged')
+    bags = collectionBags(sourceDir / '001.xml')
+    writeCollection(sourceDir / '002.xml', [withStatus(bag, b'Changed') for bag in bags[:5]] + bags[5:])
+    runParse(sourceDir, '--update', '--skip-unchanged')
+    header, rows = dataRows(tmp_path / 'csv' / 'CA_TM_main.csv')
+    assert len(rows) == 20
+    assert sum('Changed' in row for row in rows) == 5
+
+@pytest.mark.parametrize('options', [(), ('--store',)])
+def test_removed_records_extracted_when_republished(tmp_path, options):
+    sourceDir = tmp_path / 'XML_raw'
+    writeCollections(tmp_path, collections = 1, records = 20)
+    runParse(sourceDir, '--skip-unchanged', *options)
+    bags = collectionBags(sourceDir / '001.xml')
+    writeCollection(sourceDir / '001.xml', bags[5:])
+    runParse(sourceDir, '--update', '--skip-unchanged', *options)
+    writeCollection(sourceDir / '002.xml', bags[:5])
+    runParse(sourceDir, '--update', '--skip-unchanged', *options)
+    header, rows = dataRows(tmp_path / 'csv' / 'CA_TM_main.csv')
+    assert len(rows) == 20
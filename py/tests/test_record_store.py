@@ -0,0 +1,33 @@
+import pytest
+
+from change_feed import changePath
+from conftest import collectionBags, dataRows, runParse, withStatus, writeCollection
+from iterparse_all import extractors
+from synth_st96 import writeCollections
+
+def republish(rootDir, *options):
+    '''a full run; an update adding 004, with 5 changed and 5 unchanged copies of records of 002;
+    then an update cutting 002 down to its last 20 records
+    '''
+    sourceDir = rootDir / 'XML_raw'
+    writeCollections(rootDir, collections = 3, records = 40)
+    runParse(sourceDir, *options)
+    bags = collectionBags(sourceDir / '002.xml')
+    writeCollection(sourceDir / '004.xml', [withStatus(bag, b'Changed') for bag in bags[:5]] + bags[5:10])
+    runParse(sourceDir, '--update', '--changes', *options)
+    writeCollection(sourceDir / '002.xml', bags[20:])
+    runParse(sourceDir, '--update', '--changes', *options)
+
+@pytest.mark.parametrize('options', [(), ('--skip-unchanged',)])
+def test_store_update_matches_file_update(tmp_path, options):
+    republish(tmp_path / 'files', *options)
+    republish(tmp_path / 'store', '--store', *options)
+    for extractor in extractors.values():
+        fileHeader, fileRows = dataRows(tmp_path / 'files' / 'csv' / extractor.outFile)
+        storeHeader, storeRows = dataRows(tmp_path / 'store' / 'csv' / extractor.outFile)
+        assert sorted(storeRows) == sorted(fileRows), extractor.outFile
+        fileHeader, fileChanges = dataRows(changePath(tmp_path / 'files' / 'csv', extractor.outFile[:-4]))
+        storeHeader, storeChanges = dataRows(changePath(tmp_path / 'store' / 'csv', extractor.outFile[:-4]))
+        assert sorted(storeChanges) == sorted(fileChanges), extractor.outFile
+    header, rows = dataRows(tmp_path / 'store' / 'csv' / 'CA_TM_main.csv')
+    assert len(rows) == 110
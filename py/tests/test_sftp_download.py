@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import sftp_download
+from sftp_download import downloadArchives
+
+class LocalServer:
+    '''a stand-in for the SFTP server, serving the files of a local folder; the transfers of the
+    names in failures fail partway that many times each. Each transfer is noted with the size of
+    the partial copy in targetDir as it starts and the offset the download seeks to
+    '''
+    def __init__(self, rootDir, targetDir, failures = None):
+        self.rootDir = rootDir
+        self.targetDir = targetDir
+        self.failures = dict(failures or {})
+        self.lock = threading.Lock()
+        self.transfers = {} # name -> transfers started
+        self.resumes = {}   # name -> [(partial copy's size, offset sought), ...]
+        self.open = 0       # connections open
+        self.mostOpen = 0
+
+    def connect(self):
+        with self.lock:
+            self.open += 1
+            self.mostOpen = max(self.mostOpen, self.open)
+        return LocalConnection(self)
+
+class LocalConnection:
+    '''a stand-in for pysftp.Connection over a LocalServer'''
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def listdir_attr(self, remoteDir):
+        attrs = []
+        for path in sorted(self.server.rootDir.iterdir()):
+            attr = path.stat()
+            attrs.append(type('attr', (), {'filename': path.name, 'st_size': attr.st_size}))
+        return attrs
+
+    def lstat(self, remotePath):
+        return os.stat(self.server.rootDir / remotePath.rsplit('/', 1)[-1])
+
+    def open(self, remotePath, mode):
+        server = self.server
+        name = remotePath.rsplit('/', 1)[-1]
+        partial = server.targetDir / name
+        resume = [partial.stat().st_size if partial.exists() else 0, None]
+        with server.lock:
+            server.transfers[name] = server.transfers.get(name, 0) + 1
+            server.resumes.setdefault(name, []).append(resume)
+            failing = server.failures.get(name, 0) > 0
+            if failing: server.failures[name] -= 1
+        return LocalFile(server.rootDir / name, failing, resume)
+
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        with self.server.lock: self.server.open -= 1
+
+class LocalFile:
+    '''a remote file, failing with a dropped connection after its first block if failing'''
+    def __init__(self, path, failing, resume):
+        self.file = path.open('rb')
+        self.failing = failing
+        self.resume = resume
+
+    def seek(self, offset):
+        self.resume[1] = offset
+        self.file.seek(offset)
+
+    def read(self, size):
+        if self.failing and self.file.tell() > 0: raise EOFError('connection dropped')
+        time.sleep(0.01) # to let the downloads overlap
+        return self.file.read(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+@pytest.fixture
+def archives(tmp_path, monkeypatch):
+    monkeypatch.setattr(sftp_download, 'time', SimpleNamespace(sleep = lambda seconds: None)) # no backoff between retries
+    remoteDir = tmp_path / 'remote'
+    remoteDir.mkdir()
+    names = [f'CA-TMK-GLOBAL_2020-01-{day:02d}.zip' for day in range(1, 11)]
+    for day, name in enumerate(names):
+        remoteDir.joinpath(name).write_bytes(os.urandom(1024 * 1024 + 700 * day)) # two blocks each, bar the first
+    targetDir = tmp_path / 'XML_raw'
+    targetDir.mkdir()
+    return remoteDir, names, targetDir
+
+def download(server, names, targetDir, **options):
+    return downloadArchives(server.connect, '/remote', names, targetDir, **options)
+
+def test_each_archive_downloaded_once(archives):
+    remoteDir, names, targetDir = archives
+    server = LocalServer(remoteDir, targetDir)
+    completed = []
+    downloaded = download(server, names, targetDir, connections = 3, onComplete = completed.append)
+    assert sorted(path.name for path in downloaded) == names
+    assert sorted(path.name for path in completed) == names
+    assert server.transfers == {name: 1 for name in names}
+    for name in names:
+        assert targetDir.joinpath(name).read_bytes() == remoteDir.joinpath(name).read_bytes()
+    assert 1 < server.mostOpen <= 3
+    assert server.open == 0
+
+def test_failed_transfer_resumed(archives):
+    remoteDir, names, targetDir = archives
+    server = LocalServer(remoteDir, targetDir, {names[2]: 2})
+    download(server, names, targetDir, connections = 2, retries = 3)
+    assert server.transfers[names[2]] == 3
+    # the first transfer wrote one block before it failed; each retry seeks to the end of the partial copy
+    assert server.resumes[names[2]] == [[0, 0], [1024 * 1024, 1024 * 1024], [1024 * 1024, 1024 * 1024]]
+    assert targetDir.joinpath(names[2]).read_bytes() == remoteDir.joinpath(names[2]).read_bytes()
+    assert server.mostOpen <= 2
+    assert server.open == 0
+
+def test_failed_transfer_reported(archives):
+    remoteDir, names, targetDir = archives
+    server = LocalServer(remoteDir, targetDir, {names[3]: 10})
+    failed = []
+    with pytest.raises(EOFError):
+        download(server, names, targetDir, connections = 2, retries = 2, onFailed = lambda: failed.append(True))
+    assert server.transfers[names[3]] == 3
+    assert failed == [True]
+    assert server.open == 0
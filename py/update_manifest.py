@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# A manifest of the XML collections (or ZIP archives) that have been parsed into the
+# Canada Trademarks Dataset CSV files, used by iterparse_all.py --update to parse only
+# new or changed archives and to upsert their rows into the existing CSV files.
+# For each archive the manifest records its size, modification time, checksum and
+# number of records, and the byte range its rows occupy in each CSV file.
+# Archives loaded into the record store (iterparse_all.py --store) are listed
+# separately, under 'stored'.
+
+import csv
+import hashlib
+import json
+
+manifestFile = 'CA_TM_manifest.json'
+
+def loadManifest(parsePath):
+    '''read the manifest from the csv folder; an empty manifest if there is none yet'''
+    manifestPath = parsePath / manifestFile
+    if not manifestPath.exists(): return {'archives': {}}
+    with manifestPath.open('r', encoding='UTF-8') as infile:
+        return json.load(infile)
+
+def saveManifest(parsePath, manifest):
+    '''write the manifest to the csv folder, replacing the previous one only once it is complete'''
+    manifestPath = parsePath / manifestFile
+    tempPath = manifestPath.with_suffix('.tmp')
+    with tempPath.open('w', encoding='UTF-8') as outfile:
+        json.dump(manifest, outfile, indent=1, sort_keys=True)
+    tempPath.replace(manifestPath)
+
+def fileChecksum(filename, blockSize = 16 * 1024 * 1024):
+    '''a BLAKE2 checksum of the contents of filename'''
+    digest = hashlib.blake2b()
+    with filename.open('rb') as infile:
+        for block in iter(lambda: infile.read(blockSize), b''):
+            digest.update(block)
+    return f'blake2b:{digest.hexdigest()}'
+
+def archiveEntry(filename, checksum, records, outputs):
+    '''the manifest entry for a parsed archive; outputs maps each CSV file name
+    to the (start, end) byte range of the archive's rows in that file
+    '''
+    stat = filename.stat()
+    return {
+        'size':     stat.st_size,
+        'mtime':    stat.st_mtime_ns,
+        'checksum': checksum,
+        'records':  records,
+        'outputs':  {outFile: list(span) for outFile, span in outputs.items()}
+    }
+
+def archiveChanged(archives, filename):
+    '''whether an archive needs to be parsed: it is not among the manifest entries in archives,
+    or it has changed since it was parsed (same size and modification time are taken as
+    unchanged; otherwise the checksum decides)
+    '''
+    entry = archives.get(filename.name)
+    if entry is None: return True
+    stat = filename.stat()
+    if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime']: return False
+    if stat.st_size != entry['size'] or fileChecksum(filename) != entry['checksum']: return True
+    entry['mtime'] = stat.st_mtime_ns # touched but unchanged
+    return False
+
+def readKeys(keyFiles):
+    '''the set of (AppNo, ExtNo) keys listed in the given tab-delimited files'''
+    keys = set()
+    for keyFile in keyFiles:
+        with keyFile.open('r', newline='', encoding='UTF-8') as infile:
+            keys.update((row[0], row[1]) for row in csv.reader(infile, delimiter = '\t'))
+    return keys
+
+def rewriteOutput(outPath, dropKeys, ranges, dropArchives, dropped = None):
+    '''rewrite the CSV file at outPath without the rows whose (AppNo, ExtNo) key is in dropKeys
+    or that lie in the byte ranges of the archives named in dropArchives, copying all other rows
+    byte for byte; each row dropped is passed to dropped, if it is given. ranges maps archive
+    names to the (start, end) byte ranges of their rows in the existing file; returns the ranges
+    of the remaining archives in the rewritten file.
+    '''
+    dropSpans = [ranges[name] for name in dropArchives if name in ranges]
+    boundaries = sorted({offset for span in ranges.values() for offset in span})
+    newOffsets = {}
+    tempPath = outPath.with_suffix(outPath.suffix + '.tmp')
+
+    with outPath.open('rb') as infile, tempPath.open('wb') as outfile:
+        header = infile.readline()
+        outfile.write(header)
+        position = len(header) # byte offset of the current row in the existing file
+        droppedBytes = 0 # bytes dropped before the current row
+        b = 0
+        rawLines = []
+
+        def lines():
+            # keep the raw bytes of each line so that kept rows are copied unchanged
+            for line in infile:
+                rawLines.append(line)
+                yield line.decode('UTF-8')
+
+        for row in csv.reader(lines(), delimiter = '\t'):
+            raw = b''.join(rawLines)
+            rawLines.clear()
+            while b < len(boundaries) and boundaries[b] <= position:
+                newOffsets[boundaries[b]] = boundaries[b] - droppedBytes
+                b += 1
+            if tuple(row[:2]) in dropKeys or any(start <= position < end for start, end in dropSpans):
+                droppedBytes += len(raw)
+                if dropped is not None: dropped(row)
+            else:
+                outfile.write(raw)
+            position += len(raw)
+        for offset in boundaries[b:]:
+            newOffsets[offset] = offset - droppedBytes
+
+    tempPath.replace(outPath)
+    return {name: (newOffsets[start], newOffsets[end]) for name, (start, end) in ranges.items() if name not in dropArchives}
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Original code (c) Jeremy Sheff 2020. Original code published by the author under a CC-BY-4.0 license.
+# https://creativecommons.org/licenses/by/4.0/legalcode
+
+# Sources of TrademarkBag records for the iterparse_* parsers: collections split into chunks
+# aligned on TrademarkBag start tags, ZIP archives streamed without extraction, and the
+# concatenation of record files into collections, with their record counts.
+
+import json
+import os
+import re
+from pathlib import Path
+from zipfile import ZipFile
+
+# XML header and top-level opening and closing tags of each CIPO record file;
+# these appear once at the start and end of each concatenated collection
+
+openString = '<?xml version=\"1.0\" encoding=\"UTF-8\"?><tmk:TrademarkApplication xmlns:catmk=\"http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Trademark\" xmlns:ns4=\"http://www.w3.org/1998/Math/MathML\" xmlns:ns3=\"http://www.oasis-open.org/tables/exchange/1.0\" xmlns:com=\"http://www.wipo.int/standards/XMLSchema/ST96/Common\" xmlns:cacom=\"http://www.cipo.ic.gc.ca/standards/XMLSchema/ST96/Common\" xmlns:xs=\"http://www.w3.org/2001/XMLSchema\" xmlns:tmk=\"http://www.wipo.int/standards/XMLSchema/ST96/Trademark\" xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\" com:st96Version=\"V3_0\" com:ipoVersion=\"V1_4\">'
+closeString = '</tmk:TrademarkApplication>'
+
+# the record container start tag on which collections are split
+
+bagTag = b'<tmk:TrademarkBag'
+bagPattern = re.compile(re.escape(bagTag) + rb'[>/\s]')
+
+def findTag(infile, offset, tag = bagTag, blockSize = 1024 * 1024):
+    '''return the byte offset of the first start tag at or after offset in an open binary file,
+    or None if there is none; the tag must be followed by '>', '/' or whitespace so that
+    longer element names sharing the same prefix are not matched
+    '''
+    infile.seek(offset)
+    carry = b''
+    position = offset # file offset of the start of carry + block
+    while True:
+        block = infile.read(blockSize)
+        if not block: return None
+        data = carry + block
+        found = data.find(tag)
+        while found >= 0:
+            if found + len(tag) >= len(data): break # tag at the very end of the block: look again with the next block
+            if data[found + len(tag):found + len(tag) + 1] in (b'>', b'/', b' ', b'\t', b'\r', b'\n'):
+                return position + found
+            found = data.find(tag, found + 1)
+        carry = data[-len(tag):]
+        position += len(data) - len(carry)
+
+def findChunks(filename, chunkSize):
+    '''split a concatenated collection into (start, end) byte ranges of roughly chunkSize bytes,
+    each starting on a TrademarkBag start tag; the last range ends at the top-level close tag
+    '''
+    size = filename.stat().st_size
+    with filename.open('rb') as infile:
+
+        # locate the end of the record data: the top-level close tag near the end of the file
+        infile.seek(max(0, size - 4096))
+        tail = infile.read()
+        end = tail.rfind(closeString.encode('UTF-8'))
+        end = size if end < 0 else size - len(tail) + end
+
+        bounds = []
+        start = findTag(infile, 0)
+        while start is not None and start < end:
+            bounds.append(start)
+            start = findTag(infile, start + max(chunkSize, 1))
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:] + [end])]
+
+class ChunkReader:
+    '''a read-only file-like object presenting one byte range of a concatenated collection
+    to lxml as a complete XML document, wrapped in the top-level opening and closing tags
+    '''
+    def __init__(self, filename, start, end):
+        self.infile = open(filename, 'rb')
+        self.infile.seek(start)
+        self.remaining = end - start
+        self.head = openString.encode('UTF-8')
+        self.tail = closeString.encode('UTF-8')
+
+    def read(self, size = -1):
+        if size is None or size < 0: size = 1 << 62
+        if self.head:
+            data, self.head = self.head[:size], self.head[size:]
+            return data
+        if self.remaining > 0:
+            data = self.infile.read(min(size, self.remaining))
+            self.remaining = self.remaining - len(data) if data else 0
+            if data: return data
+        data, self.tail = self.tail[:size], self.tail[size:]
+        return data
+
+    def close(self):
+        self.infile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def recordBody(data):
+    '''strip the XML header and top-level opening and closing tags from the bytes of one
+    CIPO record file, leaving only its TrademarkBag element(s)
+    '''
+    start = data.find(bagTag)
+    if start < 0: return b''
+    end = data.rfind(closeString.encode('UTF-8'))
+    return data[start:end if end > start else len(data)]
+
+def copyRange(infile, outfile, start, length, blockSize = 16 * 1024 * 1024):
+    '''copy length bytes from offset start of infile to the current position of outfile,
+    in kernel space where the platform supports os.copy_file_range
+    '''
+    outfile.flush()
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while length > 0:
+                copied = os.copy_file_range(infile.fileno(), outfile.fileno(), length, start)
+                if copied == 0: break
+                start += copied
+                length -= copied
+        except OSError:
+            pass # e.g. unsupported across these filesystems: fall back to buffered copying
+        outfile.seek(0, os.SEEK_END)
+    infile.seek(start)
+    while length > 0:
+        block = infile.read(min(length, blockSize))
+        if not block: break
+        outfile.write(block)
+        length -= len(block)
+
+def spliceCollection(recordFiles, outPath, callback = None, smallFile = 1024 * 1024):
+    '''concatenate CIPO record files into a single collection at outPath at the byte level:
+    the header and top-level tags of each file are located once and only the record body is
+    copied, with openString and closeString written once at the start and end of the collection.
+    callback, if given, is called with the size of each record file once it is copied.
+    The number of record files is written to the collection's count index.
+    Returns the number of bytes written.
+    '''
+    head = openString.encode('UTF-8')
+    tail = closeString.encode('UTF-8')
+    written = 0
+    records = 0
+    with open(outPath, 'wb', buffering = 16 * 1024 * 1024) as outfile:
+        outfile.write(head)
+        written += len(head)
+        for recordFile in recordFiles:
+            with open(recordFile, 'rb') as infile:
+                size = os.fstat(infile.fileno()).st_size
+                if size <= smallFile:
+                    # small files (nearly all of them) are read whole and sliced in memory
+                    body = recordBody(infile.read())
+                    outfile.write(body)
+                    written += len(body)
+                else:
+                    start = findTag(infile, 0)
+                    if start is not None:
+                        infile.seek(max(0, size - 4096))
+                        ending = infile.read()
+                        end = ending.rfind(tail)
+                        end = size if end < 0 else size - len(ending) + end
+                        copyRange(infile, outfile, start, end - start)
+                        written += end - start
+            records += 1
+            if callback: callback(size)
+        outfile.write(tail)
+        written += len(tail)
+    writeCount(Path(outPath), records)
+    return written
+
+def zipMembers(archive):
+    '''the XML record files in an open ZIP archive, in archive order'''
+    return [name for name in archive.namelist() if name.endswith('.xml')]
+
+def findZipChunks(filename, chunkSize):
+    '''split the record files of a ZIP archive into (start, end) ranges of member indices
+    holding roughly chunkSize bytes of uncompressed XML each
+    '''
+    with ZipFile(filename) as archive:
+        sizes = [archive.getinfo(name).file_size for name in zipMembers(archive)]
+    bounds, total = [0], 0
+    for index, size in enumerate(sizes):
+        if total >= max(chunkSize, 1):
+            bounds.append(index)
+            total = 0
+        total += size
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:] + [len(sizes)])] if sizes else []
+
+class ZipReader:
+    '''a read-only file-like object presenting the record files in a ZIP archive (or the
+    members[start:end] range of them) to lxml as a single concatenated collection,
+    decompressing one record file at a time
+    '''
+    def __init__(self, filename, start = 0, end = None):
+        self.zip = ZipFile(filename)
+        self.members = zipMembers(self.zip)[start:end]
+        self.index = 0
+        self.buffer = openString.encode('UTF-8')
+        self.tail = closeString.encode('UTF-8')
+
+    def read(self, size = -1):
+        while not self.buffer:
+            if self.index < len(self.members):
+                self.buffer = recordBody(self.zip.read(self.members[self.index]))
+                self.index += 1
+            elif self.tail:
+                self.buffer, self.tail = self.tail, b''
+            else:
+                return b''
+        if size is None or size < 0: size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def openSource(filename, chunk = None):
+    '''open a concatenated XML collection or a ZIP archive of record files for parsing,
+    optionally restricted to one chunk of it as returned by findSourceChunks
+    '''
+    if filename.suffix == '.zip':
+        return ZipReader(filename, *(chunk or (0, None)))
+    if chunk is None:
+        return filename.open('rb')
+    return ChunkReader(filename, *chunk)
+
+def findSourceChunks(filename, chunkSize):
+    '''split a concatenated XML collection or a ZIP archive into chunks of roughly chunkSize bytes'''
+    if filename.suffix == '.zip':
+        return findZipChunks(filename, chunkSize)
+    return findChunks(filename, chunkSize)
+
+def countPath(filename):
+    '''the count index file of a concatenated collection, e.g. 001.xml.count'''
+    return filename.with_name(filename.name + '.count')
+
+def writeCount(filename, records):
+    '''record the number of records in a collection in its count index, with the collection's
+    size so that an index left over from an earlier version of the collection is not used
+    '''
+    with countPath(filename).open('w', encoding='UTF-8') as outfile:
+        json.dump({'records': records, 'size': filename.stat().st_size}, outfile)
+
+def scanCount(filename, blockSize = 16 * 1024 * 1024):
+    '''count the TrademarkBag start tags in a collection by scanning its bytes'''
+    count = 0
+    carry = b''
+    with filename.open('rb') as infile:
+        for block in iter(lambda: infile.read(blockSize), b''):
+            data = carry + block
+            count += len(bagPattern.findall(data)) # a tag in the last len(bagTag) bytes is counted with the next block
+            carry = data[-len(bagTag):]
+    return count
+
+def countRecords(filename):
+    '''the number of records in a concatenated collection, from its count index if there is a
+    current one (otherwise by scanning the collection, and saving the result in the index),
+    or the number of record files in a ZIP archive
+    '''
+    if filename.suffix == '.zip':
+        with ZipFile(filename) as archive:
+            return len(zipMembers(archive))
+    try:
+        with countPath(filename).open('r', encoding='UTF-8') as infile:
+            index = json.load(infile)
+        if index['size'] == filename.stat().st_size: return index['records']
+    except (OSError, ValueError, KeyError):
+        pass
+    records = scanCount(filename)
+    try:
+        writeCount(filename, records)
+    except OSError:
+        pass # e.g. a read-only source folder
+    return records